@@ -0,0 +1,73 @@
+"""
+Measure the cold start time of the signmeup command-line interface.
+
+Runs `python -m signmeup.cli <args>` in fresh interpreters and reports the wall-clock
+time next to a bare interpreter start, plus the slowest imports from `python -X importtime`.
+
+Usage:
+    python benchmarks/cli_startup.py [--runs 20] [--target-ms 100] [cli args ...]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(arguments):
+    """
+    Runs a fresh interpreter with the repository on sys.path and returns (seconds, stderr).
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *arguments], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return time.perf_counter() - start, result.stderr
+
+
+def slowest_imports(importtime_output, count):
+    """
+    Returns the top-level imports with the largest cumulative time from `-X importtime` output.
+    """
+    imports = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        # Nested imports are indented below their parent.
+        if name.startswith('  '):
+            continue
+        imports.append((int(cumulative_us), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the cold start time of the signmeup CLI.')
+    parser.add_argument('--runs', type=int, default=20, help='Number of timed runs.')
+    parser.add_argument('--target-ms', type=float, default=100, help='Exit non-zero if the median exceeds this.')
+    parser.add_argument('cli_args', nargs='*', default=['--help'], help='Arguments passed to the CLI.')
+    args = parser.parse_args()
+
+    cli = ['-m', 'signmeup.cli', *args.cli_args]
+    # Warm the filesystem cache, so the runs measure interpreter and import work only.
+    run_python(cli)
+    timings = [run_python(cli)[0] for _ in range(args.runs)]
+    interpreter = [run_python(['-c', 'pass'])[0] for _ in range(args.runs)]
+
+    median_ms = statistics.median(timings) * 1000
+    print(f'signmeup {" ".join(args.cli_args)}: median {median_ms:.1f} ms, min {min(timings) * 1000:.1f} ms over {args.runs} runs')
+    print(f'bare interpreter: median {statistics.median(interpreter) * 1000:.1f} ms')
+
+    print('slowest top-level imports:')
+    for cumulative_us, name in slowest_imports(run_python(['-X', 'importtime', *cli])[1], 5):
+        print(f'  {cumulative_us / 1000:8.1f} ms  {name}')
+
+    if median_ms > args.target_ms:
+        print(f'median exceeds the {args.target_ms:.0f} ms target')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,10 @@ setup(
         'typing_extensions==4.6.3',
         'tzdata==2023.3',
     ],
+    extras_require={
+        # RedisCache, used by the production profile when REDIS_URL is set.
+        'production': ['redis==4.6.0'],
+    },
     entry_points={
         'console_scripts': [
             'signmeup=signmeup.cli:main',
@@ -0,0 +1,135 @@
+# accounts/activity.py
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from accounts import routers, sharding
+
+logger = logging.getLogger('accounts.activity')
+
+
+class ActivityBuffer:
+    """
+    Collects last-seen timestamps in memory and writes them to CustomUser.last_seen in bulk.
+
+    Recording activity is a dict assignment under a lock. The buffer holds the latest timestamp per user and is
+    flushed with bulk UPDATEs once ACCOUNTS_ACTIVITY_FLUSH_INTERVAL seconds have passed (default 60)
+    or ACCOUNTS_ACTIVITY_MAX_PENDING users are pending (default 1000). last_seen is therefore up to
+    one flush interval behind. With ACCOUNTS_ACTIVITY_FLUSH_ON_EXIT = True, the app also flushes
+    the buffer when the process exits; test settings should leave it off.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def record(self, user_id, when=None):
+        """
+        Records that a user was active.
+
+        Args:
+            user_id (int): The primary key of the user.
+            when (datetime, optional): The time of the activity. Defaults to now.
+        """
+        if self._add(user_id, when):
+            self._flush_in_request()
+
+    async def arecord(self, user_id, when=None):
+        """
+        The asynchronous version of record; a due flush runs in a thread.
+        """
+        if self._add(user_id, when):
+            await sync_to_async(self._flush_in_request)()
+
+    def _add(self, user_id, when):
+        """
+        Stores the timestamp and tells whether a flush is due.
+        """
+        interval = getattr(settings, 'ACCOUNTS_ACTIVITY_FLUSH_INTERVAL', 60)
+        max_pending = getattr(settings, 'ACCOUNTS_ACTIVITY_MAX_PENDING', 1000)
+        with self._lock:
+            self._pending[user_id] = when or timezone.now()
+            return len(self._pending) >= max_pending or time.monotonic() - self._last_flush >= interval
+
+    def _flush_in_request(self):
+        """
+        Flushes from the request that found a flush due, without failing that request.
+
+        When the database rejects the updates, the timestamps are put back in the buffer (unless
+        newer ones were recorded meanwhile) and written by a later flush.
+        """
+        pending = self._take()
+        try:
+            # The flush writes other users' rows, not something this request reads back.
+            with routers.no_pin():
+                self._write(pending)
+        except Exception:
+            with self._lock:
+                self._pending = {**pending, **self._pending}
+            logger.warning(
+                'Activity flush failed',
+                exc_info=True,
+                extra={'event': 'activity_flush_failed', 'pending': len(self._pending)},
+            )
+
+    def flush(self):
+        """
+        Writes the pending timestamps to the database.
+
+        Returns:
+            int: The number of users updated.
+        """
+        return self._write(self._take())
+
+    def _take(self):
+        """
+        Empties the buffer and returns what it held.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        return pending
+
+    def _write(self, pending):
+        from accounts.models import CustomUser as User
+
+        if not pending:
+            return 0
+
+        # One bulk UPDATE per shard (a single group without sharding).
+        by_database = {}
+        for user_id, last_seen in pending.items():
+            by_database.setdefault(sharding.db_for_user(user_id), []).append(User(pk=user_id, last_seen=last_seen))
+        return sum(
+            User.objects.db_manager(database).bulk_update(users, ['last_seen'], batch_size=500)
+            for database, users in by_database.items()
+        )
+
+    def clear(self):
+        """
+        Drops the pending timestamps without writing them.
+        """
+        with self._lock:
+            self._pending = {}
+            self._last_flush = time.monotonic()
+
+
+activity = ActivityBuffer()
+
+
+def flush_on_exit():
+    """
+    Flushes the buffer at process exit; registered by the app when ACCOUNTS_ACTIVITY_FLUSH_ON_EXIT is set.
+
+    It can also be called from a server's worker shutdown hook, e.g. gunicorn's worker_exit.
+    """
+    try:
+        activity.flush()
+    except Exception:
+        # The database may already be unavailable at interpreter shutdown.
+        pass
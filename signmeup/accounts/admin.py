@@ -1,5 +1,140 @@
 from django.contrib import admin
-from accounts.models import CustomUser, UserProfile
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
 
-# Register your models here.
-admin.site.register([CustomUser, UserProfile])
+from accounts.models import CustomUser, DeviceToken, UserProfile
+
+
+class LargeTablePaginator(Paginator):
+    """
+    A paginator for changelists over very large tables.
+
+    - On PostgreSQL, the row count of an unfiltered changelist is read from the planner
+      statistics (pg_class.reltuples) instead of running a full COUNT(*).
+    - When the changelist is ordered by primary key only, a page is fetched by seeking
+      from the first primary key of the page (found with an index-only scan) instead of
+      materialising and discarding every row before the page offset.
+    """
+
+    # Below this estimate an exact COUNT(*) is cheap enough and keeps the page count exact.
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        """
+        Returns the total number of objects, estimated for large unfiltered PostgreSQL tables.
+
+        Returns:
+            int: The (possibly estimated) number of objects.
+        """
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            connection = connections[queryset.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                        [queryset.model._meta.db_table],
+                    )
+                    row = cursor.fetchone()
+                if row and row[0] > self.exact_count_threshold:
+                    return int(row[0])
+        return super().count
+
+    def page(self, number):
+        """
+        Returns a page of objects, using a primary key seek when the ordering allows it.
+
+        Args:
+            number (int): The 1-based page number.
+
+        Returns:
+            Page: The requested page.
+        """
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        queryset = self.object_list
+        direction = self._pk_ordering(queryset)
+
+        if direction is None or bottom == 0:
+            return self._get_page(queryset[bottom:bottom + self.per_page], number, self)
+
+        # Index-only scan for the first key of the page, then seek from it.
+        first_pk = list(queryset.values_list('pk', flat=True)[bottom:bottom + 1])
+        if not first_pk:
+            return self._get_page(queryset.none(), number, self)
+        lookup = 'pk__lte' if direction == 'desc' else 'pk__gte'
+        return self._get_page(queryset.filter(**{lookup: first_pk[0]})[:self.per_page], number, self)
+
+    @staticmethod
+    def _pk_ordering(queryset):
+        """
+        Returns 'asc' or 'desc' when the queryset is ordered by its primary key only, else None.
+        """
+        if not isinstance(queryset, QuerySet):
+            return None
+        order_by = queryset.query.order_by or queryset.model._meta.ordering
+        if len(order_by) != 1 or not isinstance(order_by[0], str):
+            return None
+        field = order_by[0]
+        descending = field.startswith('-')
+        if field.lstrip('-') not in ('pk', queryset.model._meta.pk.name, queryset.model._meta.pk.attname):
+            return None
+        return 'desc' if descending else 'asc'
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base admin for tables with millions of rows.
+    """
+    paginator = LargeTablePaginator
+    # Skip the second, unfiltered COUNT(*) the changelist runs when a search is active.
+    show_full_result_count = False
+    # Newest first, served by the primary key index.
+    ordering = ('-pk',)
+    list_per_page = 100
+
+
+@admin.register(CustomUser)
+class CustomUserAdmin(LargeTableAdmin):
+    list_display = ('username', 'email', 'first_name', 'last_name', 'is_active', 'email_verified', 'start_date', 'last_seen')
+    list_filter = ('is_active', 'email_verified', 'is_staff')
+    # Case-insensitive exact matches, answered by the LOWER() unique indexes instead of a LIKE '%...%' scan.
+    search_fields = ('username__lower__exact', 'email__lower__exact')
+    readonly_fields = ('last_login', 'start_date', 'last_seen')
+
+    def get_search_results(self, request, queryset, search_term):
+        return super().get_search_results(request, queryset, search_term.lower())
+
+
+@admin.register(UserProfile)
+class UserProfileAdmin(LargeTableAdmin):
+    list_display = ('user', 'location', 'contact_number')
+    # UserProfile.__str__ reads user.username; join it instead of one query per row.
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('user__username__lower__exact', 'user__email__lower__exact')
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # The changelist shows hot columns only; the change form still loads the whole row.
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            queryset = queryset.defer('avatar', 'bio', 'about', 'links')
+        return queryset
+
+    def get_search_results(self, request, queryset, search_term):
+        return super().get_search_results(request, queryset, search_term.lower())
+
+
+@admin.register(DeviceToken)
+class DeviceTokenAdmin(LargeTableAdmin):
+    list_display = ('user', 'device', 'created', 'last_used', 'expires')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    # Exact key matches use the unique index; keys are never searched by substring.
+    search_fields = ('key__exact', 'user__username__lower__exact')
+
+    def get_search_results(self, request, queryset, search_term):
+        return super().get_search_results(request, queryset, search_term.lower())
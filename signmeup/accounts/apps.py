@@ -1,6 +1,21 @@
+import atexit
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from accounts import activity, logs
+
+        # Test runs must not write the buffered activity of test users once the test database is gone.
+        if getattr(settings, 'ACCOUNTS_ACTIVITY_FLUSH_ON_EXIT', False):
+            atexit.register(activity.flush_on_exit)
+
+        # ACCOUNTS_LOG_QUEUE_SIZE = 0 keeps the configured handlers writing in the emitting thread.
+        queue_size = getattr(settings, 'ACCOUNTS_LOG_QUEUE_SIZE', 10000)
+        if queue_size:
+            logs.start_queue_listener('accounts', queue_size)
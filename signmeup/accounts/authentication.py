@@ -0,0 +1,62 @@
+# accounts/authentication.py
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import authentication, exceptions
+
+from accounts import sharding, token_cache
+from accounts.models import DeviceToken
+
+
+class DeviceTokenAuthentication(authentication.TokenAuthentication):
+    """
+    Token authentication against DeviceToken, with the same 'Authorization: Token <key>' header as DRF.
+
+    When TokenExpirationMiddleware already resolved the request's token, it is reused instead of
+    being looked up again.
+    """
+
+    model = DeviceToken
+
+    def authenticate(self, request):
+        token = getattr(request._request, 'device_token', None)
+        if token is None:
+            return super().authenticate(request)
+        return self.check_token(token)
+
+    def authenticate_credentials(self, key):
+        """
+        Resolves a token key to its user and token, rejecting expired tokens and inactive users.
+
+        Keys rejected by accounts.token_cache fail without a database query.
+
+        Args:
+            key (str): The token key.
+
+        Returns:
+            tuple: (user, token)
+        """
+        if token_cache.is_known_invalid(key):
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        try:
+            token = DeviceToken.objects.db_manager(sharding.db_for_token_key(key)).select_related('user').get(key=key)
+        except DeviceToken.DoesNotExist:
+            token_cache.token_missing(key)
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        return self.check_token(token)
+
+    def check_token(self, token):
+        """
+        Rejects expired tokens and inactive users.
+
+        Args:
+            token (DeviceToken): The token, with its user loaded.
+
+        Returns:
+            tuple: (user, token)
+        """
+        if token.expires <= timezone.now():
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (token.user, token)
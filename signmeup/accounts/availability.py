@@ -0,0 +1,211 @@
+# accounts/availability.py
+"""
+Username and email availability checks for signup forms, answered mostly from memory.
+
+Each process keeps a Bloom filter of the lowercased usernames and emails in use. A value missing
+from the filter is available without a query; a value in the filter is confirmed with one query on
+the LOWER() unique indexes (or the user directory when sharded), since about
+ACCOUNTS_AVAILABILITY_ERROR_RATE of the free values (default 0.01) are in the filter too.
+
+The filter loads the users registered since its last load at most every
+ACCOUNTS_AVAILABILITY_REFRESH_INTERVAL seconds (default 5), and is rebuilt every
+ACCOUNTS_AVAILABILITY_REBUILD_INTERVAL seconds (default 3600) to drop deleted users and pick up
+changed usernames and emails. Answers can therefore be a few seconds old; registration still
+enforces uniqueness. ACCOUNTS_AVAILABILITY_FILTER = False confirms every check with a query.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+from accounts import sharding
+from accounts.bloom import BloomFilter
+
+logger = logging.getLogger('accounts.availability')
+
+FIELDS = ('username', 'email')
+
+
+def is_taken(field, value):
+    """
+    Tells whether a username or email is in use, case-insensitively, with one indexed query.
+
+    Args:
+        field (str): 'username' or 'email'.
+        value (str): The lowercased value.
+
+    Returns:
+        bool: True if a user has it.
+    """
+    from accounts.models import CustomUser as User, UserDirectory
+
+    if sharding.is_sharded():
+        return UserDirectory.objects.using(sharding.DIRECTORY_DATABASE).filter(**{field: value}).exists()
+    return User.objects.filter(**{f'{field}__lower': value}).exists()
+
+
+class TakenNamesFilter:
+    """
+    A Bloom filter of the usernames and emails in use, refreshed incrementally by primary key.
+    """
+
+    # Users created up to this many primary keys below the last one loaded are loaded again on a
+    # refresh, as transactions may commit out of primary key order.
+    refresh_overlap = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, **kwargs):
+        """
+        Drops the filter and its counters; the next check rebuilds it.
+        """
+        self._filter = None
+        self._max_pk = 0
+        self._built_at = 0
+        self._refreshed_at = 0
+        self.filtered = 0
+        self.confirmed = 0
+        self.false_positives = 0
+        self.rebuilds = 0
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'ACCOUNTS_AVAILABILITY_FILTER', True)
+
+    def is_available(self, field, value):
+        """
+        Tells whether a username or email is free, case-insensitively.
+
+        Args:
+            field (str): 'username' or 'email'.
+            value (str): The value to check.
+
+        Returns:
+            bool: True if no user has it (as of the last refresh when the filter rules it out).
+        """
+        value = value.lower()
+        if self.enabled:
+            self.update()
+            if f'{field}:{value}' not in self._filter:
+                self.filtered += 1
+                return True
+        self.confirmed += 1
+        if is_taken(field, value):
+            return False
+        if self.enabled:
+            self.false_positives += 1
+        return True
+
+    def add(self, username, email):
+        """
+        Adds a new user's username and email to this process's filter.
+        """
+        if self._filter is not None:
+            self._add(self._filter, username, email)
+
+    def update(self):
+        """
+        Rebuilds the filter when it is missing or old, or loads the newest users when a refresh is due.
+        """
+        now = time.monotonic()
+        rebuild_interval = getattr(settings, 'ACCOUNTS_AVAILABILITY_REBUILD_INTERVAL', 3600)
+        refresh_interval = getattr(settings, 'ACCOUNTS_AVAILABILITY_REFRESH_INTERVAL', 5)
+        if self._filter is None or now - self._built_at >= rebuild_interval:
+            self.rebuild(self._built_at)
+        elif now - self._refreshed_at >= refresh_interval:
+            self.refresh()
+
+    def rebuild(self, built_at=None):
+        """
+        Builds a new filter from all the users, with room for twice as many entries (two per user).
+
+        Args:
+            built_at (float, optional): When the filter found stale was built. The filter is only
+                rebuilt if no other thread has rebuilt it since, so the requests arriving together
+                on a stale filter rebuild it once. By default, it is always rebuilt.
+        """
+        with self._lock:
+            if built_at is not None and self._built_at != built_at:
+                return
+            started = time.perf_counter()
+            users = self.users()
+            error_rate = getattr(settings, 'ACCOUNTS_AVAILABILITY_ERROR_RATE', 0.01)
+            bloom = BloomFilter(max(4 * users.count(), 10000), error_rate)
+            self._max_pk = self._load(bloom, 0)
+            self._filter = bloom
+            self._built_at = self._refreshed_at = time.monotonic()
+            self.rebuilds += 1
+        logger.info(
+            'Availability filter rebuilt',
+            extra={
+                'event': 'availability_filter_rebuilt',
+                'entries': len(bloom),
+                'bytes': bloom.nbytes,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+                **self.stats(),
+            },
+        )
+
+    def refresh(self):
+        """
+        Adds the users created since the filter was last loaded, or rebuilds it once it is over capacity.
+        """
+        with self._lock:
+            self._refreshed_at = time.monotonic()
+            since = max(self._max_pk - self.refresh_overlap, 0)
+            self._max_pk = max(self._load(self._filter, since), self._max_pk)
+            over_capacity = len(self._filter) > self._filter.capacity
+            built_at = self._built_at
+        if over_capacity:
+            self.rebuild(built_at)
+
+    def users(self):
+        """
+        Returns the rows holding the usernames and emails: the user directory when sharded.
+        """
+        from accounts.models import CustomUser as User, UserDirectory
+
+        if sharding.is_sharded():
+            return UserDirectory.objects.using(sharding.DIRECTORY_DATABASE)
+        return User.objects.all()
+
+    def _load(self, bloom, since):
+        """
+        Adds the usernames and emails of the users with a primary key above `since` to a filter.
+
+        Returns:
+            int: The highest primary key loaded, or `since` if there was none.
+        """
+        max_pk = since
+        rows = self.users().filter(pk__gt=since).values_list('pk', 'username', 'email')
+        for pk, username, email in rows.iterator(chunk_size=2000):
+            self._add(bloom, username, email)
+            max_pk = max(max_pk, pk)
+        return max_pk
+
+    def _add(self, bloom, username, email):
+        bloom.add(f'username:{username.lower()}')
+        bloom.add(f'email:{email.lower()}')
+
+    def stats(self):
+        """
+        Returns the filter's counters, for logs and monitoring.
+
+        Returns:
+            dict: filtered counts the checks answered from memory, confirmed those answered with a
+            query, false_positives the confirmed values that turned out to be free.
+        """
+        return {
+            'filtered': self.filtered,
+            'confirmed': self.confirmed,
+            'false_positives': self.false_positives,
+            'rebuilds': self.rebuilds,
+        }
+
+
+taken_names = TakenNamesFilter()
+setting_changed.connect(taken_names.reset)
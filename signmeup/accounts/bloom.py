@@ -0,0 +1,50 @@
+# accounts/bloom.py
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    A Bloom filter: a compact set of strings answering "definitely absent" or "possibly present".
+
+    It is sized for `capacity` items at a false-positive rate of `error_rate`; adding more items
+    raises the false-positive rate. Items cannot be removed.
+
+    Args:
+        capacity (int): The number of items the filter is sized for.
+        error_rate (float, optional): The false-positive rate at capacity.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.size = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(round(self.size / self.capacity * math.log(2)), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one 128-bit digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self):
+        """
+        Returns the number of items added (duplicates included).
+        """
+        return self.count
+
+    @property
+    def nbytes(self):
+        return len(self._bits)
@@ -0,0 +1,96 @@
+# accounts/data_migrations.py
+"""
+RunPython helpers for projects upgrading from earlier versions of the accounts app.
+
+Legacy tokens: versions before DeviceToken authenticated with rest_framework.authtoken's Token.
+Add a migration depending on the generated DeviceToken migration and on
+('authtoken', '0003_tokenproxy') with `migrations.RunPython(copy_legacy_tokens, migrations.RunPython.noop)`,
+so existing keys keep working and users stay logged in after the upgrade.
+
+Cold fields: versions where CustomUser had an `about` column and UserProfile had one URL column
+per social link.
+
+`python manage.py makemigrations accounts` then generates a migration that adds
+UserProfile.about and UserProfile.links and removes the old columns. Before applying it, move the
+RemoveField operations after a RunPython operation using these helpers, so the data is copied
+before the old columns are dropped:
+
+    from accounts.data_migrations import move_cold_fields
+
+    operations = [
+        # AddField operations generated by makemigrations
+        migrations.RunPython(move_cold_fields, migrations.RunPython.noop),
+        # RemoveField operations generated by makemigrations
+    ]
+"""
+
+# The social link columns of the old schema, now keys of UserProfile.links.
+LINK_NAMES = ('website', 'facebook', 'twitter', 'instagram', 'tiktok', 'linkedin', 'youtube')
+
+
+def move_cold_fields(apps, schema_editor, batch_size=2000):
+    """
+    Copies CustomUser.about and the social link columns into UserProfile.about and UserProfile.links.
+
+    Users with an `about` text but no profile get one.
+
+    Args:
+        apps: The historical app registry passed to RunPython.
+        schema_editor: The schema editor passed to RunPython.
+        batch_size (int, optional): Rows per bulk UPDATE/INSERT.
+    """
+    User = apps.get_model('accounts', 'CustomUser')
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+    database = schema_editor.connection.alias
+
+    batch = []
+    profiles = UserProfile.objects.using(database).select_related('user').order_by('pk')
+    for profile in profiles.iterator(chunk_size=batch_size):
+        profile.links = {name: getattr(profile, name) for name in LINK_NAMES if getattr(profile, name)}
+        profile.about = profile.user.about
+        batch.append(profile)
+        if len(batch) == batch_size:
+            UserProfile.objects.using(database).bulk_update(batch, ['links', 'about'])
+            batch = []
+    if batch:
+        UserProfile.objects.using(database).bulk_update(batch, ['links', 'about'])
+
+    without_profile = User.objects.using(database).filter(profile__isnull=True).exclude(about='')
+    UserProfile.objects.using(database).bulk_create(
+        (UserProfile(user_id=user_id, about=about, links={}) for user_id, about in without_profile.values_list('pk', 'about').iterator()),
+        batch_size=batch_size,
+    )
+
+
+def copy_legacy_tokens(apps, schema_editor, batch_size=2000):
+    """
+    Copies the keys of rest_framework.authtoken's Token into DeviceToken.
+
+    The copies are labelled 'legacy token' and expire after ACCOUNTS_TOKEN_LIFETIME without use, like
+    any device token. Keys already copied are skipped, so the migration can be re-run. Legacy
+    installs are not sharded: the copies go to the migrated database.
+
+    Args:
+        apps: The historical app registry passed to RunPython.
+        schema_editor: The schema editor passed to RunPython.
+        batch_size (int, optional): Rows per bulk INSERT.
+    """
+    from django.utils import timezone
+
+    from accounts.models import token_lifetime
+
+    Token = apps.get_model('authtoken', 'Token')
+    DeviceToken = apps.get_model('accounts', 'DeviceToken')
+    database = schema_editor.connection.alias
+
+    now = timezone.now()
+    expires = now + token_lifetime()
+    legacy_tokens = Token.objects.using(database).values_list('key', 'user_id', 'created')
+    DeviceToken.objects.using(database).bulk_create(
+        (
+            DeviceToken(key=key, user_id=user_id, device='legacy token', created=created, last_used=now, expires=expires)
+            for key, user_id, created in legacy_tokens.iterator(chunk_size=batch_size)
+        ),
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
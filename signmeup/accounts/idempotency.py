@@ -0,0 +1,118 @@
+# accounts/idempotency.py
+"""
+Idempotency-Key support for the write endpoints.
+
+A client that retries a request with the same `Idempotency-Key` header gets the stored response of
+the first attempt, without the view running again: no second user, password hash or verification
+email. Responses are stored in a cache (ACCOUNTS_IDEMPOTENCY_CACHE, default 'default') for
+ACCOUNTS_IDEMPOTENCY_TTL seconds (default 86400), and evicted earlier by the cache's own policy
+(MAX_ENTRIES culling for the memory cache, maxmemory eviction for Redis). Entries hold only a keyed
+body fingerprint, the status code and the response data. Share the cache between worker processes (e.g.
+REDIS_URL) for retries to be recognised whichever process serves them.
+"""
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import salted_hmac
+from rest_framework import status
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+KEY_MAX_LENGTH = 255
+
+
+def idempotency_cache():
+    return caches[getattr(settings, 'ACCOUNTS_IDEMPOTENCY_CACHE', 'default')]
+
+
+def request_fingerprint(request):
+    """
+    Returns a short hash of the request data, to tell a retry from a different request reusing a key.
+
+    The data includes passwords on registration, so the hash is an HMAC keyed with SECRET_KEY: the
+    stored fingerprints cannot be brute-forced offline by someone reading the cache.
+
+    Args:
+        request (Request): The DRF request.
+
+    Returns:
+        str: The fingerprint.
+    """
+    data = request.data
+    if hasattr(data, 'lists'):
+        # Form and multipart data arrive as a QueryDict; uploaded files are represented by their names.
+        data = sorted(data.lists())
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return salted_hmac('accounts.idempotency', payload, algorithm='sha256').hexdigest()[:32]
+
+
+def store_key(request, key):
+    """
+    Returns the cache key for an idempotency key, scoped to the user, method and path.
+    """
+    owner = request.user.pk if request.user.is_authenticated else ''
+    digest = hashlib.sha256(f'{owner}:{request.method}:{request.path}:{key}'.encode()).hexdigest()
+    return f'accounts:idempotency:{digest}'
+
+
+def idempotent(view_method):
+    """
+    Makes an APIView method replay its response for requests repeating an Idempotency-Key header.
+
+    Requests without the header run as usual. While the first request with a key is running,
+    concurrent ones get 409 Conflict; a key reused with a different body gets 422. Server errors
+    are not stored, so the client's retry runs the view again.
+
+    Args:
+        view_method (function): The view method, e.g. `post`.
+
+    Returns:
+        function: The wrapped view method.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view_method(self, request, *args, **kwargs)
+        if not key or len(key) > KEY_MAX_LENGTH:
+            return Response({'message': f'Invalid {HEADER} header.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        cache = idempotency_cache()
+        cache_key = store_key(request, key)
+        fingerprint = request_fingerprint(request)
+
+        stored = cache.get(cache_key)
+        if stored is None:
+            lock_key = f'{cache_key}:lock'
+            if not cache.add(lock_key, 1, getattr(settings, 'ACCOUNTS_IDEMPOTENCY_LOCK_TIMEOUT', 60)):
+                return Response(
+                    {'message': f'A request with this {HEADER} is still being processed.'},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            try:
+                # The first request may have finished between the lookup and taking the lock.
+                stored = cache.get(cache_key)
+                if stored is None:
+                    response = view_method(self, request, *args, **kwargs)
+                    if response.status_code < 500:
+                        ttl = getattr(settings, 'ACCOUNTS_IDEMPOTENCY_TTL', 86400)
+                        cache.set(cache_key, (fingerprint, response.status_code, response.data), ttl)
+                    return response
+            finally:
+                cache.delete(lock_key)
+
+        stored_fingerprint, status_code, data = stored
+        if stored_fingerprint != fingerprint:
+            return Response(
+                {'message': f'This {HEADER} was already used with a different request.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        response = Response(data, status=status_code)
+        response[REPLAYED_HEADER] = 'true'
+        return response
+
+    return wrapper
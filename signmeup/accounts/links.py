@@ -0,0 +1,123 @@
+# accounts/links.py
+from django.apps import apps
+from django.conf import settings
+from django.core import signing
+from django.core.signals import setting_changed
+from django.urls import reverse
+from django.utils.http import base36_to_int, int_to_base36
+
+
+class VerificationLinkBuilder:
+    """
+    Builds the absolute URLs sent in verification emails.
+
+    The Site domain and the path of the verify-email view are resolved on first use and reused for
+    every registration, instead of resolving the site and reversing the URL per email.
+
+    Settings:
+        ACCOUNTS_VERIFICATION_BASE_URL: Scheme and host of the links, e.g. 'https://example.com'.
+            When unset, the domain of the current Site is used if the sites framework is installed,
+            otherwise the host of the request.
+        ACCOUNTS_VERIFICATION_HTTPS: Use https when the scheme is not given by the base URL.
+            Defaults to whether the request is secure.
+        ACCOUNTS_VERIFICATION_SIGNED_LINKS: Issue short signed tokens instead of uid/token pairs.
+            They are checked without a database query before the user is loaded.
+    """
+
+    salt = 'accounts.verify-email'
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, **kwargs):
+        """
+        Forgets the resolved site domain and path, e.g. after a setting changed.
+        """
+        self._site_domain = None
+        self._path = None
+
+    @property
+    def path(self):
+        if self._path is None:
+            self._path = reverse('verify-email')
+        return self._path
+
+    def base_url(self, request):
+        """
+        Returns the scheme and host of the links, e.g. 'https://example.com'.
+
+        Only the Site domain is cached; the scheme follows each request unless configured, so a
+        first request over plain HTTP (e.g. a health check) does not decide it for the process.
+
+        Args:
+            request (HttpRequest): The current request, used when no fixed base URL is configured.
+
+        Returns:
+            str: The base URL without a trailing slash.
+        """
+        base_url = getattr(settings, 'ACCOUNTS_VERIFICATION_BASE_URL', None)
+        if base_url:
+            return base_url.rstrip('/')
+
+        https = getattr(settings, 'ACCOUNTS_VERIFICATION_HTTPS', None)
+        scheme = 'https' if https or (https is None and request.is_secure()) else 'http'
+
+        if apps.is_installed('django.contrib.sites'):
+            # Resolved once: the current site only changes with SITE_ID.
+            if self._site_domain is None:
+                self._site_domain = self.current_site_domain()
+            return f'{scheme}://{self._site_domain}'
+
+        # Without a configured domain, the link points to the host the client used.
+        return f'{scheme}://{request.get_host()}'
+
+    def current_site_domain(self):
+        from django.contrib.sites.models import Site
+
+        return Site.objects.get_current().domain
+
+    def build(self, request, verification_token):
+        """
+        Builds the absolute verification URL for a token.
+
+        Args:
+            request (HttpRequest): The current request.
+            verification_token (str): The verification token.
+
+        Returns:
+            str: The absolute verification URL.
+        """
+        return f'{self.base_url(request)}{self.path}?token={verification_token}'
+
+    def make_signed_token(self, user):
+        """
+        Returns a short signed token carrying the user's primary key and the signing time.
+        """
+        return signing.TimestampSigner(salt=self.salt).sign(int_to_base36(user.pk))
+
+    def check_signed_token(self, token):
+        """
+        Checks a signed token's signature and age without touching the database.
+
+        Args:
+            token (str): The token from the verification link.
+
+        Returns:
+            int: The primary key of the user, or None if the token is invalid or expired.
+        """
+        try:
+            value = signing.TimestampSigner(salt=self.salt).unsign(token, max_age=settings.PASSWORD_RESET_TIMEOUT)
+            return base36_to_int(value)
+        except (signing.BadSignature, ValueError):
+            return None
+
+
+def is_signed_token(token):
+    """
+    Tells signed tokens ('<pk>:<timestamp>:<signature>') from uid/token pairs ('<uid>_<token>').
+    """
+    return ':' in token
+
+
+verification_links = VerificationLinkBuilder()
+setting_changed.connect(verification_links.reset)
@@ -0,0 +1,178 @@
+# accounts/logs.py
+"""
+Structured logging for the accounts app.
+
+Records are written as one JSON object per line by JSONFormatter, tagged with the id of the request
+that emitted them (set by accounts.middleware.RequestIdMiddleware). High-frequency events, such as
+invalid tokens during a flood, are sampled by SamplingFilter on the emitting logger, and the
+handlers of the 'accounts' logger are moved behind a bounded queue served by a background thread,
+so emitting a record never waits for I/O. See LOGGING in core/settings.py.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+# The id of the request being handled by the current thread or task.
+request_id = ContextVar('accounts_request_id', default=None)
+
+# Attributes every LogRecord has; any other attribute was passed with `extra`.
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats records as single-line JSON objects.
+
+    Each object holds the time, level, logger, message and request id, plus the attributes passed
+    with `extra` and the formatted exception, if any.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None) or request_id.get(),
+        }
+        entry.update((name, value) for name, value in vars(record).items() if name not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Samples high-frequency events instead of logging every occurrence.
+
+    Records are grouped by their `event` attribute (`extra={'event': ...}`); records without one
+    pass untouched. Of each event, the first `burst` records per `interval` seconds pass, then one
+    in `rate`. The next record let through carries the number of records dropped before it as
+    `suppressed`. Attach it to the emitting logger, so dropped records are never formatted or queued.
+
+    Args:
+        burst (int, optional): Records passed per event and interval before sampling starts.
+        interval (float, optional): Length of the counting window, in seconds.
+        rate (int, optional): One in `rate` records passes once the burst is used up.
+    """
+
+    def __init__(self, burst=10, interval=1.0, rate=100, name=''):
+        super().__init__(name)
+        self.burst = burst
+        self.interval = interval
+        self.rate = rate
+        # event -> [window start, records in the window, records suppressed since the last one passed]
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        if event is None:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(event)
+            if window is None or now - window[0] >= self.interval:
+                window = self._windows[event] = [now, 0, window[2] if window else 0]
+            window[1] += 1
+            if window[1] > self.burst and (window[1] - self.burst) % self.rate:
+                window[2] += 1
+                return False
+            if window[2]:
+                record.suppressed, window[2] = window[2], 0
+        return True
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a bounded queue, dropping them (and counting the drops) when it is full.
+
+    The message, exception text and request id are resolved before the record leaves the emitting
+    thread.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = request_id.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# (logger, QueueHandler, QueueListener) for each logger moved behind a queue.
+_queues = []
+
+
+def start_queue_listener(logger_name='accounts', maxsize=10000):
+    """
+    Moves the handlers of a logger behind a QueueHandler, served by a QueueListener thread.
+
+    Args:
+        logger_name (str, optional): The logger whose handlers are moved.
+        maxsize (int, optional): Records held before new ones are dropped.
+
+    Returns:
+        QueueListener: The started listener, or None if the logger has no handlers or already uses a queue.
+    """
+    logger = logging.getLogger(logger_name)
+    if not logger.handlers or any(isinstance(handler, QueueHandler) for handler in logger.handlers):
+        return None
+
+    records = queue.Queue(maxsize)
+    listener = logging.handlers.QueueListener(records, *logger.handlers, respect_handler_level=True)
+    handler = QueueHandler(records)
+    for moved in list(logger.handlers):
+        logger.removeHandler(moved)
+    logger.addHandler(handler)
+    listener.start()
+    _queues.append((logger, handler, listener))
+    return listener
+
+
+def stop_queue_listeners():
+    """
+    Writes out the queued records and stops the listener threads.
+    """
+    for logger, handler, listener in _queues:
+        if listener._thread is not None:
+            listener.stop()
+
+
+def _restart_after_fork():
+    # Threads do not survive fork(): a worker forked after setup gets fresh queues and listeners.
+    for logger, handler, listener in _queues:
+        handler.queue = listener.queue = queue.Queue(handler.queue.maxsize)
+        listener._thread = None
+        listener.start()
+
+
+atexit.register(stop_queue_listeners)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,114 @@
+import asyncio
+import statistics
+import time
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.urls import reverse
+
+from accounts.models import CustomUser as User, DeviceToken
+
+SYNC_MIDDLEWARE = 'accounts.middleware.TokenExpirationMiddleware'
+ASYNC_MIDDLEWARE = 'accounts.middleware.AsyncTokenExpirationMiddleware'
+
+
+async def request(application, scope):
+    """
+    Sends one bodiless request to an ASGI application and returns the response status.
+    """
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]['status']
+
+
+async def run_load(application, scope, requests, concurrency):
+    """
+    Sends `requests` requests over `concurrency` concurrent connections and returns the statuses.
+    """
+    statuses = []
+
+    async def connection(count):
+        for _ in range(count):
+            statuses.append(await request(application, scope))
+
+    share, extra = divmod(requests, concurrency)
+    await asyncio.gather(*(connection(share + (index < extra)) for index in range(concurrency)))
+    return statuses
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the throughput of authenticated profile requests through the ASGI handler with '
+        'TokenExpirationMiddleware and with AsyncTokenExpirationMiddleware in the middleware chain.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Number of requests per measurement.')
+        parser.add_argument('--concurrency', type=int, default=50, help='Number of concurrent connections.')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of measurements per stack.')
+
+    def handle(self, *args, **options):
+        username = f'asgibench{time.time_ns()}'
+        user = User.objects.create_user(
+            username=username, email=f'{username}@example.com', password='benchmark-password',
+            first_name='ASGI', last_name='Bench', is_active=True,
+        )
+        try:
+            token = DeviceToken.objects.issue(user, 'bench_asgi')
+            self.benchmark(token.key, options)
+        finally:
+            user.delete()
+
+    def benchmark(self, token_key, options):
+        if SYNC_MIDDLEWARE not in settings.MIDDLEWARE and ASYNC_MIDDLEWARE not in settings.MIDDLEWARE:
+            raise CommandError('Neither token middleware is in MIDDLEWARE.')
+        swap = {SYNC_MIDDLEWARE: ASYNC_MIDDLEWARE, ASYNC_MIDDLEWARE: SYNC_MIDDLEWARE}
+        swapped = [swap.get(path, path) for path in settings.MIDDLEWARE]
+        stacks = [
+            ('TokenExpirationMiddleware (sync)', swapped if ASYNC_MIDDLEWARE in settings.MIDDLEWARE else settings.MIDDLEWARE),
+            ('AsyncTokenExpirationMiddleware', swapped if SYNC_MIDDLEWARE in settings.MIDDLEWARE else settings.MIDDLEWARE),
+        ]
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': reverse('user-profile'),
+            'query_string': b'',
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Token {token_key}'.encode())],
+            'client': ('127.0.0.1', 50000),
+            'server': ('testserver', 80),
+        }
+
+        self.stdout.write(f'{options["requests"]} requests over {options["concurrency"]} connections')
+        results = []
+        for label, middleware in stacks:
+            with override_settings(MIDDLEWARE=middleware, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                application = ASGIHandler()
+                status = asyncio.run(request(application, scope))
+                if status != 200:
+                    raise CommandError(f'{label}: expected a 200 from {scope["path"]}, got {status}.')
+
+                throughputs = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    statuses = asyncio.run(run_load(application, scope, options['requests'], options['concurrency']))
+                    throughputs.append(len(statuses) / (time.perf_counter() - start))
+                    if set(statuses) != {200}:
+                        raise CommandError(f'{label}: unexpected statuses {sorted(set(statuses))}.')
+            results.append((label, statistics.median(throughputs)))
+
+        baseline = results[0][1]
+        for label, throughput in results:
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(f'  {throughput:.0f} requests/s, {throughput / baseline:.2f}x')
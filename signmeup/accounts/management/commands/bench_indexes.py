@@ -0,0 +1,58 @@
+import statistics
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from accounts.models import CustomUser as User
+
+
+class Command(BaseCommand):
+    help = 'Compare query plans and latency of the accounts lookups with and without the functional/partial indexes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=0, help='Number of synthetic users to insert before benchmarking.')
+        parser.add_argument('--jobs', type=int, default=1, help='Worker processes used to generate users.')
+        parser.add_argument('--repeat', type=int, default=200, help='Number of timed executions per query.')
+
+    def handle(self, *args, **options):
+        if options['users']:
+            start = User.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+            call_command(
+                'generate_users', options['users'], start=start, prefix='BenchUser',
+                jobs=options['jobs'], no_color=options['no_color'], stdout=self.stdout,
+            )
+
+        sample = User.objects.order_by('-pk').values('username', 'email').first()
+        if sample is None:
+            self.stderr.write('No users to benchmark against. Pass --users N to generate some.')
+            return
+
+        username = sample['username'].upper()
+        email = sample['email'].upper()
+        cutoff = timezone.now() - timezone.timedelta(days=7)
+
+        queries = [
+            ('username, iexact (UPPER, unindexed)', User.objects.filter(username__iexact=username)),
+            ('username, lower (functional index)', User.objects.filter(username__lower=username.lower())),
+            ('email, iexact (UPPER, unindexed)', User.objects.filter(email__iexact=email)),
+            ('email, lower (functional index)', User.objects.filter(email__lower=email.lower())),
+            ('unverified older than 7 days (partial index)', User.objects.filter(email_verified=False, start_date__lt=cutoff)[:1000]),
+        ]
+
+        self.stdout.write(f'{User.objects.count()} users on {connection.vendor}\n')
+        for label, queryset in queries:
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                list(queryset.values_list('pk', flat=True))
+                timings.append(time.perf_counter() - start)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(queryset.values_list('pk', flat=True).explain())
+            self.stdout.write(
+                f'median {statistics.median(timings) * 1000:.3f} ms, '
+                f'p95 {statistics.quantiles(timings, n=20)[-1] * 1000:.3f} ms\n'
+            )
@@ -0,0 +1,84 @@
+import binascii
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from accounts.middleware import TokenExpirationMiddleware
+from accounts.models import DeviceToken
+from accounts.token_cache import invalid_tokens, valid_tokens
+
+
+def random_key():
+    return binascii.hexlify(os.urandom(20)).decode()
+
+
+class Command(BaseCommand):
+    help = 'Measure the cost of requests with forged tokens in TokenExpirationMiddleware, with and without the token caches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000, help='Number of forged-token requests per scenario.')
+        parser.add_argument('--distinct', type=int, default=100, help='Number of distinct keys in the repeated-keys scenarios.')
+
+    def handle(self, *args, **options):
+        requests = options['requests']
+        repeated = [random_key() for _ in range(options['distinct'])]
+        repeated = [repeated[index % len(repeated)] for index in range(requests)]
+
+        no_cache = {'ACCOUNTS_INVALID_TOKEN_CACHE_SIZE': 0, 'ACCOUNTS_TOKEN_BLOOM_FILTER': False}
+        negative_cache = {'ACCOUNTS_TOKEN_BLOOM_FILTER': False}
+        bloom_filter = {'ACCOUNTS_TOKEN_BLOOM_FILTER': True}
+        scenarios = [
+            ('No caches, random keys', no_cache, None),
+            (f'Invalid-token cache, {options["distinct"]} repeated keys', negative_cache, repeated),
+            ('Invalid-token cache, random keys', negative_cache, None),
+            ('Bloom filter, random keys', bloom_filter, None),
+        ]
+
+        self.stdout.write(f'{DeviceToken.objects.count()} tokens, {requests} requests per scenario')
+        for label, overrides, keys in scenarios:
+            with override_settings(**overrides):
+                keys = keys or [random_key() for _ in range(requests)]
+                self.report(label, *self.measure(keys))
+
+    def measure(self, keys):
+        """
+        Sends one request per key through the middleware and returns the time per request and the queries.
+        """
+        factory = RequestFactory()
+        middleware = TokenExpirationMiddleware(lambda request: HttpResponse())
+        requests = [factory.get('/accounts/profile/', HTTP_AUTHORIZATION=f'Token {key}') for key in keys]
+
+        # The filter is built before timing, as a running server builds it once an hour.
+        built = time.perf_counter()
+        if valid_tokens.enabled:
+            valid_tokens.rebuild()
+        built = time.perf_counter() - built
+
+        queries = []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            start = time.perf_counter()
+            for request in requests:
+                assert middleware(request).status_code == 401
+            elapsed = time.perf_counter() - start
+        return elapsed / len(keys), len(queries), built
+
+    def report(self, label, per_request, queries, built):
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        self.stdout.write(f'  {per_request * 1e6:.0f} µs/request, {queries} queries')
+        if valid_tokens.enabled:
+            stats = valid_tokens.stats()
+            self.stdout.write(
+                f'  filter: {valid_tokens._filter.nbytes / 1024:.0f} KiB built in {built * 1000:.0f} ms, '
+                f'{stats["rejected"]} rejected, {stats["false_positives"]} false positives'
+            )
+        else:
+            self.stdout.write(f'  invalid-token cache: {invalid_tokens.hits} hits, {len(invalid_tokens)} keys')
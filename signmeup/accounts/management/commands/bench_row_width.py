@@ -0,0 +1,74 @@
+import statistics
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.models import CustomUser as User, DeviceToken, UserProfile
+
+# Columns that are read on every authenticated request vs. only when a profile is displayed or edited.
+COLD_PROFILE_FIELDS = ('avatar', 'bio', 'about', 'links')
+
+
+def average_row_bytes(model, fields, sample):
+    """
+    Returns the average size of the given columns over up to `sample` rows, as text.
+    """
+    rows = list(model.objects.order_by('pk').values_list(*fields)[:sample])
+    if not rows:
+        return 0
+    return sum(len(str(value)) for row in rows for value in row if value is not None) / len(rows)
+
+
+class Command(BaseCommand):
+    help = 'Measure the width of the user and profile rows and the cost of loading cold profile columns.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=0, help='Number of synthetic users to insert before benchmarking.')
+        parser.add_argument('--jobs', type=int, default=1, help='Worker processes used to generate users.')
+        parser.add_argument('--repeat', type=int, default=500, help='Number of timed executions per query.')
+        parser.add_argument('--sample', type=int, default=1000, help='Rows sampled to estimate the average row width.')
+
+    def handle(self, *args, **options):
+        if options['users']:
+            start = User.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+            call_command(
+                'generate_users', options['users'], start=start, prefix='BenchUser',
+                jobs=options['jobs'], no_color=options['no_color'], stdout=self.stdout,
+            )
+
+        token = DeviceToken.objects.filter(user__profile__isnull=False).exclude(user__profile__about='').first()
+        if token is None:
+            self.stderr.write('No users with a filled-in profile and a token. Pass --users N to generate some.')
+            return
+
+        self.stdout.write(f'{User.objects.count()} users on {connection.vendor}\n')
+        self.stdout.write(self.style.MIGRATE_HEADING('Average row width (bytes of column values)'))
+        user_fields = [field.attname for field in User._meta.concrete_fields]
+        profile_fields = [field.attname for field in UserProfile._meta.concrete_fields]
+        hot_fields = [name for name in profile_fields if name not in COLD_PROFILE_FIELDS]
+        self.stdout.write(f'user:                 {average_row_bytes(User, user_fields, options["sample"]):.0f}')
+        self.stdout.write(f'profile, hot columns: {average_row_bytes(UserProfile, hot_fields, options["sample"]):.0f}')
+        self.stdout.write(f'profile, all columns: {average_row_bytes(UserProfile, profile_fields, options["sample"]):.0f}\n')
+
+        # The wide variant joins the cold profile columns onto the token lookup, as if they were
+        # still stored in the user row.
+        queries = [
+            ('token authentication (user row only)', lambda: DeviceToken.objects.select_related('user').get(key=token.key)),
+            ('token authentication + cold profile columns', lambda: DeviceToken.objects.select_related('user__profile').get(key=token.key)),
+            ('profile, all columns', lambda: UserProfile.objects.get(user_id=token.user_id)),
+            ('profile, cold columns deferred', lambda: UserProfile.objects.defer(*COLD_PROFILE_FIELDS).get(user_id=token.user_id)),
+        ]
+        for label, query in queries:
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                query()
+                timings.append(time.perf_counter() - start)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(
+                f'median {statistics.median(timings) * 1000:.3f} ms, '
+                f'p95 {statistics.quantiles(timings, n=20)[-1] * 1000:.3f} ms\n'
+            )
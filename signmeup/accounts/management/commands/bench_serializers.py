@@ -0,0 +1,43 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import CustomUser as User
+from accounts.models import UserProfile
+from accounts.renderers import FastJSONRenderer
+from accounts.serializers import CompiledSerializer, UserSerializer, UserProfileSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare the DRF serializers and renderer with the compiled fast path on the login and profile payloads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=20000, help='Number of serializations per measurement.')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        # Unsaved instances: the benchmark measures serialization only, not the database.
+        user = User(id=42, username='benchuser', first_name='Bench', last_name='User', email='bench@example.com')
+        profile = UserProfile(user=user, bio='Benchmarking', location='Nairobi', website='https://example.com')
+
+        for label, serializer_class, instance in (
+            ('login user payload', UserSerializer, user),
+            ('profile payload', UserProfileSerializer, profile),
+        ):
+            compiled = CompiledSerializer(serializer_class)
+            drf_renderer, fast_renderer = JSONRenderer(), FastJSONRenderer()
+
+            drf_output = drf_renderer.render(serializer_class(instance).data)
+            fast_output = fast_renderer.render(compiled.to_representation(instance))
+            if drf_output != fast_output:
+                self.stderr.write(f'{label}: output differs\n  {drf_output!r}\n  {fast_output!r}')
+                continue
+
+            drf = min(timeit.repeat(lambda: drf_renderer.render(serializer_class(instance).data), number=number, repeat=3))
+            fast = min(timeit.repeat(lambda: fast_renderer.render(compiled.to_representation(instance)), number=number, repeat=3))
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(
+                f'  DRF serializer + JSONRenderer: {drf / number * 1e6:.2f} us\n'
+                f'  compiled + FastJSONRenderer:   {fast / number * 1e6:.2f} us ({drf / fast:.1f}x)'
+            )
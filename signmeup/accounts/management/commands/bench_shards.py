@@ -0,0 +1,56 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from accounts import sharding
+from accounts.management.commands.generate_users import generate_chunk, init_worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure insert throughput of users, profiles and tokens with one writer process per shard, '
+        'using 1 to N of the ACCOUNTS_SHARDS databases.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20000, help='Number of users inserted into each shard.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT statement.')
+
+    def handle(self, *args, **options):
+        aliases = list(sharding.shards())
+        if not aliases:
+            raise CommandError('ACCOUNTS_SHARDS is empty; configure at least one shard database.')
+
+        chunk_options = {
+            'verified_ratio': 0.8,
+            'batch_size': options['batch_size'],
+            'profiles': True,
+            'tokens': True,
+            # Hash once; every generated user shares the result.
+            'password_hash': make_password('benchmark-password'),
+        }
+        run = int(time.time())
+        users = options['users']
+
+        baseline = None
+        self.stdout.write(f'{users} users per shard, {len(aliases)} shard(s): {", ".join(aliases)}')
+        for count in range(1, len(aliases) + 1):
+            connections.close_all()
+            started = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=count, initializer=init_worker) as executor:
+                futures = [
+                    executor.submit(generate_chunk, 0, users, dict(chunk_options, database=alias, seed=f'{run}:{count}', prefix=f'shardbench{run}_{count}_'))
+                    for alias in aliases[:count]
+                ]
+                created = sum(future.result() for future in futures)
+            elapsed = time.perf_counter() - started
+
+            throughput = created / elapsed
+            baseline = baseline or throughput
+            self.stdout.write(
+                f'{count} shard(s): {throughput:9.0f} users/s, '
+                f'{throughput / baseline:4.2f}x (ideal {count}x)'
+            )
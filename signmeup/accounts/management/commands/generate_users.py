@@ -0,0 +1,210 @@
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from accounts import sharding
+from accounts.models import CustomUser as User
+from accounts.models import DeviceToken, UserDirectory, UserProfile, token_lifetime
+from accounts.token_cache import valid_tokens
+
+
+FIRST_NAMES = ['Amina', 'Brian', 'Chen', 'Daniela', 'Emeka', 'Fatma', 'Goran', 'Hana', 'Ivan', 'Jomo', 'Kaito', 'Lerato']
+LAST_NAMES = ['Achieng', 'Berg', 'Costa', 'Dubois', 'Eze', 'Fischer', 'Garcia', 'Haddad', 'Ito', 'Kamau', 'Larsen', 'Mensah']
+LOCATIONS = ['', '', '', 'Nairobi', 'Lagos', 'Berlin', 'Sao Paulo', 'Tokyo', 'Toronto']
+WORDS = ['coffee', 'hiking', 'python', 'music', 'design', 'travel', 'football', 'books', 'startups', 'photography']
+
+
+def generate_chunk(start, stop, options):
+    """
+    Inserts the users with indexes in [start, stop), plus their profiles and tokens.
+
+    Each chunk seeds its own random generator from (seed, start), so the generated rows do not
+    depend on how chunks are scheduled across processes.
+
+    Args:
+        start (int): The index of the first user in the chunk.
+        stop (int): The index after the last user in the chunk.
+        options (dict): The generation options (database, prefix, seed, password hash, ratios, batch size, toggles).
+            With ACCOUNTS_SHARDS, the database is ignored: ids come from the user directory, and
+            each user goes to its shard.
+
+    Returns:
+        int: The number of users inserted.
+    """
+    rng = random.Random(f"{options['seed']}:{start}")
+    prefix = options['prefix']
+    now = timezone.now()
+
+    users = []
+    for i in range(start, stop):
+        verified = rng.random() < options['verified_ratio']
+        users.append(User(
+            username=f'{prefix}{i}',
+            email=f'{prefix}{i}@example.com',
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            password=options['password_hash'],
+            start_date=now - timezone.timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+            email_verified=verified,
+            is_active=verified,
+        ))
+
+    if not sharding.is_sharded():
+        with transaction.atomic(using=options['database']):
+            insert_users(options['database'], users, rng, now, options)
+        return len(users)
+
+    # As in registration, the directory allocates the ids, which decide the shard of each user; its
+    # rows are rolled back if an insert on a shard fails.
+    with transaction.atomic(using=sharding.DIRECTORY_DATABASE):
+        directory = UserDirectory.objects.using(sharding.DIRECTORY_DATABASE)
+        entries = directory.bulk_create([
+            UserDirectory(username=user.username.lower(), email=user.email.lower())
+            for user in users
+        ], batch_size=options['batch_size'])
+        if entries[0].pk is None:
+            pks = dict(directory.filter(username__in=[entry.username for entry in entries]).values_list('username', 'pk'))
+            for entry in entries:
+                entry.pk = pks[entry.username]
+        by_database = {}
+        for user, entry in zip(users, entries):
+            user.pk = entry.pk
+            by_database.setdefault(sharding.db_for_user(user.pk), []).append(user)
+        for database, shard_users in by_database.items():
+            with transaction.atomic(using=database):
+                insert_users(database, shard_users, rng, now, options)
+
+    return len(users)
+
+
+def insert_users(database, users, rng, now, options):
+    """
+    Inserts users, and their profiles and tokens, into one database.
+
+    Args:
+        database (str): The database alias.
+        users (list): The unsaved users; with sharding, their ids are already allocated.
+        rng (random.Random): The chunk's random generator.
+        now (datetime): The creation time of the tokens.
+        options (dict): The generation options.
+    """
+    User.objects.using(database).bulk_create(users, batch_size=options['batch_size'])
+    if users[0].pk is None:
+        # Backends that cannot return primary keys from a bulk insert.
+        pks = dict(User.objects.using(database).filter(username__in=[user.username for user in users]).values_list('username', 'pk'))
+        for user in users:
+            user.pk = pks[user.username]
+
+    if options['profiles']:
+        UserProfile.objects.using(database).bulk_create([
+            generate_profile(rng, user)
+            for user in users
+        ], batch_size=options['batch_size'])
+
+    if options['tokens']:
+        expires = now + token_lifetime()
+        DeviceToken.objects.using(database).bulk_create([
+            DeviceToken(key=generate_key(rng, user), user=user, device='generated', created=now, last_used=now, expires=expires)
+            for user in users if user.is_active
+        ], batch_size=options['batch_size'])
+
+
+def generate_key(rng, user):
+    """
+    Returns a token key; with sharding, it starts with the user's shard like the keys of issued tokens.
+    """
+    key = '%040x' % rng.getrandbits(160)
+    if sharding.is_sharded():
+        key = sharding.token_key_prefix(user.pk) + key[2:]
+    return key
+
+
+def generate_profile(rng, user):
+    """
+    Returns an unsaved profile; about a third of the users fill in their bio, about text and links.
+    """
+    profile = UserProfile(user=user, location=rng.choice(LOCATIONS))
+    if rng.random() < 0.3:
+        profile.bio = ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(5, 40)))
+        profile.about = ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(10, 60)))
+        for name in rng.sample(UserProfile.LINK_NAMES, rng.randrange(1, 4)):
+            setattr(profile, name, f'https://{name}.example.com/{user.username}')
+    return profile
+
+
+def init_worker():
+    """
+    Prepares a worker process: sets Django up and drops connections inherited from the parent.
+    """
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users with profiles and tokens for performance testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('users', type=int, help='Number of users to generate.')
+        parser.add_argument('--start', type=int, default=0, help='Index of the first generated user; usernames are <prefix><index>.')
+        parser.add_argument('--database', help="Database alias to insert into (default 'default'); not allowed with ACCOUNTS_SHARDS, which spreads users over the shards.")
+        parser.add_argument('--prefix', default='user', help='Prefix for generated usernames and emails.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the generated field values.')
+        parser.add_argument('--password', default='benchmark-password', help='Password shared by all generated users (hashed once).')
+        parser.add_argument('--verified-ratio', type=float, default=0.8, help='Fraction of users that are verified and active.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT statement.')
+        parser.add_argument('--chunk-size', type=int, default=50000, help='Users per transaction / unit of parallel work.')
+        parser.add_argument('--jobs', type=int, default=1, help='Number of worker processes.')
+        parser.add_argument('--no-profiles', dest='profiles', action='store_false', help='Do not create profiles.')
+        parser.add_argument('--no-tokens', dest='tokens', action='store_false', help='Do not create tokens for active users.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('The number of users must be positive.')
+        if sharding.is_sharded():
+            if options['database'] is not None:
+                # Rows inserted straight into a shard would have no directory entry and ids of another shard.
+                raise CommandError('--database cannot be used with ACCOUNTS_SHARDS: the user directory allocates the ids, which decide the shard of each user.')
+            options['database'] = sharding.DIRECTORY_DATABASE
+        elif options['database'] is None:
+            options['database'] = 'default'
+        if options['jobs'] > 1 and connections[options['database']].vendor == 'sqlite':
+            # SQLite serialises writers; parallel inserts would only fail with "database is locked".
+            self.stderr.write('SQLite allows a single writer; ignoring --jobs.')
+            options['jobs'] = 1
+
+        chunk_options = {
+            key: options[key]
+            for key in ('database', 'prefix', 'seed', 'verified_ratio', 'batch_size', 'profiles', 'tokens')
+        }
+        # Hash once; every generated user shares the result.
+        chunk_options['password_hash'] = make_password(options['password'])
+
+        start, stop = options['start'], options['start'] + options['users']
+        chunks = [(i, min(i + options['chunk_size'], stop)) for i in range(start, stop, options['chunk_size'])]
+
+        started = time.perf_counter()
+        created = 0
+        if options['jobs'] > 1:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['jobs'], initializer=init_worker) as executor:
+                futures = [executor.submit(generate_chunk, chunk_start, chunk_stop, chunk_options) for chunk_start, chunk_stop in chunks]
+                for future in futures:
+                    created += future.result()
+                    self.stdout.write(f'{created}/{options["users"]} users', ending='\r')
+        else:
+            for chunk_start, chunk_stop in chunks:
+                created += generate_chunk(chunk_start, chunk_stop, chunk_options)
+                self.stdout.write(f'{created}/{options["users"]} users', ending='\r')
+
+        if options['tokens']:
+            # Running servers' token filters look up missing keys in the database until they have rebuilt.
+            valid_tokens.token_issued()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Generated {created} users in {elapsed:.1f}s ({created / elapsed:.0f} users/s).'))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from accounts import sharding
+from accounts.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete profiles that hold nothing but their defaults, in batches. '
+        'The API serves the same defaults for users without a profile row.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='Database alias to prune; repeatable. Defaults to every shard, or the default database.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per statement.')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between batches, to limit the load.')
+        parser.add_argument('--dry-run', action='store_true', help='Count the empty profiles without deleting them.')
+
+    def handle(self, *args, **options):
+        databases = options['databases'] or list(sharding.shards()) or [DEFAULT_DB_ALIAS]
+        for database in databases:
+            empty = UserProfile.objects.db_manager(database).empty()
+            if options['dry_run']:
+                self.stdout.write(f'{database}: {empty.count()} empty profile(s)')
+                continue
+
+            deleted = 0
+            last_pk = 0
+            while True:
+                # Walk the primary key so each batch is an index range scan, not a rescan from the start.
+                pks = list(empty.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+                if not pks:
+                    break
+                # Re-check emptiness in the DELETE, in case a profile was updated since it was selected.
+                count, _ = empty.filter(pk__in=pks).delete()
+                deleted += count
+                last_pk = pks[-1]
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+            self.stdout.write(f'{database}: deleted {deleted} empty profile(s)')
@@ -1,19 +1,74 @@
 # accounts/middleware.py
+import logging
+import random
+import re
+import uuid
 
-from rest_framework.authtoken.models import Token
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.db.backends.signals import connection_created
 from django.utils import timezone
 from django.http import JsonResponse
 
+from accounts import logs, profiling, routers, sharding, token_cache
+from accounts.activity import activity
+from accounts.models import DeviceToken, token_lifetime
+
+logger = logging.getLogger('accounts.auth')
+profiling_logger = logging.getLogger('accounts.profiling')
+
+# Length of the generated token keys; longer values cannot match a token.
+TOKEN_KEY_MAX_LENGTH = 40
+
+# Request ids accepted from clients and proxies; anything else is replaced by a generated id.
+REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9._-]{1,64}')
+
+
+def excluded_path_prefixes():
+    """
+    Return the path prefixes the token middleware skips.
+
+    ACCOUNTS_TOKEN_MIDDLEWARE_EXCLUDE overrides the defaults, which are the admin site and the
+    static and media URLs when they are served by this project.
+
+    Returns:
+        tuple: The path prefixes, usable with str.startswith.
+    """
+    prefixes = getattr(settings, 'ACCOUNTS_TOKEN_MIDDLEWARE_EXCLUDE', None)
+    if prefixes is None:
+        prefixes = ['/admin/', settings.STATIC_URL, settings.MEDIA_URL]
+    # Absolute URLs (e.g. a CDN) never match a request path, and '/' would exclude the whole API.
+    return tuple(prefix for prefix in prefixes if prefix and prefix != '/' and prefix.startswith('/'))
+
+
+def invalid_token_response(request, reason):
+    # Sampled by the 'accounts.auth' logger configuration; a flood logs a fraction of the requests.
+    logger.info('Invalid token', extra={'event': 'invalid_token', 'reason': reason, 'path': request.path_info})
+    return JsonResponse({'message': 'Invalid token'}, status=401)
+
+
+def expired_token_response(request):
+    logger.info('Expired token', extra={'event': 'expired_token', 'path': request.path_info})
+    return JsonResponse({'message': 'Token has expired. Please log in again.'}, status=401)
+
 
 class TokenExpirationMiddleware:
     def __init__(self, get_response):
         """
         Initialize the TokenExpirationMiddleware.
 
+        The excluded path prefixes are resolved once here, so requests to them cost a single
+        startswith check.
+
         Args:
             get_response (function): The callable that represents the next middleware or view.
         """
         self.get_response = get_response
+        self.excluded_prefixes = excluded_path_prefixes()
+        self.refresh_interval = getattr(settings, 'ACCOUNTS_TOKEN_REFRESH_INTERVAL', 300)
 
     def __call__(self, request):
         """
@@ -21,7 +76,13 @@ class TokenExpirationMiddleware:
 
         If the request contains an Authorization header with a token, this middleware will check if the token has expired.
         If the token has expired, it will be deleted and an error response will be returned.
-        If the token is still valid, its expiration time will be updated to extend its validity.
+        If the token is still valid, the user's activity is recorded and the token's last use and expiration
+        time are updated, at most once per ACCOUNTS_TOKEN_REFRESH_INTERVAL seconds (default 300).
+        The token and its user are attached to the request as `request.device_token`, so
+        DeviceTokenAuthentication does not look them up again.
+        Requests to excluded paths and requests using another authorization scheme are passed through untouched,
+        and malformed token headers are rejected without a database query, as are keys rejected by
+        accounts.token_cache (recently seen invalid keys, and never issued ones when the Bloom filter is on).
 
         Args:
             request (HttpRequest): The incoming request.
@@ -29,27 +90,315 @@ class TokenExpirationMiddleware:
         Returns:
             HttpResponse: The response from the view or the error response if the token has expired.
         """
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            token_key = auth_header.split(' ')[1]  # Extract the token from the Authorization header
+        token_key = self.get_token_key(request)
+        if token_key is None:
+            return self.get_response(request)
+        if not token_key:
+            return invalid_token_response(request, 'malformed')
+        if token_cache.is_known_invalid(token_key):
+            return invalid_token_response(request, 'cached')
+
+        tokens = DeviceToken.objects.db_manager(sharding.db_for_token_key(token_key)).select_related('user')
+        try:
+            token = tokens.get(key=token_key)
+        except DeviceToken.DoesNotExist:
+            if not self.retry_on_primary():
+                return self.unknown_token_response(request, token_key)
+            # A token issued moments ago may not have reached the replica yet; if so, the rest of the
+            # request (and the client's next requests) read from the primary too.
+            try:
+                token = tokens.using(routers.PRIMARY_DATABASE).get(key=token_key)
+            except DeviceToken.DoesNotExist:
+                return self.unknown_token_response(request, token_key)
+            routers.pin_primary()
+
+        now = timezone.now()
+        if token.expires <= now:
+            token.delete()  # Token has expired, delete it
+            token_cache.invalid_tokens.add(token_key)
+            return expired_token_response(request)
+
+        activity.record(token.user_id, now)
+
+        # Extend the token's expiration, at most once per refresh interval rather than on every request
+        if self.needs_refresh(token, now):
+            with routers.no_pin():
+                tokens.filter(pk=token.pk).update(last_used=now, expires=now + token_lifetime())
+
+        request.device_token = token
+        return self.get_response(request)
+
+    def get_token_key(self, request):
+        """
+        Extracts the token key from the request's Authorization header.
+
+        Args:
+            request (HttpRequest): The incoming request.
+
+        Returns:
+            str: The token key; '' if the token header is malformed, or None if the request is not ours to check.
+        """
+        auth_header = request.META.get('HTTP_AUTHORIZATION')
+        if not auth_header or request.path_info.startswith(self.excluded_prefixes):
+            return None
+
+        # Only 'Token <key>' headers are ours; the scheme is case-insensitive, as in DRF.
+        if auth_header[:6].lower() != 'token ':
+            return '' if auth_header.lower() == 'token' else None
+
+        token_key = auth_header[6:].strip()
+        if not token_key or len(token_key) > TOKEN_KEY_MAX_LENGTH or ' ' in token_key:
+            return ''
+        return token_key
+
+    def unknown_token_response(self, request, token_key):
+        token_cache.token_missing(token_key)
+        return invalid_token_response(request, 'unknown')
+
+    def retry_on_primary(self):
+        """
+        Tells whether a token missing from a read replica should be looked up on the primary.
+        """
+        return bool(routers.read_replicas()) and not routers.is_primary_pinned() and not sharding.is_sharded()
+
+    def needs_refresh(self, token, now):
+        return token.last_used < now - timezone.timedelta(seconds=self.refresh_interval)
+
+
+class AsyncTokenExpirationMiddleware(TokenExpirationMiddleware):
+    """
+    TokenExpirationMiddleware for fully async middleware chains under ASGI, using the async ORM.
+
+    Under ASGI, Django runs the middleware above an async-capable one in async mode, and Django's
+    own middleware then moves each of its hooks to a worker thread. With the default middleware
+    that is more thread switches per request than running the whole chain in one thread, so
+    TokenExpirationMiddleware stays sync-only and this class is opt-in; compare both with
+    `manage.py bench_asgi`.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        """
+        The asynchronous version of __call__, using the async ORM.
+        """
+        token_key = self.get_token_key(request)
+        if token_key is None:
+            return await self.get_response(request)
+        if not token_key:
+            return invalid_token_response(request, 'malformed')
+        if await token_cache.ais_known_invalid(token_key):
+            return invalid_token_response(request, 'cached')
+
+        tokens = DeviceToken.objects.db_manager(sharding.db_for_token_key(token_key)).select_related('user')
+        try:
+            token = await tokens.aget(key=token_key)
+        except DeviceToken.DoesNotExist:
+            if not self.retry_on_primary():
+                return self.unknown_token_response(request, token_key)
             try:
-                token = Token.objects.get(key=token_key)
-
-                if token.created < timezone.now() - timezone.timedelta(days=7):
-                    token.delete()  # Token has expired, delete it
-                    response_data = {'message': 'Token has expired. Please log in again.'}
-                    return JsonResponse(response_data, status=401)
-                else:
-                    # Update token's created time to extend its expiration
-                    token.created = timezone.now()
-                    token.save()
-
-            except Token.DoesNotExist:
-                print('Token.DoesNotExist')
-                response_data = {
-                    'message': 'Invalid token'
-                }
-                return JsonResponse(response_data, status=401)
-
-        response = self.get_response(request)
+                token = await tokens.using(routers.PRIMARY_DATABASE).aget(key=token_key)
+            except DeviceToken.DoesNotExist:
+                return self.unknown_token_response(request, token_key)
+            routers.pin_primary()
+
+        now = timezone.now()
+        if token.expires <= now:
+            await token.adelete()
+            token_cache.invalid_tokens.add(token_key)
+            return expired_token_response(request)
+
+        await activity.arecord(token.user_id, now)
+
+        if self.needs_refresh(token, now):
+            with routers.no_pin():
+                await tokens.filter(pk=token.pk).aupdate(last_used=now, expires=now + token_lifetime())
+
+        request.device_token = token
+        return await self.get_response(request)
+
+
+class ReplicaPinningMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """
+        Initialize the ReplicaPinningMiddleware.
+
+        The middleware is skipped entirely when no read replicas are configured.
+
+        Args:
+            get_response (function): The callable that represents the next middleware or view.
+        """
+        if not routers.read_replicas():
+            raise MiddlewareNotUsed
+        # Writes pin the request from the connections, which only do so within this middleware's scope.
+        connection_created.connect(routers.install_write_hook)
+        for connection in connections.all():
+            routers.install_write_hook(connection=connection)
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.cookie_name = getattr(settings, 'ACCOUNTS_REPLICA_PIN_COOKIE', 'accounts_primary')
+        self.pin_seconds = getattr(settings, 'ACCOUNTS_REPLICA_PIN_SECONDS', 5)
+
+    def __call__(self, request):
+        """
+        Keep a client's reads on the primary database for a short time after it wrote.
+
+        Requests carrying the pinning cookie read from the primary. A request that writes gets the
+        cookie for ACCOUNTS_REPLICA_PIN_SECONDS (default 5), which should cover the replication lag.
+
+        Args:
+            request (HttpRequest): The incoming request.
+
+        Returns:
+            HttpResponse: The response from the view.
+        """
+        if self.async_mode:
+            return self.__acall__(request)
+
+        reset_token = self.pin_from_cookie(request)
+        try:
+            return self.set_pin_cookie(self.get_response(request))
+        finally:
+            routers._primary_pinned.reset(reset_token)
+
+    async def __acall__(self, request):
+        """
+        The asynchronous version of __call__. Pins set by the view in its worker thread are copied
+        back to this context by sync_to_async.
+        """
+        reset_token = self.pin_from_cookie(request)
+        try:
+            return self.set_pin_cookie(await self.get_response(request))
+        finally:
+            routers._primary_pinned.reset(reset_token)
+
+    def pin_from_cookie(self, request):
+        pinned = routers.PINNED_BY_COOKIE if self.cookie_name in request.COOKIES else False
+        return routers._primary_pinned.set(pinned)
+
+    def set_pin_cookie(self, response):
+        if routers._primary_pinned.get() is True:
+            response.set_cookie(self.cookie_name, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
+
+
+class RequestIdMiddleware:
+    def __init__(self, get_response):
+        """
+        Initialize the RequestIdMiddleware.
+
+        Args:
+            get_response (function): The callable that represents the next middleware or view.
+        """
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """
+        Tag the request, its log records and its response with a request id.
+
+        The id comes from the X-Request-ID header when a client or proxy sent a well-formed one,
+        and is generated otherwise. It is available as `request.request_id`, added to the records
+        formatted by accounts.logs.JSONFormatter and returned in the X-Request-ID response header.
+
+        Args:
+            request (HttpRequest): The incoming request.
+
+        Returns:
+            HttpResponse: The response from the view.
+        """
+        incoming = request.headers.get('X-Request-ID', '')
+        request.request_id = incoming if REQUEST_ID_PATTERN.fullmatch(incoming) else uuid.uuid4().hex
+        reset_token = logs.request_id.set(request.request_id)
+        try:
+            response = self.get_response(request)
+            response['X-Request-ID'] = request.request_id
+            return response
+        finally:
+            logs.request_id.reset(reset_token)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        """
+        Initialize the ProfilingMiddleware.
+
+        The middleware is removed from the chain at startup unless ACCOUNTS_PROFILING is set, so it
+        costs nothing when profiling is off.
+
+        Args:
+            get_response (function): The callable that represents the next middleware or view.
+        """
+        if not getattr(settings, 'ACCOUNTS_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'ACCOUNTS_PROFILING_SAMPLE_RATE', 0.0)
+        self.mode = getattr(settings, 'ACCOUNTS_PROFILING_MODE', 'cprofile')
+
+    def __call__(self, request):
+        """
+        Profile sampled requests and requests carrying a valid profiling token (see accounts.profiling).
+
+        The profile covers the middleware below this one and the view, and is stored for the admin
+        profiling endpoints; its id is returned in the X-Profile-Id response header. Requests served
+        through ASGI are not profiled, as parts of them run outside the profiled thread. Failing to
+        store a profile is logged and never fails the request.
+
+        Args:
+            request (HttpRequest): The incoming request.
+
+        Returns:
+            HttpResponse: The response from the view.
+        """
+        if isinstance(request, ASGIRequest) or not self.should_profile(request):
+            return self.get_response(request)
+
+        profiler = profiling.RequestProfiler(self.mode)
+        try:
+            profiler.start()
+        except ValueError:
+            # Another request of this process is being profiled and the interpreter allows one profiler.
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+
+        profile_id = uuid.uuid4().hex
+        try:
+            profiling.store_profile(profile_id, request, response, profiler)
+        except Exception:
+            profiling_logger.warning(
+                'Request profile not stored',
+                exc_info=True,
+                extra={'event': 'profile_store_failed', 'path': request.path_info},
+            )
+            return response
+        profiling_logger.info(
+            'Request profiled',
+            extra={'event': 'request_profiled', 'profile_id': profile_id, 'path': request.path_info, 'duration_ms': round(profiler.duration * 1000, 1)},
+        )
+        response[profiling.PROFILE_ID_HEADER] = profile_id
         return response
+
+    def should_profile(self, request):
+        token = request.headers.get(profiling.HEADER)
+        if token and profiling.check_token(token) is not None:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
@@ -1,8 +1,17 @@
+import binascii
+import os
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from accounts import sharding, token_cache
+from accounts.availability import taken_names
 
 
 class CustomUserManager(BaseUserManager):
@@ -10,6 +19,55 @@ class CustomUserManager(BaseUserManager):
     A custom manager for the CustomUser model.
     """
 
+    def get_by_login(self, identifier):
+        """
+        Finds the user whose username or email matches the identifier, case-insensitively.
+
+        Both conditions are answered in one query by the LOWER() unique indexes. If the identifier
+        is one user's username and another user's email, the username match wins.
+
+        Args:
+            identifier (str): A username or an email address.
+
+        Returns:
+            CustomUser: The matching user, or None.
+        """
+        identifier = identifier.lower()
+        if sharding.is_sharded() and self._db is None:
+            return self._get_by_login_sharded(identifier)
+
+        users = list(self.filter(Q(username__lower=identifier) | Q(email__lower=identifier))[:2])
+        for user in users:
+            if user.username.lower() == identifier:
+                return user
+        return users[0] if users else None
+
+    def _get_by_login_sharded(self, identifier):
+        """
+        Resolves the identifier in the user directory, then loads the user from its shard.
+        """
+        entries = list(
+            UserDirectory.objects.using(sharding.DIRECTORY_DATABASE)
+            .filter(Q(username=identifier) | Q(email=identifier))
+            .values_list('pk', 'username')[:2]
+        )
+        if not entries:
+            return None
+        user_id = next((pk for pk, username in entries if username == identifier), entries[0][0])
+        return self.db_manager(sharding.db_for_user(user_id)).filter(pk=user_id).first()
+
+    def active_within(self, days):
+        """
+        Returns the users seen in the last `days` days, using the last_seen index.
+
+        Args:
+            days (int): The number of days.
+
+        Returns:
+            QuerySet: The active users.
+        """
+        return self.filter(last_seen__gte=timezone.now() - timezone.timedelta(days=days))
+
     def create_superuser(self, email, username, first_name, password, **other_fields):
         """
         Creates a superuser with the provided parameters.
@@ -62,7 +120,19 @@ class CustomUserManager(BaseUserManager):
         email = self.normalize_email(email)
         user = self.model(email=email, username=username, first_name=first_name, last_name=last_name, **other_fields)
         user.set_password(password)
-        user.save()
+
+        if sharding.is_sharded() and self._db is None:
+            # The directory allocates the id and checks uniqueness across shards; its row is rolled
+            # back if the insert on the shard fails.
+            with transaction.atomic(using=sharding.DIRECTORY_DATABASE):
+                entry = UserDirectory.objects.using(sharding.DIRECTORY_DATABASE).create(username=username.lower(), email=email.lower())
+                user.pk = entry.pk
+                user.save(using=sharding.db_for_user(entry.pk))
+            transaction.on_commit(lambda: taken_names.add(username, email), using=sharding.DIRECTORY_DATABASE)
+            return user
+
+        user.save(using=self._db)
+        transaction.on_commit(lambda: taken_names.add(username, email), using=user._state.db)
         return user
 
 
@@ -78,7 +148,8 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     last_name = models.CharField(max_length=150, blank=True)
 
     start_date = models.DateTimeField(default=timezone.now)
-    about = models.TextField(_('about'), max_length=500, blank=True)
+    # Written in bulk by accounts.activity, so it may lag by one flush interval.
+    last_seen = models.DateTimeField(null=True, blank=True, db_index=True)
 
     is_staff = models.BooleanField(default=False)
     is_active = models.BooleanField(default=False)
@@ -88,6 +159,27 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name']
 
+    class Meta:
+        constraints = [
+            # Case-insensitive uniqueness; also the indexes used by `email__lower`/`username__lower` lookups.
+            models.UniqueConstraint(Lower('email'), name='accounts_user_email_ci_unique'),
+            models.UniqueConstraint(Lower('username'), name='accounts_user_username_ci_unique'),
+        ]
+        indexes = [
+            # Only unverified accounts are scanned by verification cleanup, so index just those rows.
+            models.Index(fields=['start_date'], name='accounts_user_unverified_idx', condition=Q(email_verified=False)),
+        ]
+
+    def delete(self, using=None, keep_parents=False):
+        """
+        Deletes the user, and with sharding enabled, frees its username and email in the user directory.
+        """
+        user_id = self.pk
+        result = super().delete(using=using, keep_parents=keep_parents)
+        if sharding.is_sharded():
+            UserDirectory.objects.using(sharding.DIRECTORY_DATABASE).filter(pk=user_id).delete()
+        return result
+
     def __str__(self):
         """
         Returns the string representation of the user.
@@ -98,25 +190,91 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         return self.username
 
 
+# Allow `username__lower=value` and `email__lower=value` lookups, answered by the LOWER() unique
+# indexes above. Registered on these two fields only, not on every CharField of the project.
+for field_name in ('username', 'email'):
+    CustomUser._meta.get_field(field_name).register_lookup(Lower)
+
+
+class UserDirectory(models.Model):
+    """
+    The global index of users when the accounts tables are sharded (see accounts.sharding).
+
+    Lives on the directory database only. Its primary key is the user's id, which determines the
+    shard, and its unique columns hold the lowercased username and email.
+    """
+
+    username = models.CharField(max_length=150, unique=True)
+    email = models.CharField(max_length=254, unique=True)
+
+    class Meta:
+        verbose_name_plural = 'user directory'
+
+    def __str__(self):
+        return self.username
+
+
+def link_property(name):
+    """
+    Returns a property reading and writing one social link in UserProfile.links ('' when unset).
+    """
+    def get_link(self):
+        return self.links.get(name, '')
+
+    def set_link(self, value):
+        if value:
+            self.links[name] = value
+        else:
+            self.links.pop(name, None)
+
+    return property(get_link, set_link)
+
+
+class UserProfileManager(models.Manager):
+    """
+    A manager for the UserProfile model.
+    """
+
+    def empty(self):
+        """
+        Returns the profiles holding nothing but their defaults.
+
+        Returns:
+            QuerySet: The empty profiles.
+        """
+        return self.filter(avatar='', bio='', about='', location='', contact_number='', links={})
+
+
 class UserProfile(models.Model):
     """
     A model representing additional profile information for each user.
+
+    Rarely read text lives here rather than on CustomUser, which authentication loads on every
+    request. The social links share one JSON column, holding only the links that are set.
+    Profiles are created on the first update; until then the API serves an unsaved default profile.
     """
 
+    LINK_NAMES = ('website', 'facebook', 'twitter', 'instagram', 'tiktok', 'linkedin', 'youtube')
+
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='profile')
     avatar = models.ImageField(upload_to='accounts/avatars/', blank=True)
     bio = models.TextField(max_length=500, blank=True)
+    about = models.TextField(_('about'), max_length=500, blank=True)
 
     location = models.CharField(max_length=100, blank=True)
     contact_number = models.CharField(max_length=20, blank=True)
 
-    website = models.URLField(blank=True)
-    facebook = models.URLField(blank=True)
-    twitter = models.URLField(blank=True)
-    instagram = models.URLField(blank=True)
-    tiktok = models.URLField(blank=True)
-    linkedin = models.URLField(blank=True)
-    youtube = models.URLField(blank=True)
+    links = models.JSONField(default=dict, blank=True)
+
+    website = link_property('website')
+    facebook = link_property('facebook')
+    twitter = link_property('twitter')
+    instagram = link_property('instagram')
+    tiktok = link_property('tiktok')
+    linkedin = link_property('linkedin')
+    youtube = link_property('youtube')
+
+    objects = UserProfileManager()
 
     def __str__(self):
         """
@@ -126,3 +284,115 @@ class UserProfile(models.Model):
             str: The username of the associated user.
         """
         return self.user.username
+
+
+def generate_token_key():
+    """
+    Returns a random 40 character hexadecimal token key.
+    """
+    return binascii.hexlify(os.urandom(20)).decode()
+
+
+def token_lifetime():
+    """
+    Returns how long a device token stays valid without being used (ACCOUNTS_TOKEN_LIFETIME, default 7 days).
+    """
+    return getattr(settings, 'ACCOUNTS_TOKEN_LIFETIME', timezone.timedelta(days=7))
+
+
+def default_token_expiry():
+    return timezone.now() + token_lifetime()
+
+
+class DeviceTokenManager(models.Manager):
+    """
+    A manager for DeviceToken, issuing and revoking a user's tokens.
+    """
+
+    def issue(self, user, device='', replace=False):
+        """
+        Creates a token for one of the user's devices.
+
+        With `replace`, the new token replaces the user's tokens with the same device label, so
+        logging in again on a device does not use up the cap. Only pass it for device ids chosen by
+        the client: descriptive labels such as a user agent are shared by different devices. When the
+        user then holds more than ACCOUNTS_MAX_TOKENS_PER_USER tokens (default 10), the least
+        recently used ones are revoked.
+
+        Args:
+            user (CustomUser): The user.
+            device (str, optional): A label for the device, e.g. its user agent.
+            replace (bool, optional): Whether to replace the user's tokens with the same label.
+
+        Returns:
+            DeviceToken: The new token.
+        """
+        tokens = self.db_manager(sharding.db_for_user(user.pk))
+        device = device[:DeviceToken._meta.get_field('device').max_length]
+        if replace and device:
+            replaced = list(tokens.filter(user=user, device=device).values_list('key', flat=True))
+            if replaced:
+                tokens.filter(key__in=replaced).delete()
+                for replaced_key in replaced:
+                    token_cache.invalid_tokens.add(replaced_key)
+
+        key = generate_token_key()
+        if sharding.is_sharded():
+            key = sharding.token_key_prefix(user.pk) + key[2:]
+        token = tokens.create(key=key, user=user, device=device)
+        token_cache.invalid_tokens.discard(key)
+        # Other processes' token filters learn about the key once it is visible to them.
+        transaction.on_commit(lambda: token_cache.valid_tokens.token_issued(key), using=token._state.db)
+
+        cap = getattr(settings, 'ACCOUNTS_MAX_TOKENS_PER_USER', 10)
+        evicted = list(tokens.filter(user=user).order_by('-last_used', '-pk').values_list('pk', flat=True)[cap:])
+        if evicted:
+            tokens.filter(pk__in=evicted).delete()
+        return token
+
+    def revoke_all(self, user):
+        """
+        Revokes all of the user's tokens in a single DELETE statement.
+
+        Args:
+            user (CustomUser): The user.
+
+        Returns:
+            int: The number of revoked tokens.
+        """
+        # DeviceToken has no dependent rows or delete signals, so Django deletes without fetching the rows.
+        count, _ = self.db_manager(sharding.db_for_user(user.pk)).filter(user=user).delete()
+        return count
+
+
+class DeviceToken(models.Model):
+    """
+    An authentication token for one of a user's devices.
+
+    Each device gets its own token, so logging out on one device leaves the others signed in.
+    A token expires when it has not been used for ACCOUNTS_TOKEN_LIFETIME.
+    """
+
+    key = models.CharField(max_length=40, unique=True, default=generate_token_key)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='device_tokens')
+    device = models.CharField(max_length=200, blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    last_used = models.DateTimeField(default=timezone.now)
+    expires = models.DateTimeField(default=default_token_expiry)
+
+    objects = DeviceTokenManager()
+
+    class Meta:
+        indexes = [
+            # Serves both the per-user listing and the least-recently-used eviction.
+            models.Index(fields=['user', 'last_used'], name='accounts_token_user_lru_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Returns the string representation of the token.
+
+        Returns:
+            str: The primary key of the owner and the device label.
+        """
+        return f'{self.user_id}: {self.device or "unknown device"}'
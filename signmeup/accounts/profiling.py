@@ -0,0 +1,235 @@
+# accounts/profiling.py
+"""
+Per-request profiling for diagnosing slow endpoints in production.
+
+With ACCOUNTS_PROFILING = True, accounts.middleware.ProfilingMiddleware profiles:
+
+- a random ACCOUNTS_PROFILING_SAMPLE_RATE of the requests (default 0.0), and
+- requests carrying an `X-Profile-Token` header issued to an admin by the profiling token endpoint,
+  valid for ACCOUNTS_PROFILING_TOKEN_MAX_AGE seconds (default 3600).
+
+A profile holds the function profile of the request, from cProfile or, with
+ACCOUNTS_PROFILING_MODE = 'sampling', from a stack sampler taking ACCOUNTS_PROFILING_SAMPLE_INTERVAL
+second samples (default 0.001). It also holds the SQL the request executed, without the parameters,
+as they may hold personal data. Profiles are stored in the cache ACCOUNTS_PROFILING_CACHE (default
+'default') for ACCOUNTS_PROFILING_TTL seconds (default 86400); the last ACCOUNTS_PROFILING_MAX_STORED
+(default 50) are listed by the admin-only profiling endpoints. Use a cache shared by the worker
+processes to see the profiles of every process.
+
+When ACCOUNTS_PROFILING is off, the middleware removes itself from the chain at startup.
+
+Both profilers only see the thread that starts them, so requests are only profiled when served
+through WSGI. Under ASGI, the async middleware and views run on the event loop thread, and the
+middleware leaves the requests unprofiled rather than store misleading profiles.
+"""
+import contextlib
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.db import connections
+from django.utils import timezone
+
+HEADER = 'X-Profile-Token'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+INDEX_KEY = 'accounts:profiles'
+SQL_MAX_LENGTH = 2000
+SALT = 'accounts.profiling'
+
+
+def profiling_cache():
+    return caches[getattr(settings, 'ACCOUNTS_PROFILING_CACHE', 'default')]
+
+
+def make_token(user):
+    """
+    Returns a signed token enabling profiling for the requests carrying it, issued to an admin.
+    """
+    return signing.TimestampSigner(salt=SALT).sign(str(user.pk))
+
+
+def check_token(token):
+    """
+    Checks a profiling token's signature and age.
+
+    Returns:
+        str: The primary key of the admin it was issued to, or None if the token is invalid or expired.
+    """
+    max_age = getattr(settings, 'ACCOUNTS_PROFILING_TOKEN_MAX_AGE', 3600)
+    try:
+        return signing.TimestampSigner(salt=SALT).unsign(token, max_age=max_age)
+    except signing.BadSignature:
+        return None
+
+
+class StackSampler:
+    """
+    Samples the call stack of the thread that enables it at a fixed interval from a background thread.
+
+    Samples are counted per stack, in the folded format read by flame graph tools:
+    'module:function;module:function' from the outermost frame.
+    """
+
+    def __init__(self, interval):
+        self.thread_id = None
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='accounts-profiling-sampler', daemon=True)
+
+    def enable(self):
+        self.thread_id = threading.get_ident()
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f'{frame.f_globals.get("__name__", "?")}:{frame.f_code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def summary(self, limit):
+        # The innermost frames with the most samples.
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return ''.join(f'{count:6d} {count / total:6.1%}  {leaf}\n' for leaf, count in leaves.most_common(limit))
+
+
+class RequestProfiler:
+    """
+    Profiles the code and records the SQL run between start() and stop(), in the calling thread.
+
+    Args:
+        mode (str): 'cprofile' or 'sampling'.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.queries = []
+        self.duration = 0
+        if mode == 'sampling':
+            interval = getattr(settings, 'ACCOUNTS_PROFILING_SAMPLE_INTERVAL', 0.001)
+            self.profiler = StackSampler(interval)
+        else:
+            self.profiler = cProfile.Profile()
+
+    def start(self):
+        """
+        Starts profiling.
+
+        Raises:
+            ValueError: If another profiler is active and the interpreter allows only one (Python 3.12+).
+        """
+        self.profiler.enable()
+        self._wrappers = contextlib.ExitStack()
+        for connection in connections.all():
+            self._wrappers.enter_context(connection.execute_wrapper(self.record_query))
+        self._started = time.perf_counter()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self._started
+        self.profiler.disable()
+        self._wrappers.close()
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'database': context['connection'].alias,
+                'sql': sql[:SQL_MAX_LENGTH],
+                'many': many,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+
+    def report(self, limit=40):
+        """
+        Returns the profile as text: the functions by cumulative time, or the most sampled frames.
+        """
+        if self.mode == 'sampling':
+            return self.profiler.summary(limit)
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats('cumulative').print_stats(limit)
+        return stream.getvalue()
+
+    def raw(self):
+        """
+        Returns the profile as a file: pstats data for cProfile, folded stacks for sampling.
+        """
+        if self.mode == 'sampling':
+            return self.profiler.folded().encode()
+        self.profiler.create_stats()
+        return marshal.dumps(self.profiler.stats)
+
+
+def store_profile(profile_id, request, response, profiler):
+    """
+    Stores a request's profile in the profiling cache and adds it to the list of recent profiles.
+
+    Args:
+        profile_id (str): The id of the profile.
+        request (HttpRequest): The profiled request.
+        response (HttpResponse): Its response.
+        profiler (RequestProfiler): The profiler, after the request.
+    """
+    summary = {
+        'id': profile_id,
+        'created': timezone.now().isoformat(),
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'request_id': getattr(request, 'request_id', None),
+        'mode': profiler.mode,
+        'duration_ms': round(profiler.duration * 1000, 3),
+        'query_count': len(profiler.queries),
+        'query_ms': round(sum(query['duration_ms'] for query in profiler.queries), 3),
+    }
+    ttl = getattr(settings, 'ACCOUNTS_PROFILING_TTL', 86400)
+    cache = profiling_cache()
+    cache.set(f'{INDEX_KEY}:{profile_id}', {
+        'summary': summary,
+        'report': profiler.report(),
+        'queries': profiler.queries,
+        'raw': profiler.raw(),
+    }, ttl)
+
+    # Best effort: concurrent profiles from several processes may drop each other from the list.
+    max_stored = getattr(settings, 'ACCOUNTS_PROFILING_MAX_STORED', 50)
+    index = [summary, *cache.get(INDEX_KEY, [])][:max_stored]
+    cache.set(INDEX_KEY, index, ttl)
+
+
+def recent_profiles():
+    """
+    Returns the summaries of the recent profiles, newest first.
+    """
+    return profiling_cache().get(INDEX_KEY, [])
+
+
+def get_profile(profile_id):
+    """
+    Returns a stored profile (summary, report, queries and raw file), or None.
+    """
+    return profiling_cache().get(f'{INDEX_KEY}:{profile_id}')
+
@@ -0,0 +1,40 @@
+# accounts/renderers.py
+from functools import lru_cache
+
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+
+
+@lru_cache(maxsize=None)
+def compact_encoder(encoder_class, ensure_ascii, allow_nan, separators):
+    """
+    Returns a shared encoder instance for the given options.
+    """
+    return encoder_class(ensure_ascii=ensure_ascii, allow_nan=allow_nan, separators=separators)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    A JSONRenderer producing the same bytes, which reuses one encoder instance for unindented output
+    instead of building a new one through `json.dumps()` on every response.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Render `data` into JSON, returning a bytestring.
+        """
+        if data is None:
+            return b''
+
+        if (accepted_media_type and 'indent' in accepted_media_type) or (renderer_context and 'indent' in renderer_context):
+            # Pretty printing is rare; let the stock renderer handle it.
+            return super().render(data, accepted_media_type, renderer_context)
+
+        separators = SHORT_SEPARATORS if self.compact else LONG_SEPARATORS
+        encoder = compact_encoder(self.encoder_class, self.ensure_ascii, not self.strict, separators)
+        ret = encoder.encode(data)
+
+        # Same escaping as JSONRenderer, so the output stays a strict javascript subset.
+        if '\u2028' in ret or '\u2029' in ret:
+            ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
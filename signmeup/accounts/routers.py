@@ -0,0 +1,154 @@
+# accounts/routers.py
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from accounts import sharding
+
+PRIMARY_DATABASE = 'default'
+
+# Set by ReplicaPinningMiddleware for the duration of a request: True once the request has written,
+# PINNED_BY_COOKIE when the client was pinned by an earlier write (either way, reads go to the
+# primary), False otherwise. None outside a request.
+_primary_pinned = ContextVar('accounts_primary_pinned', default=None)
+PINNED_BY_COOKIE = 'cookie'
+
+# True within no_pin(): the writes made there do not pin the request.
+_pinning_suspended = ContextVar('accounts_pinning_suspended', default=False)
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def pin_primary():
+    """
+    Sends the remaining reads of the current request to the primary database.
+
+    Outside a request handled by ReplicaPinningMiddleware (management commands, tasks, shells),
+    there is nothing to pin and this does nothing.
+    """
+    if _primary_pinned.get() is not None:
+        _primary_pinned.set(True)
+
+
+def is_primary_pinned():
+    return bool(_primary_pinned.get())
+
+
+@contextmanager
+def no_pin():
+    """
+    Keeps the writes made within it from pinning the current request to the primary.
+
+    For bookkeeping the client does not read back, such as the last_seen flush and token refreshes,
+    which would otherwise send plain GET requests and the client's next ones to the primary.
+    """
+    reset_token = _pinning_suspended.set(True)
+    try:
+        yield
+    finally:
+        _pinning_suspended.reset(reset_token)
+
+
+def pin_on_write(execute, sql, params, many, context):
+    """
+    A database execute wrapper pinning the current request to the primary when it writes.
+    """
+    if not _pinning_suspended.get() and sql.lstrip()[:6].upper() in WRITE_STATEMENTS:
+        pin_primary()
+    return execute(sql, params, many, context)
+
+
+def install_write_hook(sender=None, connection=None, **kwargs):
+    """
+    Adds pin_on_write to a connection to the primary or a shard, once.
+
+    ReplicaPinningMiddleware calls it for the existing connections and connects it to the
+    connection_created signal for the connections opened later by other threads.
+    """
+    if connection.alias not in read_replicas() and pin_on_write not in connection.execute_wrappers:
+        connection.execute_wrappers.append(pin_on_write)
+
+
+def read_replicas():
+    """
+    Returns the aliases of the read replicas (ACCOUNTS_READ_REPLICAS, default none).
+    """
+    return getattr(settings, 'ACCOUNTS_READ_REPLICAS', ())
+
+
+class ReplicaRouter:
+    """
+    Routes reads to the read replicas and writes to the primary database.
+
+    After a request writes (see pin_on_write), its reads go to the primary, and
+    ReplicaPinningMiddleware keeps the client's next requests on the primary until the replicas have
+    caught up, so users read their own writes. Without replicas configured, every query uses the
+    primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = read_replicas()
+        if not replicas or _primary_pinned.get():
+            return PRIMARY_DATABASE
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary.
+        databases = {PRIMARY_DATABASE, *read_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication.
+        if db in read_replicas():
+            return False
+        return None
+
+
+class ShardRouter:
+    """
+    Routes queries on the sharded accounts tables to the shard of the user they belong to.
+
+    Django passes the instance a query starts from as a hint (saving or deleting a user, reading
+    `user.profile`, `token.user`, ...); the shard follows from its user id. Queries without an instance
+    select their shard explicitly with `.using(accounts.sharding.db_for_user(...))`, and the user
+    directory always lives on the directory database. Without ACCOUNTS_SHARDS this router abstains,
+    so it can be listed before ReplicaRouter.
+    """
+
+    sharded_models = {'customuser', 'userprofile', 'devicetoken'}
+
+    def db_for_instance(self, model, hints):
+        if not sharding.is_sharded() or model._meta.app_label != 'accounts':
+            return None
+        if model._meta.model_name == 'userdirectory':
+            return sharding.DIRECTORY_DATABASE
+        instance = hints.get('instance')
+        if instance is None or model._meta.model_name not in self.sharded_models:
+            return None
+        if instance._state.db in sharding.shards():
+            return instance._state.db
+        user_id = instance.pk if instance._meta.model_name == 'customuser' else getattr(instance, 'user_id', None)
+        return sharding.db_for_user(user_id)
+
+    def db_for_read(self, model, **hints):
+        return self.db_for_instance(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_instance(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if sharding.is_sharded() and obj1._state.db in sharding.shards():
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'accounts' and model_name == 'userdirectory':
+            return db == sharding.DIRECTORY_DATABASE
+        return None
@@ -1,7 +1,12 @@
 # accounts/serializers.py
+from operator import attrgetter
+
 from rest_framework import serializers
+from rest_framework.fields import SkipField
+from django.conf import settings
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError
 
 from accounts.models import CustomUser as User
 from accounts.models import UserProfile
@@ -62,11 +67,110 @@ class UserSerializer(serializers.ModelSerializer):
         Returns:
             User: The newly created user.
         """
-        user = User.objects.create_user(**validated_data)
+        try:
+            user = User.objects.create_user(**validated_data)
+        except IntegrityError:
+            # With sharding, uniqueness across shards is only known to the user directory.
+            raise serializers.ValidationError({'username': ['A user with that username or email already exists.']})
         return user
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
+    # Properties over UserProfile.links, declared as the URLFields the model columns used to map to.
+    website = serializers.URLField(max_length=200, required=False, allow_blank=True)
+    facebook = serializers.URLField(max_length=200, required=False, allow_blank=True)
+    twitter = serializers.URLField(max_length=200, required=False, allow_blank=True)
+    instagram = serializers.URLField(max_length=200, required=False, allow_blank=True)
+    tiktok = serializers.URLField(max_length=200, required=False, allow_blank=True)
+    linkedin = serializers.URLField(max_length=200, required=False, allow_blank=True)
+    youtube = serializers.URLField(max_length=200, required=False, allow_blank=True)
+
     class Meta:
         model = UserProfile
         fields = ['avatar', 'bio', 'location', 'contact_number', 'website', 'facebook', 'twitter', 'instagram', 'tiktok', 'linkedin', 'youtube']
+
+
+class CompiledSerializer:
+    """
+    Produces the same representation as a serializer class for fixed-shape payloads, without
+    building the serializer's fields and an ordered ReturnDict on every call.
+
+    Field extractors are compiled once from the serializer's readable fields. Model-backed primitive
+    fields are read with a plain attribute getter; any other field falls back to its own
+    `get_attribute()`/`to_representation()`.
+    """
+
+    # Fields whose to_representation() returns model values of the matching type unchanged.
+    PRIMITIVE_FIELDS = (
+        serializers.CharField, serializers.EmailField, serializers.URLField,
+        serializers.IntegerField, serializers.BooleanField, serializers.ReadOnlyField,
+    )
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._extractors = None
+
+    def compile(self):
+        """
+        Builds the (field name, attribute getter, fallback field) extractors.
+        """
+        extractors = []
+        for field in self.serializer_class().fields.values():
+            if field.write_only:
+                continue
+            if type(field) in self.PRIMITIVE_FIELDS and len(field.source_attrs) == 1:
+                extractors.append((field.field_name, attrgetter(field.source_attrs[0]), None))
+            else:
+                extractors.append((field.field_name, None, field))
+        return extractors
+
+    def to_representation(self, instance):
+        """
+        Serializes an instance.
+
+        Args:
+            instance (Model): The instance to serialize.
+
+        Returns:
+            dict: The representation, with keys in the serializer's field order.
+        """
+        if self._extractors is None:
+            self._extractors = self.compile()
+
+        data = {}
+        for name, getter, field in self._extractors:
+            if getter is not None:
+                data[name] = getter(instance)
+                continue
+            try:
+                attribute = field.get_attribute(instance)
+            except SkipField:
+                continue
+            data[name] = None if attribute is None else field.to_representation(attribute)
+        return data
+
+
+_compiled_serializers = {}
+
+
+def serialize(serializer_class, instance):
+    """
+    Serializes an instance with the given serializer class.
+
+    When ACCOUNTS_FAST_SERIALIZATION is enabled, a CompiledSerializer is used, which renders to the
+    same JSON as `serializer_class(instance).data`.
+
+    Args:
+        serializer_class (type): The serializer class defining the payload.
+        instance (Model): The instance to serialize.
+
+    Returns:
+        dict: The serialized data.
+    """
+    if not getattr(settings, 'ACCOUNTS_FAST_SERIALIZATION', False):
+        return serializer_class(instance).data
+
+    compiled = _compiled_serializers.get(serializer_class)
+    if compiled is None:
+        compiled = _compiled_serializers[serializer_class] = CompiledSerializer(serializer_class)
+    return compiled.to_representation(instance)
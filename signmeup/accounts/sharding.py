@@ -0,0 +1,69 @@
+# accounts/sharding.py
+"""
+Horizontal sharding of the accounts tables by user id.
+
+With ACCOUNTS_SHARDS set to a list of database aliases, each user's CustomUser, UserProfile and
+DeviceToken rows live on the shard `ACCOUNTS_SHARDS[user_id % len(ACCOUNTS_SHARDS)]`. User ids are
+allocated by the UserDirectory table on the directory database ('default'), which also enforces
+case-insensitive uniqueness of usernames and emails across shards and resolves logins. Token keys
+start with the shard number in hex, so a token is found without a directory lookup.
+
+Without ACCOUNTS_SHARDS every function here returns None and queries use the normal routing.
+"""
+from django.conf import settings
+
+DIRECTORY_DATABASE = 'default'
+
+
+def shards():
+    """
+    Returns the aliases of the shards (ACCOUNTS_SHARDS, default none).
+    """
+    return getattr(settings, 'ACCOUNTS_SHARDS', ())
+
+
+def is_sharded():
+    return bool(shards())
+
+
+def db_for_user(user_id):
+    """
+    Returns the alias of the shard holding a user's rows, or None when sharding is off.
+
+    Args:
+        user_id (int): The primary key of the user.
+
+    Returns:
+        str: The database alias, or None.
+    """
+    aliases = shards()
+    if not aliases or user_id is None:
+        return None
+    return aliases[int(user_id) % len(aliases)]
+
+
+def token_key_prefix(user_id):
+    """
+    Returns the two hex digits identifying the user's shard at the start of token keys.
+    """
+    return f'{int(user_id) % len(shards()):02x}'
+
+
+def db_for_token_key(key):
+    """
+    Returns the alias of the shard holding a token, from the prefix of its key.
+
+    Args:
+        key (str): The token key.
+
+    Returns:
+        str: The database alias, or None when sharding is off or the prefix is not a shard.
+    """
+    aliases = shards()
+    if not aliases:
+        return None
+    try:
+        index = int(key[:2], 16)
+    except ValueError:
+        return None
+    return aliases[index] if index < len(aliases) else None
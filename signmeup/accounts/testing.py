@@ -0,0 +1,126 @@
+# accounts/testing.py
+"""
+Test helpers: a test runner reporting the slowest tests, and a reset of the app's per-process caches.
+
+The runner also empties those caches before destroying the test databases. Other runners should
+call reset_caches() once the tests are done, and leave ACCOUNTS_ACTIVITY_FLUSH_ON_EXIT off.
+
+Use the runner with TEST_RUNNER = 'accounts.testing.TimedTestRunner'. It works with
+`manage.py test --parallel`, where each test is timed in its worker process.
+"""
+import sys
+import time
+import unittest
+
+from django.test.runner import DiscoverRunner, ParallelTestSuite, RemoteTestResult, RemoteTestRunner
+
+from accounts.activity import activity
+from accounts.availability import taken_names
+from accounts.links import verification_links
+from accounts.token_cache import invalid_tokens, valid_tokens
+
+
+def reset_caches():
+    """
+    Clears the per-process state of the accounts app.
+
+    The rows this state describes are rolled back after each test, so tests sharing fixtures
+    (e.g. the same token key) should not see each other's cached answers.
+    """
+    activity.clear()
+    verification_links.reset()
+    invalid_tokens.clear()
+    valid_tokens.reset()
+    taken_names.reset()
+
+
+class TimedTextTestResult(unittest.TextTestResult):
+    """
+    A text test result recording the duration of each test.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.durations = {}
+        self._started = None
+
+    def startTest(self, test):
+        self._started = time.perf_counter()
+        super().startTest(test)
+
+    def stopTest(self, test):
+        super().stopTest(test)
+        # Tests run in parallel workers already reported their duration through addDuration.
+        self.durations.setdefault(test.id(), time.perf_counter() - self._started)
+
+    def addDuration(self, test, elapsed):
+        self.durations[test.id()] = elapsed
+
+
+class TimedRemoteTestResult(RemoteTestResult):
+    """
+    Sends the duration of each test from a parallel worker to the main process.
+    """
+
+    def startTest(self, test):
+        self._started = time.perf_counter()
+        super().startTest(test)
+
+    def stopTest(self, test):
+        self.events.append(('addDuration', self.test_index, time.perf_counter() - self._started))
+        super().stopTest(test)
+
+
+class TimedRemoteTestRunner(RemoteTestRunner):
+    resultclass = TimedRemoteTestResult
+
+
+class TimedParallelTestSuite(ParallelTestSuite):
+    runner_class = TimedRemoteTestRunner
+
+
+class TimedTestRunner(DiscoverRunner):
+    """
+    A DiscoverRunner printing the total test time and the slowest tests after the run.
+    """
+
+    parallel_test_suite = TimedParallelTestSuite
+
+    def __init__(self, slowest=10, **kwargs):
+        super().__init__(**kwargs)
+        self.slowest = slowest
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--slowest', type=int, default=10, help='Number of slowest tests to report (default 10).')
+
+    def get_resultclass(self):
+        # --debug-sql and --pdb keep their own result classes, without durations.
+        return super().get_resultclass() or TimedTextTestResult
+
+    def teardown_databases(self, old_config, **kwargs):
+        # Activity buffered by the last tests refers to test users; drop it before the test databases go.
+        reset_caches()
+        super().teardown_databases(old_config, **kwargs)
+
+    def run_suite(self, suite, **kwargs):
+        started = time.perf_counter()
+        result = super().run_suite(suite, **kwargs)
+        self.report(result, time.perf_counter() - started, getattr(suite, 'processes', 1))
+        return result
+
+    def report(self, result, elapsed, processes):
+        durations = getattr(result, 'durations', None)
+        if not durations:
+            return
+        total = sum(durations.values())
+        stream = sys.stderr
+        stream.write(
+            f'\nTests took {elapsed:.2f}s ({total:.2f}s of test time, '
+            f'{processes} process{"es" if processes > 1 else ""}).\n'
+        )
+        if self.slowest:
+            stream.write(f'Slowest {min(self.slowest, len(durations))} tests:\n')
+            for test_id, duration in sorted(durations.items(), key=lambda item: item[1], reverse=True)[:self.slowest]:
+                stream.write(f'  {duration:.3f}s  {test_id}\n')
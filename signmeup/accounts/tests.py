@@ -1,17 +1,66 @@
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
+import marshal
+import queue
+import threading
+import time
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
 from rest_framework.test import APITestCase
-from rest_framework import status
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
 from rest_framework.authtoken.models import Token
 
-from django.test import TestCase
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core import mail
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.asgi import ASGIRequest
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.db import DatabaseError, IntegrityError, connection, connections, transaction
+from django.db.models import QuerySet
+from django.test import RequestFactory, TestCase, TransactionTestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
-from accounts.models import UserProfile
+from accounts.activity import ActivityBuffer, activity
+from accounts.admin import LargeTablePaginator
+from accounts.data_migrations import copy_legacy_tokens
+from accounts.availability import taken_names
+from accounts.authentication import DeviceTokenAuthentication
+from accounts.bloom import BloomFilter
+from accounts import logs, profiling, routers, sharding
+from accounts.idempotency import idempotency_cache, request_fingerprint, store_key
+from accounts.links import verification_links
+from accounts.middleware import AsyncTokenExpirationMiddleware, ProfilingMiddleware, ReplicaPinningMiddleware, RequestIdMiddleware, TokenExpirationMiddleware
+from accounts.models import DeviceToken, UserDirectory, UserProfile
+from accounts.renderers import FastJSONRenderer
 from accounts.views import GlobalFunctions
-from accounts.serializers import UserSerializer, UserProfileSerializer
+from accounts.serializers import CompiledSerializer, UserSerializer, UserProfileSerializer
+from accounts.testing import TimedTestRunner, reset_caches
+from accounts.token_cache import invalid_tokens, valid_tokens
 
 User = get_user_model()
 
+
+def tearDownModule():
+    # With other test runners, activity buffered by the last tests would be flushed at exit otherwise.
+    reset_caches()
+
 # Tests for UserRegistrationView
 class UserRegistrationViewTestCase(APITestCase):
     """
@@ -34,14 +83,17 @@ class UserRegistrationViewTestCase(APITestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data['message'], 'A verification email has been sent to test@example.com for the user testuser.')
+        # Profiles are created by their first update.
+        self.assertFalse(UserProfile.objects.exists())
 
 # Tests for UserAuthenticationView
 class UserAuthenticationTestCase(APITestCase):
     """
     Test case for UserAuthenticationView.
     """
-    def setUp(self):
-        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User')
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User')
 
     def test_user_login(self):
         """
@@ -58,6 +110,39 @@ class UserAuthenticationTestCase(APITestCase):
         self.assertEqual(response.data['user']['username'], 'testuser')
         self.assertIn('token', response.data)
 
+    def test_user_login_by_email(self):
+        """
+        Test user login with the email address, in any case, in a single query.
+        """
+        url = reverse('user-login')
+
+        with self.assertNumQueries(1), self.assertLogs('accounts.auth', 'INFO'):
+            response = self.client.post(url, {'email': 'Test@Example.com', 'password': 'wrongpass'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.client.post(url, {'username': 'TEST@example.com', 'password': 'testpass'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['username'], 'testuser')
+
+    def test_user_login_rejects_non_string_credentials(self):
+        """
+        Test that JSON credentials which are not strings are rejected without a query.
+        """
+        for data in ({'username': 123, 'password': 'x'}, {'email': ['test@example.com'], 'password': 'x'}, {'username': 'testuser', 'password': 5}):
+            with self.assertNumQueries(0):
+                response = self.client.post(reverse('user-login'), data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_user_login_unknown_user(self):
+        """
+        Test that an unknown identifier is rejected like a wrong password.
+        """
+        with self.assertLogs('accounts.auth', 'INFO') as logs:
+            response = self.client.post(reverse('user-login'), {'username': 'nobody', 'password': 'testpass'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data['message'], 'Invalid credentials.')
+        self.assertEqual(logs.records[0].reason, 'unknown_user')
+
     def test_user_logout(self):
         """
         Test user logout.
@@ -68,28 +153,101 @@ class UserAuthenticationTestCase(APITestCase):
         self.client.force_authenticate(user=self.user)
         
         # Generate an authentication token for the user
-        token = Token.objects.create(user=self.user)
+        token = DeviceToken.objects.create(user=self.user)
         
         # Make the request with the Authorization header
         response = self.client.post(url, headers={'Authorization': f'Token {token.key}'})
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
         # Check if the user token is deleted or invalidated
-        self.assertFalse(Token.objects.filter(key=token.key).exists())
+        self.assertFalse(DeviceToken.objects.filter(key=token.key).exists())
 
         # Add an additional request to verify that the user is no longer authenticated
-        response = self.client.get(reverse('user-profile'), headers={'Authorization': f'Token {token.key}'})
+        with self.assertLogs('accounts.auth', 'INFO'):
+            response = self.client.get(reverse('user-profile'), headers={'Authorization': f'Token {token.key}'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_keeps_other_devices(self):
+        """
+        Test that each login gets its own token and logging out one device leaves the other logged in.
+        """
+        self.user.is_active = True
+        self.user.save()
+        url = reverse('user-login')
+        phone = self.client.post(url, {'username': 'testuser', 'password': 'testpass', 'device': 'phone'}).data['token']
+        laptop = self.client.post(url, {'username': 'testuser', 'password': 'testpass', 'device': 'laptop'}).data['token']
+        self.assertNotEqual(phone, laptop)
+
+        response = self.client.post(reverse('user-logout'), headers={'Authorization': f'Token {phone}'})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(reverse('user-profile'), headers={'Authorization': f'Token {laptop}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(ACCOUNTS_MAX_TOKENS_PER_USER=3)
+    def test_repeated_logins_from_one_device_keep_other_devices(self):
+        """
+        Test that logging in again on a device replaces its token instead of evicting the other devices.
+        """
+        self.user.is_active = True
+        self.user.save()
+        url = reverse('user-login')
+        laptop = self.client.post(url, {'username': 'testuser', 'password': 'testpass', 'device': 'laptop'}).data['token']
+        tablet = self.client.post(url, {'username': 'testuser', 'password': 'testpass'}, HTTP_USER_AGENT='tablet').data['token']
+        phones = [
+            self.client.post(url, {'username': 'testuser', 'password': 'testpass', 'device': 'phone'}).data['token']
+            for _ in range(5)
+        ]
+
+        self.assertEqual(set(DeviceToken.objects.filter(user=self.user).values_list('key', flat=True)), {laptop, tablet, phones[-1]})
+        with self.assertLogs('accounts.auth', 'INFO'):
+            response = self.client.get(reverse('user-profile'), headers={'Authorization': f'Token {phones[0]}'})
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_logins_with_the_same_user_agent_keep_each_other(self):
+        """
+        Test that two devices sending the same User-Agent and no device id both stay logged in.
+        """
+        self.user.is_active = True
+        self.user.save()
+        url = reverse('user-login')
+        first, second = [
+            self.client.post(url, {'username': 'testuser', 'password': 'testpass'}, HTTP_USER_AGENT='App/1.0 (iPhone)').data['token']
+            for _ in range(2)
+        ]
+        self.assertEqual(set(DeviceToken.objects.filter(user=self.user, device='App/1.0 (iPhone)').values_list('key', flat=True)), {first, second})
+
+    def test_login_rejects_non_string_device(self):
+        """
+        Test that a device label which is not a string is rejected instead of failing the request.
+        """
+        self.user.is_active = True
+        self.user.save()
+        response = self.client.post(reverse('user-login'), {'username': 'testuser', 'password': 'testpass', 'device': 5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DeviceToken.objects.filter(user=self.user).exists())
+
+    def test_logout_all(self):
+        """
+        Test that logging out everywhere revokes every token of the user.
+        """
+        self.user.is_active = True
+        self.user.save()
+        tokens = [DeviceToken.objects.issue(self.user, f'device{i}') for i in range(3)]
+
+        response = self.client.post(reverse('user-logout-all'), headers={'Authorization': f'Token {tokens[0].key}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(DeviceToken.objects.filter(user=self.user).exists())
+
 # Tests for VerifyEmailView
 class VerifyEmailViewTestCase(APITestCase):
     """
     Test case for VerifyEmailView.
     """
-    def setUp(self):
-        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User')
-        self.profile = UserProfile.objects.create(user=self.user)
-        self.verification_token = GlobalFunctions.generate_email_verification_token(self.user)
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User')
+        cls.profile = UserProfile.objects.create(user=cls.user)
+        cls.verification_token = GlobalFunctions.generate_email_verification_token(cls.user)
 
     def test_verify_email(self):
         """
@@ -111,9 +269,10 @@ class UserProfileViewTestCase(APITestCase):
     """
     Test case for UserProfileView.
     """
-    def setUp(self):
-        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User')
-        self.profile = UserProfile.objects.create(user=self.user)
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User')
+        cls.profile = UserProfile.objects.create(user=cls.user)
 
     def test_get_user_profile(self):
         """
@@ -156,6 +315,53 @@ class UserProfileViewTestCase(APITestCase):
         self.assertEqual(response.data['location'], 'Test City')
         self.assertEqual(response.data['contact_number'], '1234567890')
 
+    def test_update_links(self):
+        """
+        Test that the social links are stored in the links column and only non-empty ones are kept.
+        """
+        self.client.force_authenticate(user=self.user)
+        url = reverse('user-profile')
+        data = {'website': 'https://example.com', 'twitter': 'https://twitter.com/testuser', 'youtube': ''}
+
+        response = self.client.put(url, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['twitter'], 'https://twitter.com/testuser')
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.links, {'website': 'https://example.com', 'twitter': 'https://twitter.com/testuser'})
+
+        response = self.client.put(url, {'website': 'not a url'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_missing_profile_is_read_without_a_write(self):
+        """
+        Test that a user without a profile row gets the default profile and no row is created.
+        """
+        self.profile.delete()
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('user-profile'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['bio'], '')
+        self.assertIsNone(response.data['avatar'])
+        self.assertFalse(UserProfile.objects.exists())
+
+    def test_first_update_creates_the_profile(self):
+        """
+        Test that PATCH creates a missing profile and later PATCHes keep the fields they omit.
+        """
+        self.profile.delete()
+        self.client.force_authenticate(user=self.user)
+        url = reverse('user-profile')
+
+        response = self.client.patch(url, {'bio': 'This is a test bio.'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.patch(url, {'location': 'Test City'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['bio'], 'This is a test bio.')
+
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.bio, profile.location), ('This is a test bio.', 'Test City'))
+
 
 
 class UserDeleteViewTestCase(APITestCase):
@@ -163,16 +369,17 @@ class UserDeleteViewTestCase(APITestCase):
     Test case for UserDeleteView.
     """
 
-    def setUp(self):
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpass',
             first_name='Test',
             last_name='User'
         )
-        self.profile = UserProfile.objects.create(user=self.user)
-        self.token = Token.objects.create(user=self.user)
+        cls.profile = UserProfile.objects.create(user=cls.user)
+        cls.token = DeviceToken.objects.create(user=cls.user)
 
     def test_delete_user(self):
         """
@@ -197,7 +404,7 @@ class UserDeleteViewTestCase(APITestCase):
         self.assertFalse(UserProfile.objects.filter(user=self.user).exists())
 
         # Verify that the token is deleted or invalidated
-        self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+        self.assertFalse(DeviceToken.objects.filter(key=self.token.key).exists())
 
 # Optional: Add more test cases to cover edge cases and additional functionality
 
@@ -248,8 +455,9 @@ class UserProfileSerializerTestCase(TestCase):
     """
     Test case for UserProfileSerializer.
     """
-    def setUp(self):
-        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User')
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User')
 
     def test_user_profile_serializer(self):
         """
@@ -261,6 +469,34 @@ class UserProfileSerializerTestCase(TestCase):
         self.assertEqual(serializer.data['location'], 'Test location')
         # Add more assertions as needed
 
+class CompiledSerializerTestCase(TestCase):
+    """
+    Test case for CompiledSerializer and FastJSONRenderer.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Tést', last_name='User\u2028')
+
+    def assertSameJSON(self, serializer_class, instance):
+        expected = JSONRenderer().render(serializer_class(instance).data)
+        actual = FastJSONRenderer().render(CompiledSerializer(serializer_class).to_representation(instance))
+        self.assertEqual(actual, expected)
+
+    def test_user_payload_is_byte_identical(self):
+        """
+        Test that the compiled user payload renders to the same bytes as UserSerializer.
+        """
+        self.assertSameJSON(UserSerializer, self.user)
+
+    def test_profile_payload_is_byte_identical(self):
+        """
+        Test that the compiled profile payload renders to the same bytes as UserProfileSerializer.
+        """
+        profile = UserProfile.objects.create(user=self.user, bio='Test bio', website='https://example.com')
+        self.assertSameJSON(UserProfileSerializer, profile)
+        profile.avatar = 'accounts/avatars/test.png'
+        self.assertSameJSON(UserProfileSerializer, profile)
+
 
 
 
@@ -280,12 +516,33 @@ class CustomUserModelTestCase(TestCase):
         self.assertEqual(user.username, 'testuser')
         # Add more assertions as needed
 
+    def test_email_and_username_unique_case_insensitively(self):
+        """
+        Test that emails and usernames differing only in case are rejected.
+        """
+        User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User')
+        with transaction.atomic(), self.assertRaises(IntegrityError):
+            User.objects.create_user(username='other', email='TEST@example.com', password='testpass', first_name='Test', last_name='User')
+        with transaction.atomic(), self.assertRaises(IntegrityError):
+            User.objects.create_user(username='TestUser', email='other@example.com', password='testpass', first_name='Test', last_name='User')
+        self.assertEqual(User.objects.get(username__lower='testuser').email, 'test@example.com')
+
+    def test_lower_lookup_is_limited_to_username_and_email(self):
+        """
+        Test that the `__lower` lookup is registered on the user's username and email only.
+        """
+        self.assertIsNotNone(User._meta.get_field('username').get_transform('lower'))
+        self.assertIsNotNone(User._meta.get_field('email').get_transform('lower'))
+        self.assertIsNone(User._meta.get_field('first_name').get_transform('lower'))
+        self.assertIsNone(DeviceToken._meta.get_field('device').get_transform('lower'))
+
 class UserProfileModelTestCase(TestCase):
     """
     Test case for UserProfile model.
     """
-    def setUp(self):
-        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User')
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User')
 
     def test_user_profile_creation(self):
         """
@@ -296,3 +553,1140 @@ class UserProfileModelTestCase(TestCase):
         self.assertEqual(profile.bio, 'Test bio')
         self.assertEqual(profile.location, 'Test location')
         # Add more assertions as needed
+
+
+
+
+
+# Test cases for links.py
+class VerificationLinkTestCase(APITestCase):
+    """
+    Test case for the verification link builder.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User')
+
+    @override_settings(ACCOUNTS_VERIFICATION_BASE_URL='https://example.com/')
+    def test_build_with_base_url(self):
+        """
+        Test that a configured base URL is used as is.
+        """
+        request = RequestFactory().get('/', HTTP_HOST='internal:8000')
+        self.assertEqual(verification_links.build(request, 'abc'), f'https://example.com{reverse("verify-email")}?token=abc')
+
+    @override_settings(ACCOUNTS_VERIFICATION_HTTPS=True, ALLOWED_HOSTS=['api.example.com'])
+    def test_build_with_request_host(self):
+        """
+        Test that the request host is used with https when no base URL is configured.
+        """
+        request = RequestFactory().get('/', HTTP_HOST='api.example.com')
+        self.assertEqual(verification_links.build(request, 'abc'), f'https://api.example.com{reverse("verify-email")}?token=abc')
+
+    def test_build_with_site_domain_follows_request_scheme(self):
+        """
+        Test that the Site domain is resolved once while the scheme still follows each request.
+        """
+        self.addCleanup(verification_links.reset)
+        path = reverse('verify-email')
+        with mock.patch('accounts.links.apps.is_installed', return_value=True), \
+                mock.patch.object(verification_links, 'current_site_domain', return_value='example.com') as current_site_domain:
+            self.assertEqual(verification_links.build(RequestFactory().get('/'), 'abc'), f'http://example.com{path}?token=abc')
+            self.assertEqual(verification_links.build(RequestFactory().get('/', secure=True), 'abc'), f'https://example.com{path}?token=abc')
+        self.assertEqual(current_site_domain.call_count, 1)
+
+    @override_settings(ACCOUNTS_VERIFICATION_SIGNED_LINKS=True, ACCOUNTS_VERIFICATION_BASE_URL='https://example.com')
+    def test_signed_link(self):
+        """
+        Test that registration sends a signed link which verifies the user, and that tampered tokens are rejected without queries.
+        """
+        data = {
+            'username': 'signeduser',
+            'first_name': 'Signed',
+            'last_name': 'User',
+            'email': 'signed@example.com',
+            'password': 'testpassbrock',
+            'confirm_password': 'testpassbrock'
+        }
+        self.client.post(reverse('user-registration'), data)
+        link = mail.outbox[-1].body.rsplit(' ', 1)[1]
+        self.assertTrue(link.startswith(f'https://example.com{reverse("verify-email")}?token='))
+        token = link.split('?token=')[1]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('verify-email'), {'token': token[:-1] + ('A' if token[-1] != 'A' else 'B')})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(reverse('verify-email'), {'token': token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(User.objects.get(username='signeduser').email_verified)
+
+
+class DeviceTokenModelTestCase(TestCase):
+    """
+    Test case for the DeviceToken model.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User')
+
+    @override_settings(ACCOUNTS_MAX_TOKENS_PER_USER=2)
+    def test_issue_evicts_least_recently_used(self):
+        """
+        Test that issuing beyond the per-user cap revokes the least recently used tokens.
+        """
+        first = DeviceToken.objects.issue(self.user, 'first')
+        second = DeviceToken.objects.issue(self.user, 'second')
+        DeviceToken.objects.filter(pk=first.pk).update(last_used=timezone.now() + timezone.timedelta(minutes=1))
+
+        third = DeviceToken.objects.issue(self.user, 'third')
+        self.assertEqual(set(DeviceToken.objects.filter(user=self.user)), {first, third})
+        self.assertFalse(DeviceToken.objects.filter(pk=second.pk).exists())
+
+    def test_copy_legacy_tokens(self):
+        """
+        Test that rest_framework.authtoken keys are copied into device tokens once.
+        """
+        legacy = Token.objects.create(user=self.user)
+        schema_editor = SimpleNamespace(connection=connection)
+        copy_legacy_tokens(django_apps, schema_editor)
+        copy_legacy_tokens(django_apps, schema_editor)
+
+        token = DeviceToken.objects.get(key=legacy.key)
+        self.assertEqual((token.user, token.device), (self.user, 'legacy token'))
+        self.assertGreater(token.expires, timezone.now())
+
+    def test_revoke_all_is_one_statement(self):
+        """
+        Test that revoking all tokens runs a single DELETE.
+        """
+        for i in range(3):
+            DeviceToken.objects.issue(self.user, f'device{i}')
+        with self.assertNumQueries(1):
+            self.assertEqual(DeviceToken.objects.revoke_all(self.user), 3)
+
+
+# Test cases for activity.py
+class ActivityBufferTestCase(TestCase):
+    """
+    Test case for ActivityBuffer.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='testpass', first_name='Test', last_name='User')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.buffer = ActivityBuffer()
+
+    def test_record_is_buffered_until_flush(self):
+        """
+        Test that recording activity does not query the database and flushing writes the latest timestamp per user.
+        """
+        now = timezone.now()
+        with self.assertNumQueries(0):
+            self.buffer.record(self.users[0].pk, now - timezone.timedelta(days=10))
+            self.buffer.record(self.users[1].pk, now - timezone.timedelta(days=10))
+            self.buffer.record(self.users[1].pk, now)
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(list(User.objects.active_within(7)), [self.users[1]])
+        self.assertEqual(User.objects.active_within(30).count(), 2)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    @override_settings(ACCOUNTS_ACTIVITY_MAX_PENDING=2)
+    def test_flush_when_full(self):
+        """
+        Test that the buffer flushes itself once enough users are pending.
+        """
+        self.buffer.record(self.users[0].pk)
+        self.buffer.record(self.users[1].pk)
+        self.assertEqual(User.objects.filter(last_seen__isnull=False).count(), 2)
+
+    @override_settings(ACCOUNTS_ACTIVITY_MAX_PENDING=1)
+    def test_failed_flush_does_not_fail_the_request(self):
+        """
+        Test that a flush failing in a request is logged and its timestamps are written by the next flush.
+        """
+        with mock.patch.object(QuerySet, 'bulk_update', side_effect=DatabaseError('unavailable')):
+            with self.assertLogs('accounts.activity', 'WARNING') as logs:
+                self.buffer.record(self.users[0].pk)
+        self.assertEqual(logs.records[0].event, 'activity_flush_failed')
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertTrue(User.objects.filter(pk=self.users[0].pk, last_seen__isnull=False).exists())
+
+    def test_runner_teardown_drops_pending_activity(self):
+        """
+        Test that nothing buffered by the tests is left to flush once the test databases are torn down.
+        """
+        activity.record(self.users[0].pk)
+        TimedTestRunner(verbosity=0).teardown_databases([])
+        with self.assertNumQueries(0):
+            self.assertEqual(activity.flush(), 0)
+
+
+# Test cases for middleware.py
+class TokenExpirationMiddlewareTestCase(APITestCase):
+    """
+    Test case for TokenExpirationMiddleware.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User', is_active=True)
+        UserProfile.objects.create(user=cls.user)
+        cls.token = DeviceToken.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.url = reverse('user-profile')
+        # The token keys are shared by the tests; an expired one must not stay in the invalid-token cache.
+        reset_caches()
+
+    def test_valid_token(self):
+        """
+        Test that a valid token reaches the view.
+        """
+        response = self.client.get(self.url, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_expired_token(self):
+        """
+        Test that an expired token is rejected and deleted.
+        """
+        DeviceToken.objects.filter(pk=self.token.pk).update(expires=timezone.now())
+        with self.assertLogs('accounts.auth', 'INFO') as logs:
+            response = self.client.get(self.url, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(logs.records[0].event, 'expired_token')
+        self.assertFalse(DeviceToken.objects.filter(pk=self.token.pk).exists())
+
+    def test_valid_token_records_activity(self):
+        """
+        Test that authenticated requests are buffered as activity instead of written per request.
+        """
+        activity.clear()
+        self.client.get(self.url, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertIsNone(User.objects.get(pk=self.user.pk).last_seen)
+
+        activity.flush()
+        self.assertIsNotNone(User.objects.get(pk=self.user.pk).last_seen)
+
+    def test_malformed_headers_are_rejected_without_queries(self):
+        """
+        Test that headers without a key, or with a key that cannot exist, are rejected before the database.
+        """
+        for header in ('Token', 'Token ', f'Token {"a" * 41}', 'Token two parts'):
+            with self.assertNumQueries(0), self.assertLogs('accounts.auth', 'INFO'):
+                response = self.client.get(self.url, HTTP_AUTHORIZATION=header)
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED, header)
+
+    def test_excluded_paths_are_skipped(self):
+        """
+        Test that the admin site is not subject to token checks.
+        """
+        response = self.client.get('/admin/login/', HTTP_AUTHORIZATION='Token invalid')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_authentication_reuses_the_resolved_token(self):
+        """
+        Test that the view authenticates with the token loaded by the middleware instead of a second lookup.
+        """
+        # One query for the token and its user, one for the profile.
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_middleware_runs_on_the_event_loop(self):
+        """
+        Test that the async middleware is used as a coroutine under ASGI rather than adapted to a thread.
+        """
+        async def get_response(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(AsyncTokenExpirationMiddleware(get_response)))
+        self.assertFalse(iscoroutinefunction(AsyncTokenExpirationMiddleware(lambda request: HttpResponse())))
+
+    @override_settings(MIDDLEWARE=['accounts.middleware.AsyncTokenExpirationMiddleware'])
+    async def test_async_valid_and_expired_tokens(self):
+        """
+        Test valid and expired tokens with the async middleware through the ASGI handler.
+        """
+        response = await self.async_client.get(self.url, AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        await DeviceToken.objects.filter(pk=self.token.pk).aupdate(expires=timezone.now())
+        with self.assertLogs('accounts.auth', 'INFO'):
+            response = await self.async_client.get(self.url, AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(await DeviceToken.objects.filter(pk=self.token.pk).aexists())
+
+
+# Test cases for bloom.py and token_cache.py
+class TokenCacheTestCase(APITestCase):
+    """
+    Test case for the invalid-token cache and the Bloom filter of issued tokens.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User', is_active=True)
+
+    def setUp(self):
+        self.url = reverse('user-profile')
+        reset_caches()
+
+    def test_repeated_invalid_key_is_rejected_without_queries(self):
+        """
+        Test that a key found missing once is rejected from the cache afterwards, by the middleware and DRF.
+        """
+        key = 'f' * 40
+        with self.assertNumQueries(1), self.assertLogs('accounts.auth', 'INFO') as logs:
+            self.client.get(self.url, HTTP_AUTHORIZATION=f'Token {key}')
+        with self.assertNumQueries(0), self.assertLogs('accounts.auth', 'INFO') as cached_logs:
+            response = self.client.get(self.url, HTTP_AUTHORIZATION=f'Token {key}')
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                DeviceTokenAuthentication().authenticate_credentials(key)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(logs.records[0].reason, 'unknown')
+        self.assertEqual(cached_logs.records[0].reason, 'cached')
+        self.assertEqual(invalid_tokens.hits, 2)
+
+    def test_logged_out_key_is_cached(self):
+        """
+        Test that a key deleted at logout is rejected without a query afterwards.
+        """
+        token = DeviceToken.objects.issue(self.user)
+        response = self.client.post(reverse('user-logout'), HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        with self.assertNumQueries(0), self.assertLogs('accounts.auth', 'INFO'):
+            response = self.client.get(self.url, HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(ACCOUNTS_INVALID_TOKEN_CACHE_SIZE=2)
+    def test_cache_is_bounded(self):
+        """
+        Test that the oldest keys are dropped once the cache is full.
+        """
+        for key in ('a', 'b', 'c'):
+            invalid_tokens.add(key)
+        self.assertNotIn('a', invalid_tokens)
+        self.assertIn('c', invalid_tokens)
+        self.assertEqual(len(invalid_tokens), 2)
+
+    @override_settings(ACCOUNTS_INVALID_TOKEN_CACHE_TTL=0)
+    def test_cached_keys_expire(self):
+        """
+        Test that keys are forgotten after the TTL, so a key is never rejected for long without a lookup.
+        """
+        invalid_tokens.add('a')
+        self.assertNotIn('a', invalid_tokens)
+
+    @override_settings(ACCOUNTS_TOKEN_BLOOM_FILTER=True)
+    def test_bloom_filter_rejects_forged_keys_without_queries(self):
+        """
+        Test that the filter rejects never-issued keys in memory and lets issued ones through.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            token = DeviceToken.objects.issue(self.user)
+        with self.assertLogs('accounts.auth', 'INFO') as logs:
+            valid_tokens.rebuild()
+        self.assertEqual(logs.records[0].event, 'token_filter_rebuilt')
+        self.assertTrue(valid_tokens.might_contain(token.key))
+
+        with self.assertNumQueries(0), self.assertLogs('accounts.auth', 'INFO') as logs:
+            response = self.client.get(self.url, HTTP_AUTHORIZATION=f'Token {"0" * 40}')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(logs.records[0].reason, 'cached')
+
+        response = self.client.get(self.url, HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(valid_tokens.stats()['rejected'], 1)
+
+    @override_settings(ACCOUNTS_TOKEN_BLOOM_FILTER=True)
+    def test_bloom_filter_is_built_in_the_background(self):
+        """
+        Test that checks made before the filter is built let every key through and start one background rebuild.
+        """
+        with mock.patch.object(valid_tokens, 'schedule_rebuild') as schedule_rebuild, self.assertNumQueries(0):
+            self.assertTrue(valid_tokens.might_contain('0' * 40))
+        schedule_rebuild.assert_called_once_with()
+
+    @override_settings(ACCOUNTS_TOKEN_BLOOM_FILTER=True, ACCOUNTS_TOKEN_BLOOM_REFRESH_INTERVAL=0)
+    def test_bloom_filter_confirms_misses_once_behind(self):
+        """
+        Test that once a token is issued elsewhere, missing keys are left to the database and a rebuild is started.
+        """
+        with self.assertLogs('accounts.auth', 'INFO'):
+            valid_tokens.rebuild()
+        self.assertFalse(valid_tokens.might_contain('0' * 40))
+        # As if another process had issued the token: the row exists and the generation changed.
+        token = DeviceToken.objects.create(user=self.user)
+        valid_tokens.token_issued()
+
+        with mock.patch.object(valid_tokens, 'schedule_rebuild') as schedule_rebuild, self.assertNumQueries(0):
+            self.assertTrue(valid_tokens.might_contain(token.key))
+            self.assertTrue(valid_tokens.might_contain('0' * 40))
+        self.assertTrue(schedule_rebuild.called)
+        self.assertEqual(valid_tokens.stats()['confirmed'], 2)
+
+        with self.assertLogs('accounts.auth', 'INFO'):
+            valid_tokens.rebuild()
+        self.assertTrue(valid_tokens.might_contain(token.key))
+        self.assertFalse(valid_tokens.might_contain('0' * 40))
+
+    @override_settings(ACCOUNTS_TOKEN_BLOOM_FILTER=True)
+    def test_bloom_filter_rebuild_failure_is_logged(self):
+        """
+        Test that a failed background rebuild is logged, and not retried before the refresh interval.
+        """
+        with mock.patch.object(valid_tokens, 'rebuild', side_effect=DatabaseError('unavailable')):
+            with self.assertLogs('accounts.auth', 'WARNING') as logs:
+                valid_tokens.schedule_rebuild()
+                valid_tokens._thread.join()
+        self.assertEqual(logs.records[0].event, 'token_filter_rebuild_failed')
+        self.assertFalse(valid_tokens.rebuild_due())
+
+    def test_bloom_filter(self):
+        """
+        Test that the filter has no false negatives and about the configured false-positive rate.
+        """
+        bloom = BloomFilter(1000, error_rate=0.01)
+        keys = [f'key-{index}' for index in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f'other-{index}' in bloom for index in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+@override_settings(ACCOUNTS_TOKEN_BLOOM_FILTER=True)
+class TokenFilterThreadTestCase(TransactionTestCase):
+    """
+    Test case for the background rebuild of the token filter, which reads committed rows from its own connection.
+    """
+    def setUp(self):
+        reset_caches()
+        user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User', is_active=True)
+        self.token = DeviceToken.objects.issue(user)
+
+    def test_rebuild_in_background(self):
+        """
+        Test that the first check starts a background rebuild, after which forged keys are rejected.
+        """
+        with self.assertLogs('accounts.auth', 'INFO') as logs:
+            self.assertTrue(valid_tokens.might_contain('0' * 40))
+            valid_tokens._thread.join()
+        self.assertEqual(logs.records[0].event, 'token_filter_rebuilt')
+        self.assertTrue(valid_tokens.might_contain(self.token.key))
+        self.assertFalse(valid_tokens.might_contain('0' * 40))
+
+
+# Test cases for availability.py
+@override_settings(ACCOUNTS_AVAILABILITY_REFRESH_INTERVAL=3600)
+class AvailabilityTestCase(APITestCase):
+    """
+    Test case for the username and email availability endpoint.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='TakenName', email='taken@example.com', password='testpass', first_name='Test', last_name='User')
+
+    def setUp(self):
+        self.url = reverse('user-availability')
+        reset_caches()
+
+    def check(self, **params):
+        with self.assertLogs('accounts.availability', 'INFO') if taken_names._filter is None else contextlib.nullcontext():
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()['available']
+
+    def test_taken_values_are_confirmed_case_insensitively(self):
+        """
+        Test that values in use are reported as taken, whatever their case.
+        """
+        self.assertEqual(self.check(username='takenname', email='TAKEN@example.com'), {'username': False, 'email': False})
+
+    def test_free_values_are_answered_without_queries(self):
+        """
+        Test that once the filter is built, free values are answered from memory.
+        """
+        self.check(username='warmup')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.check(username='freename', email='free@example.com'), {'username': True, 'email': True})
+        self.assertEqual(taken_names.stats()['filtered'], 3)
+
+    def test_new_registrations_are_added(self):
+        """
+        Test that a user registered by this process is taken at once, and one created elsewhere after a refresh.
+        """
+        self.check(username='warmup')
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user(username='NewName', email='new@example.com', password='testpass', first_name='New', last_name='User')
+        self.assertEqual(self.check(username='newname'), {'username': False})
+
+        # As if another process had registered the user: only the refresh adds it to this filter.
+        User(username='Other', email='other@example.com', first_name='Other').save()
+        self.assertEqual(self.check(username='other'), {'username': True})
+        taken_names.refresh()
+        self.assertEqual(self.check(username='other'), {'username': False})
+
+    def test_invalid_requests(self):
+        """
+        Test that a request without values or with an overlong value is rejected.
+        """
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'username': 'a' * 151}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    @mock.patch.dict(api_settings.DEFAULT_THROTTLE_RATES, {'availability': '2/minute'})
+    def test_throttled_in_own_scope(self):
+        """
+        Test that availability checks are throttled at the rate of the 'availability' scope.
+        """
+        caches['default'].clear()
+        self.check(username='first')
+        self.check(username='second')
+        self.assertEqual(self.client.get(self.url, {'username': 'third'}).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        caches['default'].clear()
+
+    def test_stale_filter_is_rebuilt_once(self):
+        """
+        Test that requests finding the same stale filter rebuild it once: the later ones see it was rebuilt.
+        """
+        built_at = taken_names._built_at
+        with self.assertLogs('accounts.availability', 'INFO'):
+            taken_names.rebuild(built_at)
+        with self.assertNumQueries(0):
+            taken_names.rebuild(built_at)
+        self.assertEqual(taken_names.stats()['rebuilds'], 1)
+
+
+# Test cases for profiling.py
+@override_settings(ACCOUNTS_PROFILING=True)
+@modify_settings(MIDDLEWARE={'prepend': 'accounts.middleware.ProfilingMiddleware'})
+class ProfilingTestCase(APITestCase):
+    """
+    Test case for the profiling middleware and the admin profiling endpoints.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', email='admin@example.com', password='testpass', first_name='Admin', last_name='User', is_active=True, is_staff=True)
+        cls.user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User', is_active=True)
+        UserProfile.objects.create(user=cls.admin)
+
+    def setUp(self):
+        reset_caches()
+        profiling.profiling_cache().clear()
+        self.admin_token = DeviceToken.objects.issue(self.admin)
+        self.url = reverse('user-profile')
+
+    def profiled_get(self, **headers):
+        with self.assertLogs('accounts.profiling', 'INFO'):
+            response = self.client.get(self.url, HTTP_AUTHORIZATION=f'Token {self.admin_token.key}', **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response[profiling.PROFILE_ID_HEADER]
+
+    def admin_get(self, url, **params):
+        return self.client.get(url, params, HTTP_AUTHORIZATION=f'Token {self.admin_token.key}')
+
+    @override_settings(ACCOUNTS_PROFILING=False)
+    def test_middleware_is_not_used_when_disabled(self):
+        """
+        Test that the middleware removes itself from the chain when profiling is off.
+        """
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: HttpResponse())
+
+    def test_request_with_admin_token_is_profiled(self):
+        """
+        Test that a request sent with an admin's profiling token is profiled, with its SQL, and can be downloaded.
+        """
+        response = self.client.post(reverse('profiling-token'), HTTP_AUTHORIZATION=f'Token {self.admin_token.key}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['header'], profiling.HEADER)
+        self.assertNotIn(profiling.PROFILE_ID_HEADER, response)
+
+        profile_id = self.profiled_get(HTTP_X_PROFILE_TOKEN=response.data['token'])
+
+        profiles = self.admin_get(reverse('profile-list')).json()['profiles']
+        self.assertEqual([profile['id'] for profile in profiles], [profile_id])
+        self.assertEqual(profiles[0]['path'], self.url)
+        self.assertEqual(profiles[0]['mode'], 'cprofile')
+
+        profile = self.admin_get(reverse('profile-detail', args=[profile_id])).json()
+        self.assertEqual(profile['summary']['query_count'], len(profile['queries']))
+        self.assertTrue(any('accounts_devicetoken' in query['sql'] for query in profile['queries']))
+        self.assertIn('function calls', profile['report'])
+
+        response = self.admin_get(reverse('profile-detail', args=[profile_id]), download=1)
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="{profile_id}.prof"')
+        self.assertIsInstance(marshal.loads(response.content), dict)
+
+    def test_request_with_invalid_token_is_not_profiled(self):
+        """
+        Test that a forged or expired profiling token does not enable profiling.
+        """
+        token = profiling.make_token(self.admin)
+        with override_settings(ACCOUNTS_PROFILING_TOKEN_MAX_AGE=-1):
+            response = self.client.get(self.url, HTTP_AUTHORIZATION=f'Token {self.admin_token.key}', HTTP_X_PROFILE_TOKEN=token)
+        self.assertNotIn(profiling.PROFILE_ID_HEADER, response)
+        response = self.client.get(self.url, HTTP_AUTHORIZATION=f'Token {self.admin_token.key}', HTTP_X_PROFILE_TOKEN=f'{token}x')
+        self.assertNotIn(profiling.PROFILE_ID_HEADER, response)
+        self.assertEqual(profiling.recent_profiles(), [])
+
+    @override_settings(ACCOUNTS_PROFILING_SAMPLE_RATE=1.0, ACCOUNTS_PROFILING_MODE='sampling')
+    def test_sampled_request_is_profiled_with_stack_sampler(self):
+        """
+        Test that sampled requests are profiled without a token, and download as folded stacks.
+        """
+        profile_id = self.profiled_get()
+        with self.assertLogs('accounts.profiling', 'INFO'):
+            response = self.admin_get(reverse('profile-detail', args=[profile_id]), download=1)
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="{profile_id}.folded"')
+        for line in response.content.decode().splitlines():
+            self.assertRegex(line, r'^\S+ \d+$')
+
+    @override_settings(ACCOUNTS_PROFILING_SAMPLE_RATE=1.0)
+    def test_storage_failure_does_not_fail_the_request(self):
+        """
+        Test that a profile that cannot be stored is logged and the request still succeeds, without a profile id.
+        """
+        with mock.patch.object(profiling, 'store_profile', side_effect=ConnectionError('cache unavailable')):
+            with self.assertLogs('accounts.profiling', 'WARNING') as logs:
+                response = self.client.get(self.url, HTTP_AUTHORIZATION=f'Token {self.admin_token.key}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn(profiling.PROFILE_ID_HEADER, response)
+        self.assertEqual(logs.records[0].event, 'profile_store_failed')
+
+    @override_settings(ACCOUNTS_PROFILING_SAMPLE_RATE=1.0)
+    def test_asgi_requests_are_not_profiled(self):
+        """
+        Test that requests served through ASGI are passed through unprofiled.
+        """
+        middleware = ProfilingMiddleware(lambda request: HttpResponse())
+        request = ASGIRequest({'type': 'http', 'method': 'GET', 'path': self.url, 'headers': []}, BytesIO())
+        self.assertNotIn(profiling.PROFILE_ID_HEADER, middleware(request))
+        self.assertEqual(profiling.recent_profiles(), [])
+
+    def test_stack_sampler_samples_the_enabling_thread(self):
+        """
+        Test that the stack sampler samples the thread that enables it, not the one that created it.
+        """
+        sampler = profiling.StackSampler(0.001)
+
+        def sampled_work():
+            sampler.enable()
+            deadline = time.monotonic() + 2
+            while not sampler.stacks and time.monotonic() < deadline:
+                pass
+            sampler.disable()
+
+        thread = threading.Thread(target=sampled_work)
+        thread.start()
+        thread.join()
+        self.assertTrue(sampler.stacks)
+        self.assertTrue(all(stack.endswith(':sampled_work') for stack in sampler.stacks))
+
+    def test_endpoints_require_admin(self):
+        """
+        Test that profiling tokens and profiles are only available to admins.
+        """
+        token = DeviceToken.objects.issue(self.user)
+        for method, url in (('post', reverse('profiling-token')), ('get', reverse('profile-list')), ('get', reverse('profile-detail', args=['missing']))):
+            response = getattr(self.client, method)(url, HTTP_AUTHORIZATION=f'Token {token.key}')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.admin_get(reverse('profile-detail', args=['missing'])).status_code, status.HTTP_404_NOT_FOUND)
+
+
+# Test cases for logs.py
+class LoggingTestCase(TestCase):
+    """
+    Test case for the JSON formatter, sampling filter, queue handler and request ids.
+    """
+    def make_record(self, **extra):
+        record = logging.LogRecord('accounts.auth', logging.INFO, __file__, 1, 'Invalid %s', ('token',), None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_formatter(self):
+        """
+        Test that records become one JSON object with the request id and extra attributes.
+        """
+        reset_token = logs.request_id.set('abc123')
+        try:
+            line = logs.JSONFormatter().format(self.make_record(event='invalid_token', reason='unknown'))
+        finally:
+            logs.request_id.reset(reset_token)
+        entry = json.loads(line)
+        self.assertEqual(entry['message'], 'Invalid token')
+        self.assertEqual(entry['request_id'], 'abc123')
+        self.assertEqual((entry['event'], entry['reason']), ('invalid_token', 'unknown'))
+        self.assertNotIn('\n', line)
+
+    def test_sampling_filter(self):
+        """
+        Test that an event passes a burst, then one record in `rate`, reporting the suppressed count.
+        """
+        sampling = logs.SamplingFilter(burst=3, interval=60, rate=10)
+        passed = [record for record in (self.make_record(event='invalid_token') for _ in range(23)) if sampling.filter(record)]
+        self.assertEqual(len(passed), 5)
+        self.assertEqual([getattr(record, 'suppressed', 0) for record in passed], [0, 0, 0, 9, 9])
+        self.assertTrue(sampling.filter(self.make_record()))
+
+    def test_queue_handler_drops_when_full(self):
+        """
+        Test that a full queue drops records instead of blocking, and that queued records are prepared.
+        """
+        handler = logs.QueueHandler(queue.Queue(maxsize=1))
+        handler.handle(self.make_record())
+        handler.handle(self.make_record())
+        self.assertEqual(handler.dropped, 1)
+        record = handler.queue.get_nowait()
+        self.assertEqual((record.msg, record.args), ('Invalid token', None))
+
+    def test_request_id_middleware(self):
+        """
+        Test that well-formed incoming request ids are kept and others replaced.
+        """
+        seen = []
+        def view(request):
+            seen.append(logs.request_id.get())
+            return HttpResponse()
+
+        middleware = RequestIdMiddleware(view)
+        response = middleware(RequestFactory().get('/', HTTP_X_REQUEST_ID='req-42'))
+        self.assertEqual(response['X-Request-ID'], 'req-42')
+        response = middleware(RequestFactory().get('/', HTTP_X_REQUEST_ID='bad id\n'))
+        self.assertEqual(len(response['X-Request-ID']), 32)
+        self.assertEqual(seen, ['req-42', response['X-Request-ID']])
+        self.assertIsNone(logs.request_id.get())
+
+
+# Test cases for idempotency.py
+class IdempotencyTestCase(APITestCase):
+    """
+    Test case for Idempotency-Key support on registration and profile updates.
+    """
+    def setUp(self):
+        idempotency_cache().clear()
+        self.data = {
+            'username': 'testuser',
+            'first_name': 'Test',
+            'last_name': 'User',
+            'email': 'test@example.com',
+            'password': 'testpassbrock',
+            'confirm_password': 'testpassbrock'
+        }
+
+    def test_registration_retry_is_replayed(self):
+        """
+        Test that a retried registration returns the first response without registering or mailing again.
+        """
+        url = reverse('user-registration')
+        first = self.client.post(url, self.data, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+
+        with self.assertNumQueries(0):
+            retry = self.client.post(url, self.data, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(mail.outbox), 1)
+
+        # Without a key, the duplicate runs the view and is rejected.
+        response = self.client.post(url, self.data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_fingerprint_is_keyed(self):
+        """
+        Test that the stored body fingerprint is an HMAC keyed with SECRET_KEY, not a plain hash of the password.
+        """
+        request = Request(RequestFactory().post('/', self.data, content_type='application/json'), parsers=[JSONParser()])
+        fingerprint = request_fingerprint(request)
+        payload = json.dumps(self.data, sort_keys=True, separators=(',', ':'))
+        self.assertNotEqual(fingerprint, hashlib.sha256(payload.encode()).hexdigest()[:32])
+        with override_settings(SECRET_KEY='another-secret-key'):
+            self.assertNotEqual(request_fingerprint(request), fingerprint)
+
+    def test_key_reused_with_different_body(self):
+        """
+        Test that reusing a key for a different request is rejected.
+        """
+        url = reverse('user-registration')
+        self.client.post(url, self.data, HTTP_IDEMPOTENCY_KEY='abc')
+        response = self.client.post(url, dict(self.data, username='other'), HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_in_flight_key_conflicts(self):
+        """
+        Test that a request arriving while the first one with the same key runs gets 409.
+        """
+        url = reverse('user-registration')
+        self.client.post(url, self.data, HTTP_IDEMPOTENCY_KEY='first')
+        cache_key = store_key(Request(RequestFactory().post(url)), 'in-flight')
+        idempotency_cache().add(f'{cache_key}:lock', 1)
+
+        response = self.client.post(url, self.data, HTTP_IDEMPOTENCY_KEY='in-flight')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_profile_keys_are_scoped_to_the_user(self):
+        """
+        Test that the same key used by two users updates both profiles.
+        """
+        url = reverse('user-profile')
+        for username in ('first', 'second'):
+            user = User.objects.create_user(username=username, email=f'{username}@example.com', password='testpass', first_name='Test', last_name='User')
+            self.client.force_authenticate(user=user)
+            for _ in range(2):
+                response = self.client.put(url, {'bio': f'Bio of {username}'}, HTTP_IDEMPOTENCY_KEY='same')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['Idempotent-Replayed'], 'true')
+            self.assertEqual(UserProfile.objects.get(user=user).bio, f'Bio of {username}')
+
+
+# Test cases for routers.py
+@override_settings(ACCOUNTS_READ_REPLICAS=['replica'])
+class ReplicaRouterTestCase(TestCase):
+    """
+    Test case for ReplicaRouter and ReplicaPinningMiddleware.
+    """
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+
+    def run_request(self, function, *args):
+        """
+        Runs a function in a fresh context, as a new request would.
+        """
+        def run():
+            routers._primary_pinned.set(False)
+            return function(*args)
+        return contextvars.copy_context().run(run)
+
+    def test_reads_go_to_the_primary_after_a_write(self):
+        """
+        Test that reads use a replica until the request writes, and that routing a write does not count as one.
+        """
+        def request():
+            before = self.router.db_for_read(User), self.router.db_for_write(User), self.router.db_for_read(User)
+            routers.pin_primary()
+            return (*before, self.router.db_for_read(User))
+        self.assertEqual(self.run_request(request), ('replica', 'default', 'replica', 'default'))
+
+    def test_pin_outside_a_request_does_nothing(self):
+        """
+        Test that writes outside the middleware (commands, tasks) do not pin the thread to the primary.
+        """
+        def command():
+            routers.pin_primary()
+            return self.router.db_for_read(User)
+        self.assertEqual(contextvars.copy_context().run(command), 'replica')
+
+    def test_middleware_pins_on_sql_writes_only(self):
+        """
+        Test that the middleware pins requests running an INSERT, UPDATE or DELETE, and not reads routed as writes.
+        """
+        user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User')
+
+        def read_view(request):
+            User.objects.db_manager(self.router.db_for_write(User)).get(pk=user.pk)
+            return HttpResponse()
+
+        def write_view(request):
+            User.objects.filter(pk=user.pk).update(first_name='Updated')
+            return HttpResponse()
+
+        response = contextvars.copy_context().run(ReplicaPinningMiddleware(read_view), RequestFactory().get('/'))
+        self.assertNotIn('accounts_primary', response.cookies)
+        response = contextvars.copy_context().run(ReplicaPinningMiddleware(write_view), RequestFactory().post('/'))
+        self.assertIn('accounts_primary', response.cookies)
+
+    @override_settings(ACCOUNTS_READ_REPLICAS=[])
+    def test_without_replicas(self):
+        """
+        Test that everything uses the primary when no replica is configured.
+        """
+        self.assertEqual(self.run_request(self.router.db_for_read, User), 'default')
+
+    def test_middleware_pins_the_client_after_a_write(self):
+        """
+        Test that a writing request sets the pinning cookie, and that requests carrying it read from the primary.
+        """
+        def write_view(request):
+            routers.pin_primary()
+            return HttpResponse()
+
+        reads = []
+        def read_view(request):
+            reads.append(self.router.db_for_read(User))
+            return HttpResponse()
+
+        response = self.run_request(ReplicaPinningMiddleware(write_view), RequestFactory().post('/'))
+        self.assertIn('accounts_primary', response.cookies)
+
+        pinned_request = RequestFactory().get('/')
+        pinned_request.COOKIES['accounts_primary'] = '1'
+        response = self.run_request(ReplicaPinningMiddleware(read_view), pinned_request)
+        self.assertNotIn('accounts_primary', response.cookies)
+        self.run_request(ReplicaPinningMiddleware(read_view), RequestFactory().get('/'))
+        self.assertEqual(reads, ['default', 'replica'])
+
+    async def test_async_write_pins_the_client(self):
+        """
+        Test that a write made by a sync view in a worker thread sets the cookie under ASGI.
+        """
+        @sync_to_async
+        def write_view(request):
+            routers.pin_primary()
+            return HttpResponse()
+
+        pinned_before = routers._primary_pinned.get()
+        response = await ReplicaPinningMiddleware(write_view)(RequestFactory().post('/'))
+        self.assertIn('accounts_primary', response.cookies)
+        # The pin ends with the request.
+        self.assertEqual(routers._primary_pinned.get(), pinned_before)
+
+
+@skipUnless('replica' in settings.DATABASES, "Needs a 'replica' alias mirroring 'default', as in core/settings_test.py.")
+@override_settings(ACCOUNTS_READ_REPLICAS=['replica'], ACCOUNTS_ACTIVITY_MAX_PENDING=1)
+class ReplicaReadsTestCase(TransactionTestCase):
+    """
+    Test case for the reads of requests sent through the middleware to a replica.
+
+    The rows are committed, so the replica's connection can read them.
+    """
+    # The runner sets up the databases of skipped test cases too, so the alias must exist.
+    databases = {'default', 'replica'} if 'replica' in settings.DATABASES else {'default'}
+
+    def setUp(self):
+        with override_settings(ACCOUNTS_READ_REPLICAS=[]):
+            user = User.objects.create_user(username='testuser', email='test@example.com', password='testpass', first_name='Test', last_name='User', is_active=True)
+            self.token = DeviceToken.objects.issue(user)
+            DeviceToken.objects.filter(pk=self.token.pk).update(last_used=timezone.now() - timezone.timedelta(hours=1))
+        reset_caches()
+
+    def test_bookkeeping_writes_do_not_pin(self):
+        """
+        Test that the token refresh and the last_seen flush of a GET request leave its reads on the replica.
+        """
+        reads = []
+        def read_view(request):
+            reads.append(routers.ReplicaRouter().db_for_read(User))
+            return HttpResponse()
+
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = contextvars.copy_context().run(ReplicaPinningMiddleware(TokenExpirationMiddleware(read_view)), request)
+        self.assertEqual(reads, ['replica'])
+        self.assertNotIn('accounts_primary', response.cookies)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 2)
+        self.assertIsNotNone(User.objects.get(username='testuser').last_seen)
+
+    def test_writes_pin(self):
+        """
+        Test that other writes of a request still send its later reads to the primary.
+        """
+        reads = []
+        def write_view(request):
+            reads.append(routers.ReplicaRouter().db_for_read(User))
+            UserProfile.objects.create(user=request.device_token.user)
+            reads.append(routers.ReplicaRouter().db_for_read(User))
+            return HttpResponse()
+
+        request = RequestFactory().post('/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = contextvars.copy_context().run(ReplicaPinningMiddleware(TokenExpirationMiddleware(write_view)), request)
+        self.assertEqual(reads, ['replica', 'default'])
+        self.assertIn('accounts_primary', response.cookies)
+
+
+# Test cases for sharding.py
+@override_settings(ACCOUNTS_SHARDS=['default'])
+class ShardingTestCase(APITestCase):
+    """
+    Test case for the sharded registration and login paths, with a single shard.
+    """
+    def register(self, username, email):
+        data = {
+            'username': username,
+            'first_name': 'Test',
+            'last_name': 'User',
+            'email': email,
+            'password': 'testpassbrock',
+            'confirm_password': 'testpassbrock'
+        }
+        return self.client.post(reverse('user-registration'), data)
+
+    def test_registration_allocates_ids_in_the_directory(self):
+        """
+        Test that the directory allocates the user id and rejects case-insensitive duplicates.
+        """
+        self.assertEqual(self.register('ShardUser', 'shard@example.com').status_code, status.HTTP_201_CREATED)
+        entry = UserDirectory.objects.get()
+        self.assertEqual((entry.username, entry.email), ('sharduser', 'shard@example.com'))
+        self.assertEqual(User.objects.get(username='ShardUser').pk, entry.pk)
+
+        self.assertEqual(self.register('sharduser', 'other@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(UserDirectory.objects.count(), 1)
+
+    def test_login_and_token_routing(self):
+        """
+        Test that login resolves the user through the directory and token keys carry the shard.
+        """
+        self.register('ShardUser', 'shard@example.com')
+        User.objects.filter(username='ShardUser').update(is_active=True)
+
+        response = self.client.post(reverse('user-login'), {'email': 'SHARD@example.com', 'password': 'testpassbrock'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        token = response.data['token']
+        self.assertTrue(token.startswith('00'))
+
+        response = self.client.get(reverse('user-profile'), HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.delete(reverse('user-delete'), HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(UserDirectory.objects.exists())
+
+    def test_availability_uses_the_directory(self):
+        """
+        Test that availability checks read the usernames and emails from the directory.
+        """
+        self.register('ShardUser', 'shard@example.com')
+        taken_names.reset()
+        with self.assertLogs('accounts.availability', 'INFO'):
+            response = self.client.get(reverse('user-availability'), {'username': 'SHARDUSER', 'email': 'free@example.com'})
+        self.assertEqual(response.json()['available'], {'username': False, 'email': True})
+
+
+# Test cases for admin.py
+class LargeTablePaginatorTestCase(TestCase):
+    """
+    Test case for LargeTablePaginator.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(5):
+            User.objects.create_user(username=f'testuser{i}', email=f'test{i}@example.com', password='testpass', first_name='Test', last_name='User')
+
+    def test_pk_seek_matches_offset_pagination(self):
+        """
+        Test that seeking by primary key returns the same pages as offset pagination.
+        """
+        for ordering in ('pk', '-pk'):
+            queryset = User.objects.order_by(ordering)
+            paginator = LargeTablePaginator(queryset, 2)
+            for number in paginator.page_range:
+                expected = list(queryset[(number - 1) * 2:number * 2])
+                self.assertEqual(list(paginator.page(number)), expected)
+
+    def test_user_changelist(self):
+        """
+        Test that the user changelist renders with the large table admin.
+        """
+        admin_user = User.objects.create_user(username='admin', email='admin@example.com', password='testpass', first_name='Admin', last_name='User', is_staff=True, is_superuser=True, is_active=True)
+        self.client.force_login(admin_user)
+
+        response = self.client.get(reverse('admin:accounts_customuser_changelist') + '?q=test1@example.com')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('admin:accounts_userprofile_changelist'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_changelist_searches_exact_key(self):
+        """
+        Test that searching tokens by key compares the key exactly, without UPPER() or LIKE defeating its index.
+        """
+        admin_user = User.objects.create_user(username='admin', email='admin@example.com', password='testpass', first_name='Admin', last_name='User', is_staff=True, is_superuser=True, is_active=True)
+        self.client.force_login(admin_user)
+        token = DeviceToken.objects.issue(User.objects.get(username='testuser1'))
+        DeviceToken.objects.issue(User.objects.get(username='testuser2'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:accounts_devicetoken_changelist'), {'q': token.key.upper()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['cl'].result_list), [token])
+        key_queries = [query['sql'] for query in queries if token.key in query['sql']]
+        self.assertTrue(key_queries)
+        for sql in key_queries:
+            self.assertNotIn('UPPER(', sql)
+            self.assertNotIn('LIKE', sql)
+
+
+
+
+
+# Test cases for management commands
+class GenerateUsersCommandTestCase(TestCase):
+    """
+    Test case for the generate_users management command.
+    """
+    def generate(self, **options):
+        call_command('generate_users', 20, stdout=StringIO(), **options)
+        return list(User.objects.order_by('username').values_list('username', 'first_name', 'last_name', 'is_active'))
+
+    def test_generate_users(self):
+        """
+        Test that users, profiles and tokens are created with the shared password.
+        """
+        self.generate()
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(UserProfile.objects.count(), 20)
+        self.assertEqual(DeviceToken.objects.count(), User.objects.filter(is_active=True).count())
+        self.assertTrue(User.objects.get(username='user0').check_password('benchmark-password'))
+
+    def test_generate_users_is_deterministic(self):
+        """
+        Test that the same seed produces the same rows.
+        """
+        first = self.generate(seed=7, chunk_size=6)
+        User.objects.all().delete()
+        self.assertEqual(self.generate(seed=7, chunk_size=6), first)
+
+    @override_settings(ACCOUNTS_SHARDS=['default'])
+    def test_generate_sharded_users(self):
+        """
+        Test that with sharding, ids are allocated by the user directory and token keys carry the shard prefix.
+        """
+        self.generate()
+        directory = dict(UserDirectory.objects.values_list('username', 'pk'))
+        self.assertEqual(directory, dict(User.objects.values_list('username', 'pk')))
+        self.assertEqual(len(directory), 20)
+        for key, user_id in DeviceToken.objects.values_list('key', 'user_id'):
+            self.assertTrue(key.startswith(sharding.token_key_prefix(user_id)))
+
+        # Registration allocates the next id from the directory without colliding with the generated users.
+        user = User.objects.create_user(username='newuser', email='new@example.com', password='testpass', first_name='New', last_name='User')
+        self.assertEqual(UserDirectory.objects.get(username='newuser').pk, user.pk)
+
+    @override_settings(ACCOUNTS_SHARDS=['default'])
+    def test_database_is_rejected_with_sharding(self):
+        """
+        Test that inserting straight into a shard alias is refused, as it would bypass the user directory.
+        """
+        with self.assertRaises(CommandError):
+            self.generate(database='default')
+        self.assertFalse(User.objects.exists())
+
+
+class PruneEmptyProfilesCommandTestCase(TestCase):
+    """
+    Test case for the prune_empty_profiles management command.
+    """
+    def test_prune_empty_profiles(self):
+        """
+        Test that only profiles holding nothing but defaults are deleted, across several batches.
+        """
+        for index in range(5):
+            user = User.objects.create_user(username=f'empty{index}', email=f'empty{index}@example.com', password='testpass', first_name='Test', last_name='User')
+            UserProfile.objects.create(user=user)
+        kept = [
+            UserProfile.objects.create(user=User.objects.create_user(username=f'kept{index}', email=f'kept{index}@example.com', password='testpass', first_name='Test', last_name='User'), **fields)
+            for index, fields in enumerate([{'bio': 'Test bio'}, {'website': 'https://example.com'}, {'avatar': 'accounts/avatars/test.png'}])
+        ]
+
+        out = StringIO()
+        call_command('prune_empty_profiles', dry_run=True, stdout=out)
+        self.assertIn('5 empty profile(s)', out.getvalue())
+        self.assertEqual(UserProfile.objects.count(), 8)
+
+        call_command('prune_empty_profiles', batch_size=2, stdout=out)
+        self.assertQuerysetEqual(UserProfile.objects.order_by('pk'), kept)
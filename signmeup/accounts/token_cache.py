@@ -0,0 +1,320 @@
+# accounts/token_cache.py
+"""
+In-memory rejection of token keys that cannot authenticate, before any database query.
+
+`invalid_tokens` remembers the keys recently found missing from the database, so a client repeating
+a forged or revoked key costs a dict lookup instead of a query. It is bounded by
+ACCOUNTS_INVALID_TOKEN_CACHE_SIZE keys (default 10000, 0 disables it), each kept for
+ACCOUNTS_INVALID_TOKEN_CACHE_TTL seconds (default 60).
+
+`valid_tokens` is an optional Bloom filter of every issued key (ACCOUNTS_TOKEN_BLOOM_FILTER, default
+off), which also rejects keys never seen before. It is built from the token table in a background
+thread, rebuilt every ACCOUNTS_TOKEN_BLOOM_REBUILD_INTERVAL seconds (default 3600), and lets through
+about ACCOUNTS_TOKEN_BLOOM_ERROR_RATE of the forged keys (default 0.01), which are then looked up as
+usual. Issuing a token changes a generation value in the cache ACCOUNTS_TOKEN_BLOOM_CACHE (default
+'default'). While the generation differs from the one the filter was built at, keys missing from
+the filter are looked up in the database rather than rejected, and the filter is rebuilt after
+ACCOUNTS_TOKEN_BLOOM_REFRESH_INTERVAL seconds (default 60). The filter therefore needs a cache shared
+by all worker processes (e.g. REDIS_URL), or new tokens would be rejected by the other processes
+until their next rebuild.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import connections
+
+from accounts import routers, sharding
+from accounts.bloom import BloomFilter
+
+logger = logging.getLogger('accounts.auth')
+
+
+class InvalidTokenCache:
+    """
+    A bounded set of token keys known to be invalid, each expiring after a TTL.
+
+    The oldest keys are dropped first when the cache is full.
+    """
+
+    def __init__(self):
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def __contains__(self, key):
+        expires = self._keys.get(key)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            self.discard(key)
+            return False
+        self.hits += 1
+        return True
+
+    def add(self, key):
+        """
+        Remembers a key that was not found in the database.
+
+        Args:
+            key (str): The token key.
+        """
+        max_size = getattr(settings, 'ACCOUNTS_INVALID_TOKEN_CACHE_SIZE', 10000)
+        if not max_size:
+            return
+        ttl = getattr(settings, 'ACCOUNTS_INVALID_TOKEN_CACHE_TTL', 60)
+        with self._lock:
+            self._keys[key] = time.monotonic() + ttl
+            self._keys.move_to_end(key)
+            while len(self._keys) > max_size:
+                self._keys.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._keys.clear()
+            self.hits = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class ValidTokenFilter:
+    """
+    A Bloom filter of the issued token keys, telling keys that were never issued from possible ones.
+
+    The filter is built from the token table in a background thread, so no request waits for the
+    scan: until it is ready, every key may be valid. It only rejects a key while no token was issued
+    since it was built; after that, missing keys are confirmed in the database by the caller's
+    lookup until the next rebuild, which is started at most every
+    ACCOUNTS_TOKEN_BLOOM_REFRESH_INTERVAL seconds (default 60). While ACCOUNTS_TOKEN_BLOOM_FILTER
+    is off, every key may be valid.
+    """
+
+    generation_key = 'accounts:token-generation'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._epoch = 0
+        self.reset()
+
+    def reset(self, **kwargs):
+        """
+        Drops the filter and its counters; the next check starts a rebuild.
+        """
+        with self._lock:
+            # A rebuild running meanwhile does not install its filter.
+            self._epoch += 1
+            self._filter = None
+            self._generation = None
+            self._built_at = 0
+            self._attempted_at = None
+            self.passed = 0
+            self.rejected = 0
+            self.confirmed = 0
+            self.false_positives = 0
+            self.rebuilds = 0
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'ACCOUNTS_TOKEN_BLOOM_FILTER', False)
+
+    def cache(self):
+        return caches[getattr(settings, 'ACCOUNTS_TOKEN_BLOOM_CACHE', 'default')]
+
+    def might_contain(self, key):
+        """
+        Tells whether a key may belong to an issued token.
+
+        Args:
+            key (str): The token key.
+
+        Returns:
+            bool: False if the key was never issued, True if it may have been (or the filter is off,
+            not built yet, or older than the newest token).
+        """
+        if not self.enabled:
+            return True
+        return self._check(key, self.cache().get(self.generation_key))
+
+    async def amight_contain(self, key):
+        """
+        The asynchronous version of might_contain.
+        """
+        if not self.enabled:
+            return True
+        return self._check(key, await self.cache().aget(self.generation_key))
+
+    def _check(self, key, generation):
+        bloom, changed = self._filter, generation != self._generation
+        if self.rebuild_due(changed):
+            self.schedule_rebuild()
+        if bloom is None or key in bloom:
+            self.passed += 1
+            return True
+        if changed:
+            # Tokens were issued since the filter was built: only the database can tell.
+            self.confirmed += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def rebuild_due(self, generation_changed=False):
+        """
+        Tells whether the filter is missing, older than ACCOUNTS_TOKEN_BLOOM_REBUILD_INTERVAL seconds
+        (default 3600), or missing tokens issued since it was built. Rebuilds start at most every
+        ACCOUNTS_TOKEN_BLOOM_REFRESH_INTERVAL seconds, including after a failed one.
+        """
+        now = time.monotonic()
+        refresh_interval = getattr(settings, 'ACCOUNTS_TOKEN_BLOOM_REFRESH_INTERVAL', 60)
+        if self._attempted_at is not None and now - self._attempted_at < refresh_interval:
+            return False
+        if self._filter is None or generation_changed:
+            return True
+        return now - self._built_at >= getattr(settings, 'ACCOUNTS_TOKEN_BLOOM_REBUILD_INTERVAL', 3600)
+
+    def schedule_rebuild(self):
+        """
+        Starts rebuilding the filter in a background thread, unless a rebuild is already running.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._attempted_at = time.monotonic()
+            self._thread = threading.Thread(target=self._rebuild_in_background, name='accounts-token-filter', daemon=True)
+            self._thread.start()
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.warning('Token filter rebuild failed', exc_info=True, extra={'event': 'token_filter_rebuild_failed'})
+        finally:
+            # The thread's own connections, which no request cycle closes.
+            for database in self.databases():
+                connections[database].close()
+
+    def databases(self):
+        # Tokens are read from the primary: a replica may not have the newest ones yet.
+        return sharding.shards() or [routers.PRIMARY_DATABASE]
+
+    def rebuild(self):
+        """
+        Builds a new filter from all the tokens in the database, with room for twice their number.
+
+        Runs in the calling thread; requests start it in a background thread (see schedule_rebuild).
+        """
+        from accounts.models import DeviceToken
+
+        with self._lock:
+            epoch = self._epoch
+            self._attempted_at = time.monotonic()
+        started = time.perf_counter()
+        # The generation is read before the tokens, so a token issued meanwhile marks the filter as behind.
+        generation = self.cache().get(self.generation_key)
+        count = sum(DeviceToken.objects.using(database).count() for database in self.databases())
+        error_rate = getattr(settings, 'ACCOUNTS_TOKEN_BLOOM_ERROR_RATE', 0.01)
+        bloom = BloomFilter(max(2 * count, 10000), error_rate)
+        for database in self.databases():
+            self._load(bloom, database)
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._filter, self._generation = bloom, generation
+            self._built_at = time.monotonic()
+            self.rebuilds += 1
+        logger.info(
+            'Token filter rebuilt',
+            extra={
+                'event': 'token_filter_rebuilt',
+                'tokens': len(bloom),
+                'bytes': bloom.nbytes,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+                **self.stats(),
+            },
+        )
+
+    def _load(self, bloom, database):
+        """
+        Adds the keys of all the tokens of a database to a filter.
+        """
+        from accounts.models import DeviceToken
+
+        for key in DeviceToken.objects.using(database).values_list('key', flat=True).iterator(chunk_size=2000):
+            bloom.add(key)
+
+    def token_issued(self, key=None):
+        """
+        Adds a new token to this process's filter and tells the other processes theirs are behind.
+
+        Call it once the token is committed.
+
+        Args:
+            key (str, optional): The key of the new token; omit it after creating tokens in bulk.
+        """
+        if not self.enabled:
+            return
+        if key is not None and self._filter is not None:
+            self._filter.add(key)
+        self.cache().set(self.generation_key, uuid.uuid4().hex, None)
+
+    def record_false_positive(self):
+        """
+        Counts a key the filter let through but the database did not have: a forged key, or a deleted token.
+        """
+        if self.enabled:
+            self.false_positives += 1
+
+    def stats(self):
+        """
+        Returns the filter's counters, for logs and monitoring.
+
+        Returns:
+            dict: passed, rejected, confirmed (missing keys left to the database as the filter was
+            behind) and false_positives are counts of checked keys; rebuilds counts the loads from
+            the database.
+        """
+        return {
+            'passed': self.passed,
+            'rejected': self.rejected,
+            'confirmed': self.confirmed,
+            'false_positives': self.false_positives,
+            'rebuilds': self.rebuilds,
+        }
+
+
+def is_known_invalid(key):
+    """
+    Tells whether a token key is rejected by the caches, without a database query.
+    """
+    return key in invalid_tokens or not valid_tokens.might_contain(key)
+
+
+async def ais_known_invalid(key):
+    """
+    The asynchronous version of is_known_invalid.
+    """
+    return key in invalid_tokens or not await valid_tokens.amight_contain(key)
+
+
+def token_missing(key):
+    """
+    Records a token key that was looked up but not found in the database.
+    """
+    invalid_tokens.add(key)
+    valid_tokens.record_false_positive()
+
+
+invalid_tokens = InvalidTokenCache()
+valid_tokens = ValidTokenFilter()
+setting_changed.connect(invalid_tokens.clear)
+setting_changed.connect(valid_tokens.reset)
@@ -1,13 +1,18 @@
 # accounts/urls.py
 from django.urls import path
-from accounts.views import UserRegistrationView, UserLoginView, UserProfileView, VerifyEmailView, UserLogoutView, UserDeleteView
+from accounts.views import AvailabilityView, ProfileDetailView, ProfileListView, ProfilingTokenView, UserRegistrationView, UserLoginView, UserProfileView, VerifyEmailView, UserLogoutView, UserLogoutAllView, UserDeleteView
 
 urlpatterns = [
     path('register/', UserRegistrationView.as_view(), name='user-registration'),
+    path('availability/', AvailabilityView.as_view(), name='user-availability'),
     path('login/', UserLoginView.as_view(), name='user-login'),
     path('logout/', UserLogoutView.as_view(), name='user-logout'),
+    path('logout-all/', UserLogoutAllView.as_view(), name='user-logout-all'),
     path('profile/', UserProfileView.as_view(), name='user-profile'),
     path('verify-email/', VerifyEmailView.as_view(), name='verify-email'),
     path('delete/', UserDeleteView.as_view(), name='user-delete'),
+    path('profiling/', ProfileListView.as_view(), name='profile-list'),
+    path('profiling/token/', ProfilingTokenView.as_view(), name='profiling-token'),
+    path('profiling/<str:profile_id>/', ProfileDetailView.as_view(), name='profile-detail'),
 
 ]
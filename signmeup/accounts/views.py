@@ -1,25 +1,35 @@
 # accounts/views.py
+import logging
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status, authentication, permissions
-from rest_framework.authtoken.models import Token
+from rest_framework import status, permissions
+from rest_framework.settings import api_settings
+from rest_framework.throttling import ScopedRateThrottle
 
 
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
-from django.urls import reverse
 from django.core.mail import EmailMessage
 from django.contrib.auth import authenticate
 
 from django.conf import settings
-from django.contrib.sites.shortcuts import get_current_site
+from django.http import Http404, HttpResponse
+from django.db import IntegrityError, router, transaction
 
 
-from accounts.serializers import UserSerializer, UserProfileSerializer
+from accounts import profiling, sharding, token_cache
+from accounts.activity import activity
+from accounts.availability import FIELDS as AVAILABILITY_FIELDS, taken_names
+from accounts.authentication import DeviceTokenAuthentication
+from accounts.idempotency import idempotent
+from accounts.links import is_signed_token, verification_links
+from accounts.serializers import UserSerializer, UserProfileSerializer, serialize
 from accounts.models import CustomUser as User
-from accounts.models import UserProfile
+from accounts.models import DeviceToken, UserProfile
+
+logger = logging.getLogger('accounts.auth')
 
 class GlobalFunctions:
     @staticmethod
@@ -27,12 +37,17 @@ class GlobalFunctions:
         """
         Generates a unique email verification token for the user.
 
+        With ACCOUNTS_VERIFICATION_SIGNED_LINKS enabled, a short signed token is generated instead.
+
         Args:
             user (User): The user for whom the token is generated.
 
         Returns:
             str: The generated email verification token.
         """
+        if getattr(settings, 'ACCOUNTS_VERIFICATION_SIGNED_LINKS', False):
+            return verification_links.make_signed_token(user)
+
         token_generator = default_token_generator
         uid = urlsafe_base64_encode(force_bytes(user.pk))
         token = token_generator.make_token(user)
@@ -51,9 +66,7 @@ class GlobalFunctions:
             verification_token (str): The verification token.
             username (str): The username of the user.
         """
-        current_site = get_current_site(request)
-        verification_url = reverse('verify-email')
-        absolute_url = f"http://{current_site.domain}{verification_url}?token={verification_token}"
+        absolute_url = verification_links.build(request, verification_token)
         subject = 'Verify Your Email'
         message = f'Hello {username},\n\nClick the following link to verify your email: {absolute_url}'
         from_email = settings.EMAIL_HOST_USER
@@ -62,25 +75,33 @@ class GlobalFunctions:
         email.send()
 
     @staticmethod
-    def generate_token(user):
+    def generate_token(user, device='', replace=False):
         """
-        Generates a token for the user.
+        Generates a token for one of the user's devices.
+
+        Every call issues a new token; with `replace`, it replaces the user's tokens with the same device
+        label. The user's least recently used tokens are revoked beyond the per-user cap.
 
         Args:
             user (User): The user for whom the token is generated.
+            device (str, optional): A label for the device.
+            replace (bool, optional): Whether the label is a device id chosen by the client.
 
         Returns:
             str: The generated token.
         """
-        token, created = Token.objects.get_or_create(user=user)
-        return token.key
+        return DeviceToken.objects.issue(user, device, replace=replace).key
 
 
 class UserRegistrationView(APIView):
+    @idempotent
     def post(self, request):
         """
         Handles the registration of a new user.
 
+        Retries carrying the same Idempotency-Key header get the first response, without a second
+        registration or verification email.
+
         Args:
             request (HttpRequest): The current request.
 
@@ -91,8 +112,7 @@ class UserRegistrationView(APIView):
         
         if serializer.is_valid():
             user = serializer.save()
-            # Create a user profile
-            UserProfile.objects.create(user=user)
+            # The profile is created by its first update, not here.
 
             verification_token = GlobalFunctions.generate_email_verification_token(user)
             GlobalFunctions.send_verification_email(request, user.email, verification_token, user.username)
@@ -106,6 +126,49 @@ class UserRegistrationView(APIView):
     
     
 
+class AvailabilityRateThrottle(ScopedRateThrottle):
+    """
+    Throttles the 'availability' scope, so checks sent while a signup form is typed in do not use up
+    the anonymous budget of registration and login.
+
+    The rate is DEFAULT_THROTTLE_RATES['availability'] when set, else ACCOUNTS_AVAILABILITY_RATE
+    (default '120/minute').
+    """
+
+    def get_rate(self):
+        rates = api_settings.DEFAULT_THROTTLE_RATES or {}
+        return rates.get(self.scope) or getattr(settings, 'ACCOUNTS_AVAILABILITY_RATE', '120/minute')
+
+
+class AvailabilityView(APIView):
+    throttle_classes = [AvailabilityRateThrottle]
+    throttle_scope = 'availability'
+
+    def get(self, request):
+        """
+        Tells whether a username and/or an email address are free, for live feedback in signup forms.
+
+        Most checks are answered from an in-memory filter without a query (see accounts.availability).
+        The answer is advisory: registration still rejects values taken meanwhile.
+
+        Args:
+            request (HttpRequest): The current request, with `username` and/or `email` query parameters.
+
+        Returns:
+            Response: The response mapping each checked field to whether its value is available.
+        """
+        values = {field: request.query_params.get(field, '').strip() for field in AVAILABILITY_FIELDS}
+        values = {field: value for field, value in values.items() if value}
+        if not values:
+            return Response({'message': 'Provide a username or an email.'}, status=status.HTTP_400_BAD_REQUEST)
+        for field, value in values.items():
+            if len(value) > User._meta.get_field(field).max_length:
+                return Response({'message': f'The {field} is too long.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        available = {field: taken_names.is_available(field, value) for field, value in values.items()}
+        return Response({'available': available}, status=status.HTTP_200_OK)
+
+
 class VerifyEmailView(APIView):
     def get(self, request):
         """
@@ -118,13 +181,24 @@ class VerifyEmailView(APIView):
             Response: The response containing the verification status and token.
         """
         token = request.GET.get('token')
+        if not token:
+            return Response({'message': 'Invalid verification token.'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            uidb64, token = token.split('_', 1)
-            uid = force_str(urlsafe_base64_decode(uidb64))
-            user = User.objects.get(pk=uid)
+            if is_signed_token(token):
+                # The signature and age are checked before the user is loaded.
+                uid = verification_links.check_signed_token(token)
+                if uid is None:
+                    return Response({'message': 'Invalid verification token.'}, status=status.HTTP_400_BAD_REQUEST)
+                user = User.objects.db_manager(sharding.db_for_user(uid)).get(pk=uid)
+                valid = True
+            else:
+                uidb64, token = token.split('_', 1)
+                uid = force_str(urlsafe_base64_decode(uidb64))
+                user = User.objects.db_manager(sharding.db_for_user(uid)).get(pk=uid)
+                valid = default_token_generator.check_token(user, token)
 
-            if default_token_generator.check_token(user, token):
+            if valid:
                 user.email_verified = True
                 user.is_active = True
                 user.save()
@@ -156,28 +230,46 @@ class UserLoginView(APIView):
         """
         Handles user authentication and token generation.
 
+        The user is identified by 'username' or 'email'; either value is matched against both fields.
+
         Args:
             request (HttpRequest): The current request.
 
         Returns:
             Response: The response containing the authentication status and token.
         """
-        username = request.data.get('username')
+        identifier = request.data.get('username') or request.data.get('email')
         password = request.data.get('password')
 
-        if not username or not password:
+        if not identifier or not password:
             return Response({'message': 'Username and password are required.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        user = User.objects.filter(username=username).first()
-        if not user or not user.check_password(password):
+        if not isinstance(identifier, str) or not isinstance(password, str):
+            return Response({'message': 'Username and password must be strings.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = User.objects.get_by_login(identifier)
+        if user is None:
+            # Hash anyway, so unknown identifiers take as long as wrong passwords.
+            User().set_password(password)
+            logger.info('Login failed', extra={'event': 'login_failed', 'reason': 'unknown_user'})
+            return Response({'message': 'Invalid credentials.'}, status=status.HTTP_401_UNAUTHORIZED)
+        if not user.check_password(password):
+            logger.info('Login failed', extra={'event': 'login_failed', 'reason': 'wrong_password', 'user_id': user.pk})
             return Response({'message': 'Invalid credentials.'}, status=status.HTTP_401_UNAUTHORIZED)
 
-        token = GlobalFunctions.generate_token(user)
+        # Only a device id sent by the client replaces that device's previous token; devices sharing a
+        # User-Agent (same app build, same browser) must not log each other out.
+        device = request.data.get('device')
+        if device is not None and not isinstance(device, str):
+            return Response({'message': 'The device must be a string.'}, status=status.HTTP_400_BAD_REQUEST)
+        if device:
+            token = GlobalFunctions.generate_token(user, device, replace=True)
+        else:
+            token = GlobalFunctions.generate_token(user, request.headers.get('User-Agent', ''))
+        activity.record(user.pk)
 
-        serializer = UserSerializer(user)
         data = {
             'token': token,
-            'user': serializer.data
+            'user': serialize(UserSerializer, user)
         }
         return Response(data, status=status.HTTP_200_OK)
 
@@ -185,7 +277,7 @@ class UserLoginView(APIView):
 class UserLogoutView(APIView):
     def post(self, request):
         """
-        Logs out the user by deleting the authentication token.
+        Logs out the current device by deleting its authentication token. The user's other devices stay logged in.
 
         Args:
             request (HttpRequest): The current request.
@@ -195,39 +287,57 @@ class UserLogoutView(APIView):
         """
         auth_header = request.headers.get('Authorization')
         if auth_header:
-            token_key = auth_header.split(' ')[1]
-            try:
-                token = Token.objects.get(key=token_key)
-                token.delete()
+            token_key = auth_header[6:].strip() if auth_header[:6].lower() == 'token ' else ''
+            deleted, _ = DeviceToken.objects.db_manager(sharding.db_for_token_key(token_key)).filter(key=token_key).delete()
+            if deleted:
+                token_cache.invalid_tokens.add(token_key)
                 return Response({'message': 'Logged out successfully.'}, status=status.HTTP_204_NO_CONTENT)
-            except Token.DoesNotExist:
-                return Response({'message': 'Invalid token.'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'message': 'Invalid token.'}, status=status.HTTP_400_BAD_REQUEST)
         else:
             return Response({'message': 'No token provided.'}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class UserLogoutAllView(APIView):
+    authentication_classes = [DeviceTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """
+        Logs out all of the user's devices by revoking every token in a single statement.
+
+        Args:
+            request (HttpRequest): The current request.
+
+        Returns:
+            Response: The response indicating the number of revoked tokens.
+        """
+        revoked = DeviceToken.objects.revoke_all(request.user)
+        return Response({'message': f'Logged out of {revoked} device(s).'}, status=status.HTTP_200_OK)
+
+
     
 class UserProfileView(APIView):
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [DeviceTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         """
         Retrieves the user's profile.
 
+        Users who never updated their profile have no row; they get the default profile without a write.
+
         Args:
             request (HttpRequest): The current request.
 
         Returns:
             Response: The response containing the user's profile data.
         """
-        profile, created = UserProfile.objects.get_or_create(user=request.user)
-        serializer = UserProfileSerializer(profile)
-        return Response(serializer.data)
-        
+        return Response(serialize(UserProfileSerializer, self.get_profile(request.user)))
+
+    @idempotent
     def put(self, request):
         """
-        Updates the user's profile.
+        Updates the user's profile, creating it on the first update.
 
         Args:
             request (HttpRequest): The current request.
@@ -235,18 +345,70 @@ class UserProfileView(APIView):
         Returns:
             Response: The response containing the updated profile data or error messages.
         """
-        profile, created = UserProfile.objects.get_or_create(user=request.user)
+        return self.update_profile(request, partial=False)
 
-        serializer = UserProfileSerializer(profile, data=request.data)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    @idempotent
+    def patch(self, request):
+        """
+        Updates the given fields of the user's profile, creating it on the first update.
+
+        Args:
+            request (HttpRequest): The current request.
+
+        Returns:
+            Response: The response containing the updated profile data or error messages.
+        """
+        return self.update_profile(request, partial=True)
+
+    @staticmethod
+    def get_profile(user):
+        """
+        Returns the user's profile, or an unsaved default profile if the user has none yet.
+
+        Args:
+            user (User): The user.
+
+        Returns:
+            UserProfile: The profile.
+        """
+        try:
+            return UserProfile.objects.db_manager(sharding.db_for_user(user.pk)).get(user=user)
+        except UserProfile.DoesNotExist:
+            return UserProfile(user=user)
+
+    def update_profile(self, request, partial):
+        """
+        Validates and saves an update of the user's profile.
+
+        Args:
+            request (HttpRequest): The current request.
+            partial (bool): Whether fields missing from the request keep their values.
+
+        Returns:
+            Response: The response containing the updated profile data or error messages.
+        """
+        profile = self.get_profile(request.user)
+        serializer = UserProfileSerializer(profile, data=request.data, partial=partial)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic(using=router.db_for_write(UserProfile, instance=profile)):
+                profile = serializer.save()
+        except IntegrityError:
+            if profile.pk is not None:
+                raise
+            # The profile was created concurrently (or has not reached the replica yet); the reads
+            # are on the primary now, so apply the update to the existing row.
+            serializer = UserProfileSerializer(self.get_profile(request.user), data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            profile = serializer.save()
+        return Response(serialize(UserProfileSerializer, profile))
 
 
 
 class UserDeleteView(APIView):
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [DeviceTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def delete(self, request):
@@ -259,8 +421,73 @@ class UserDeleteView(APIView):
         Returns:
             Response: The response indicating the account deletion status.
         """
-        user = request.user
-        user_profile = UserProfile.objects.get(user=user)
-        user_profile.delete()
-        user.delete()
+        # The profile and tokens are deleted by the cascade, on the user's shard when sharded.
+        request.user.delete()
         return Response({'message': 'Account deleted successfully.'}, status=status.HTTP_204_NO_CONTENT)
+
+
+class ProfilingTokenView(APIView):
+    authentication_classes = [DeviceTokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        """
+        Issues a token which enables profiling for the requests sending it in the X-Profile-Token header.
+
+        Args:
+            request (HttpRequest): The current request, from an admin.
+
+        Returns:
+            Response: The response containing the token, the header to send it in and its lifetime.
+        """
+        return Response({
+            'token': profiling.make_token(request.user),
+            'header': profiling.HEADER,
+            'expires_in': getattr(settings, 'ACCOUNTS_PROFILING_TOKEN_MAX_AGE', 3600),
+        }, status=status.HTTP_200_OK)
+
+
+class ProfileListView(APIView):
+    authentication_classes = [DeviceTokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        """
+        Lists the recent request profiles, newest first.
+
+        Args:
+            request (HttpRequest): The current request, from an admin.
+
+        Returns:
+            Response: The response containing the profile summaries.
+        """
+        return Response({'profiles': profiling.recent_profiles()}, status=status.HTTP_200_OK)
+
+
+class ProfileDetailView(APIView):
+    authentication_classes = [DeviceTokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, profile_id):
+        """
+        Returns a request profile with its report and SQL, or with `?download=1`, the profile file.
+
+        The file holds pstats data for cProfile profiles (open it with pstats or snakeviz), or folded
+        stacks for sampled ones (open it with a flame graph tool).
+
+        Args:
+            request (HttpRequest): The current request, from an admin.
+            profile_id (str): The id of the profile, from the X-Profile-Id response header.
+
+        Returns:
+            Response: The response containing the profile.
+        """
+        profile = profiling.get_profile(profile_id)
+        if profile is None:
+            raise Http404
+        if request.query_params.get('download'):
+            extension = 'prof' if profile['summary']['mode'] == 'cprofile' else 'folded'
+            response = HttpResponse(profile['raw'], content_type='application/octet-stream')
+            response['Content-Disposition'] = f'attachment; filename="{profile_id}.{extension}"'
+            return response
+        return Response({key: profile[key] for key in ('summary', 'report', 'queries')}, status=status.HTTP_200_OK)
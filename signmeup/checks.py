@@ -0,0 +1,89 @@
+"""
+Checks for settings that slow down a signmeup project in production.
+
+Used by `signmeup checksettings`, which loads the settings of an existing project and reports
+each finding with a code, so individual findings can be looked up and discussed.
+"""
+
+
+ACCOUNTS_MIDDLEWARE = 'accounts.middleware.TokenExpirationMiddleware'
+
+# Middleware the accounts middleware should run before, so requests with a rejected token skip them.
+HEAVY_MIDDLEWARE = (
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+)
+
+# DRF defaults, used when REST_FRAMEWORK does not override them.
+DRF_DEFAULT_RENDERERS = ['rest_framework.renderers.JSONRenderer', 'rest_framework.renderers.BrowsableAPIRenderer']
+DRF_DEFAULT_PARSERS = ['rest_framework.parsers.JSONParser', 'rest_framework.parsers.FormParser', 'rest_framework.parsers.MultiPartParser']
+DRF_DEFAULT_AUTHENTICATION = ['rest_framework.authentication.SessionAuthentication', 'rest_framework.authentication.BasicAuthentication']
+
+# Hashers that are deliberately expensive, flagged only when they come first and hash new passwords.
+SLOW_HASHERS = (
+    'django.contrib.auth.hashers.BCryptPasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+)
+
+
+def check_settings(settings):
+    """
+    Inspects a settings object for slow production configuration.
+
+    Args:
+        settings: An object exposing the project's settings as attributes (e.g. django.conf.settings).
+
+    Returns:
+        list: (code, message) tuples, one per finding.
+    """
+    findings = []
+
+    if getattr(settings, 'DEBUG', False):
+        findings.append(('S001', 'DEBUG is enabled: every SQL query is recorded in memory and errors render full debug pages.'))
+
+    for alias, database in getattr(settings, 'DATABASES', {}).items():
+        if not database.get('CONN_MAX_AGE'):
+            findings.append(('S002', f"DATABASES['{alias}'] has CONN_MAX_AGE = 0: a new database connection is opened for every request."))
+
+    caches = getattr(settings, 'CACHES', None) or {}
+    backend = caches.get('default', {}).get('BACKEND', '')
+    if not caches or backend.endswith('LocMemCache'):
+        findings.append(('S003', 'The default cache is per-process memory: throttling, idempotency keys, the token filter and request profiles are not shared between workers.'))
+    elif backend.endswith('DummyCache'):
+        findings.append(('S003', 'The default cache is DummyCache: nothing is cached and throttling cannot work.'))
+
+    rest_framework = getattr(settings, 'REST_FRAMEWORK', None) or {}
+    renderers = rest_framework.get('DEFAULT_RENDERER_CLASSES', DRF_DEFAULT_RENDERERS)
+    if 'rest_framework.renderers.BrowsableAPIRenderer' in renderers:
+        findings.append(('S004', 'The browsable API renderer is enabled: browsers get HTML pages rendered with templates and forms.'))
+
+    parsers = rest_framework.get('DEFAULT_PARSER_CLASSES', DRF_DEFAULT_PARSERS)
+    if 'rest_framework.parsers.FormParser' in parsers:
+        findings.append(('S005', 'FormParser is enabled: the JSON API only needs JSONParser (and MultiPartParser for uploads).'))
+
+    authentication = rest_framework.get('DEFAULT_AUTHENTICATION_CLASSES', DRF_DEFAULT_AUTHENTICATION)
+    if 'rest_framework.authentication.BasicAuthentication' in authentication:
+        findings.append(('S006', 'BasicAuthentication is enabled: every request carrying credentials runs a full password hash.'))
+    if 'rest_framework.authentication.SessionAuthentication' in authentication:
+        findings.append(('S006', 'SessionAuthentication is enabled: token clients pay for session lookups and CSRF checks.'))
+
+    if not rest_framework.get('DEFAULT_THROTTLE_CLASSES'):
+        findings.append(('S007', 'No DRF throttling is configured: login and registration can be flooded with password hashing work.'))
+
+    middleware = list(getattr(settings, 'MIDDLEWARE', []))
+    if ACCOUNTS_MIDDLEWARE in middleware:
+        position = middleware.index(ACCOUNTS_MIDDLEWARE)
+        before = [name for name in HEAVY_MIDDLEWARE if name in middleware[:position]]
+        if before:
+            findings.append(('S008', f'{ACCOUNTS_MIDDLEWARE} runs after {", ".join(before)}: rejected tokens still pay for them.'))
+
+    hashers = getattr(settings, 'PASSWORD_HASHERS', None)
+    if hashers and hashers[0] in SLOW_HASHERS:
+        findings.append(('S009', f'{hashers[0]} hashes new passwords: check that its cost parameters fit the login rate.'))
+
+    if not getattr(settings, 'ACCOUNTS_FAST_SERIALIZATION', False):
+        findings.append(('S010', 'ACCOUNTS_FAST_SERIALIZATION is off: login and profile responses use the full DRF serializers.'))
+
+    return findings
@@ -1,12 +1,12 @@
 import os
 import sys
 import argparse
-import pkg_resources
 
-from django.core.management import call_command
+# Django and the package templates are imported inside the functions that need them,
+# so `signmeup --help` and argument errors return without loading them.
 
 
-def create_project(project_name):
+def create_project(project_name, project_settings=None, profile='development'):
     """
     Create a new Django project using the signmeup template.
 
@@ -14,38 +14,96 @@ def create_project(project_name):
     It creates the project directory and initializes the project using Django's 'startproject' command.
     Additionally, it creates an 'accounts' app using Django's 'startapp' command, and updates various configuration files.
 
+    Every step is idempotent: an existing project or app is reused, an existing .env file is kept,
+    and files that are already up to date are left untouched.
+
     Args:
         project_name (str): The name of the new Django project.
+        project_settings (dict, optional): Extra settings to set in the project's settings.py.
+        profile (str): 'development', or 'production' for performance-tuned production settings.
 
     Returns:
         None
     """
+    from django.core.management import call_command
+
     # Add the current directory (project path) to sys.path
     sys.path.append(os.getcwd())
 
+    base_dir = os.getcwd()
+
     # Create Django project using the project name provided by the user
-    call_command('startproject', project_name)
+    if not os.path.exists(os.path.join(project_name, 'manage.py')):
+        call_command('startproject', project_name)
 
     # Change to the newly created project directory
     os.chdir(project_name)
+    try:
+        # Run Django's startapp command for the 'accounts' app
+        if not os.path.exists(os.path.join('accounts', 'apps.py')):
+            call_command('startapp', 'accounts')
 
-    # Run Django's startapp command for the 'accounts' app
-    call_command('startapp', 'accounts')
+        if not os.path.exists(os.path.join(project_name, '.env')):
+            create_env_file(project_name, profile)
 
-    create_env_file(project_name)
+        # Update core urls.py for the new project
+        update_urls_file(project_name, ['accounts'])
 
+        # Update the settings.py file with the required apps in INSTALLED_APPS
+        update_settings_file(project_name, project_settings, profile)
 
-    # Update core urls.py for the new project
-    update_urls_file(project_name, ['accounts'])
+        # Update the app-level files
+        update_app_files()
+    finally:
+        os.chdir(base_dir)
 
-    # Update the settings.py file with the required apps in INSTALLED_APPS
-    update_settings_file(project_name)
 
-    # Update the app-level files
-    update_app_files()
+def timed_create_project(project):
+    """
+    Create a project described by a batch specification entry and measure how long it takes.
 
+    Args:
+        project (dict): The project, with 'name', 'profile' and 'settings' keys.
 
-def create_env_file(project_name):
+    Returns:
+        tuple: The project name and the elapsed time in seconds.
+    """
+    import time
+
+    start = time.perf_counter()
+    create_project(project['name'], project['settings'], project['profile'])
+    return project['name'], time.perf_counter() - start
+
+
+def create_projects(projects, jobs=1):
+    """
+    Create several Django projects in this process or in parallel worker processes.
+
+    The template manifest is read before the worker processes start. Where they are forked (the
+    default on Linux) they inherit it; otherwise each worker reads it again on its first project.
+
+    Args:
+        projects (list): The projects, as dicts with 'name', 'profile' and 'settings' keys.
+        jobs (int): The number of worker processes; 1 creates the projects in this process.
+
+    Returns:
+        list: (project name, elapsed seconds) tuples, in the order of `projects`.
+    """
+    from signmeup.scaffold import load_manifest
+
+    load_manifest()
+
+    if jobs <= 1 or len(projects) == 1:
+        return [timed_create_project(project) for project in projects]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Projects are created in separate processes because create_project changes the working directory.
+    with ProcessPoolExecutor(max_workers=min(jobs, len(projects))) as executor:
+        return list(executor.map(timed_create_project, projects))
+
+
+def create_env_file(project_name, profile='development'):
     """
     Create the .env file with the environment variables for the Django project.
 
@@ -55,6 +113,7 @@ def create_env_file(project_name):
 
     Args:
         project_name (str): The name of the new Django project.
+        profile (str): 'development', or 'production' to add the production variables and disable DEBUG.
     """
     # Path to the .env file
     env_file_path = os.path.join(project_name, '.env')
@@ -82,6 +141,17 @@ def create_env_file(project_name):
         }
     }
 
+    if profile == 'production':
+        env_variables['GENERAL']['DEBUG'] = ('False', 'NOTE: Never enable in production')
+        env_variables['PRODUCTION'] = {
+            'ALLOWED_HOSTS': ('your_domain.com', 'Comma-separated host names'),
+            'CONN_MAX_AGE': ('600', 'Seconds to keep database connections open'),
+            'REDIS_URL': ('', 'Set before serving, e.g. redis://localhost:6379/0; empty uses a per-process memory cache'),
+            'THROTTLE_ANON': ('60/minute', ''),
+            'THROTTLE_USER': ('600/minute', ''),
+            'THROTTLE_AVAILABILITY': ('120/minute', 'Availability checks, throttled separately'),
+        }
+
     # Write the variables to the .env file
     with open(env_file_path, 'w') as env_file:
         for section, variables in env_variables.items():
@@ -107,153 +177,32 @@ def update_urls_file(project_name, apps):
     Returns:
         None
     """
+    from signmeup.scaffold import patch_file, patch_urls
+
     # Path to the urls.py file in the core of the project
     core_urls_file_path = os.path.join(project_name, 'urls.py')
-
-    # Read the content of the existing urls.py file
-    with open(core_urls_file_path, 'r') as core_urls_file:
-        content = core_urls_file.read()
-
-    # Generate URL patterns for the specified apps
-    app_url_patterns = [
-        f"path('{app}/', include('{app}.urls')),"
-        for app in apps
-    ]
-
-    # Find the position to insert the new URL patterns
-    urlpatterns_start = content.find('urlpatterns = [')
-
-    if urlpatterns_start != -1:
-        # Insert the new URL patterns after the urlpatterns line
-        urlpatterns_line = 'urlpatterns = ['
-        urlpatterns_end = content.find('\n', urlpatterns_start)
-
-        new_content = (
-            content[:urlpatterns_end] +
-            '\n    ' + '\n    '.join(app_url_patterns) +
-            content[urlpatterns_end:]
-        )
-
-        # Insert the import_lines at the top
-        import_lines = """
-# Import include from django.urls
-from django.urls import include
-"""
-        new_content = import_lines + new_content
-
-        # Write the updated content back to the urls.py file
-        with open(core_urls_file_path, 'w') as core_urls_file:
-            core_urls_file.write(new_content)
+    patch_file(core_urls_file_path, patch_urls, apps)
 
 
-
-
-def update_settings_file(project_name):
+def update_settings_file(project_name, project_settings=None, profile='development'):
     """
     Update the settings.py file of the project with required configurations.
 
     Args:
         project_name (str): The name of the new Django project.
+        project_settings (dict, optional): Extra settings to set at the end of settings.py.
+        profile (str): 'development', or 'production' for performance-tuned production settings.
     """
-    # Path to the settings.py file
-    settings_file_path = os.path.join(project_name, 'settings.py')
-    # Open the settings.py file and read its content
-    with open(settings_file_path, 'r') as settings_file:
-        content = settings_file.read()
-
-    # Define the new settings to be added as comments
-    new_settings = {
-        'SECRET_KEY': "os.getenv('SECRET_KEY')",
-        'DEBUG': "os.getenv('DEBUG')",
-        'DATABASES': """{
-#     'default': {
-#         'ENGINE': 'django.db.backends.postgresql',
-#         'NAME': os.getenv('NAME'), 
-#         'USER': os.getenv('USER'), 
-#         'PASSWORD': os.getenv('PASSWORD'), 
-#         'HOST': os.getenv('HOST'), 
-#         'PORT': os.getenv('PORT'),
-#     }
-# }
-
-"""
-    }
-
-    # Add comments for new settings
-    for setting_name, setting_value in new_settings.items():
-        setting_start = content.find(setting_name)
-        setting_end = content.find('\n', setting_start)
-        if setting_start != -1 and setting_end != -1:
-            setting_line = content[setting_start:setting_end]
-            content = content[:setting_start] + f"""
-# Added by signmeup: Define the {setting_name.lower()} in the .env file at the same location as this settings.py file
-# {setting_name} = {setting_value} """ + '\n' + content[setting_start:]
-
-    # Apps to add to INSTALLED_APPS
-    apps_to_add = [
-        "'rest_framework'",
-        "'rest_framework.authtoken'",
-        "'accounts'",
-    ]
-    # Find the position of 'INSTALLED_APPS' in the settings.py content
-    apps_start = content.find('INSTALLED_APPS')
-    apps_end = content.find('\n]', apps_start)
-
-    # Insert the new apps after the existing INSTALLED_APPS list
-    if apps_start != -1 and apps_end != -1:
-        apps_list = content[apps_start:apps_end]
-        for app in apps_to_add:
-            if app not in apps_list:
-                content = content.replace(apps_list, f"{apps_list}\n\n    {app}, # App added by signmeup")
-
-    # Middleware settings
-    middleware_to_add = [
-        "'accounts.middleware.TokenExpirationMiddleware'"
-    ]
-    # Find the position of 'MIDDLEWARE' in the settings.py content
-    middleware_start = content.find('MIDDLEWARE')
-    middleware_end = content.find('\n]', middleware_start)
-
-    # Insert the new middleware after the existing MIDDLEWARE list
-    if middleware_start != -1 and middleware_end != -1:
-        middleware_list = content[middleware_start:middleware_end]
-        for middleware in middleware_to_add:
-            if middleware not in middleware_list:
-                # Add the middleware to MIDDLEWARE with a comment
-                content = content.replace(middleware_list, f"{middleware_list}\n\n    {middleware}, # Middleware added by signmeup")
-
-    # Add the import lines 
-    import_lines = f"""
-# Added by signmeup
-import os
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()  
+    from signmeup.scaffold import patch_file, patch_profile, patch_project_settings, patch_settings
 
-# Email settings: Added by signmeup
-EMAIL_HOST = os.getenv('EMAIL_HOST')
-EMAIL_PORT = os.getenv('EMAIL_PORT')
-EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
-EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
-EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS')
-EMAIL_BACKEND = os.getenv('EMAIL_BACKEND')
+    def patch(content):
+        content = patch_settings(content, profile)
+        content = patch_profile(content, profile)
+        return patch_project_settings(content, project_settings)
 
-# Custom user model: Added by signmeup
-AUTH_USER_MODEL = 'accounts.CustomUser'
-"""    
-    # Find the first import statement in the content
-    import_start = content.find('import')
-    import_end = content.find('\n', import_start)
-
-    if import_start != -1 and import_end != -1:
-        # Insert the import_lines after the first import statement
-        content = content[:import_end] + '\n\n' + import_lines + content[import_end:]
-
-
-    # Write the updated content back to the settings.py file
-    with open(settings_file_path, 'w') as settings_file:
-        settings_file.write(content)
+    # Path to the settings.py file
+    settings_file_path = os.path.join(project_name, 'settings.py')
+    patch_file(settings_file_path, patch)
 
 
 def update_app_files():
@@ -263,38 +212,42 @@ def update_app_files():
     Note:
         This function assumes that the 'accounts' app already exists in the project.
     """
-    # Source directory containing the app-level files
-    source_app_dir = pkg_resources.resource_filename('signmeup.accounts', '')
+    from signmeup.scaffold import load_manifest
 
     # Destination directory for the newly created app
     destination_app_dir = os.path.join(os.getcwd(), 'accounts')
+    load_manifest().sync(destination_app_dir)
+
+
+def check_project_settings(project_dir, settings_module=None):
+    """
+    Load the settings of an existing project and check them for slow production configuration.
 
-    # List of files to add and update
-    files_to_update = [
-        ('urls.py', os.path.join(source_app_dir, 'urls.py')),
-        ('serializers.py', os.path.join(source_app_dir, 'serializers.py')),
-        ('middleware.py', os.path.join(source_app_dir, 'middleware.py')),
-        ('admin.py', os.path.join(source_app_dir, 'admin.py')),
-        ('models.py', os.path.join(source_app_dir, 'models.py')),
-        ('tests.py', os.path.join(source_app_dir, 'tests.py')),
-        ('views.py', os.path.join(source_app_dir, 'views.py'))   
-    ]
+    Args:
+        project_dir (str): The directory containing the project's manage.py.
+        settings_module (str, optional): The dotted settings module; read from manage.py when omitted.
+
+    Returns:
+        list: (code, message) tuples, one per finding.
+    """
+    import importlib
+    import re
 
-    for file_name, source_file_path in files_to_update:
-        destination_file_path = os.path.join(destination_app_dir, file_name)
+    from signmeup.checks import check_settings
 
+    project_dir = os.path.abspath(project_dir)
+    if settings_module is None:
         try:
-            with open(destination_file_path, 'r') as destination_file:
-                existing_content = destination_file.read()
+            with open(os.path.join(project_dir, 'manage.py'), 'r') as manage_file:
+                match = re.search(r"DJANGO_SETTINGS_MODULE['\"],\s*['\"]([\w.]+)['\"]", manage_file.read())
         except FileNotFoundError:
-            existing_content = ""
+            match = None
+        if match is None:
+            raise ValueError(f'Cannot find the settings module of {project_dir}; pass --settings.')
+        settings_module = match.group(1)
 
-        with open(source_file_path, 'r') as source_file:
-            content = source_file.read()
-
-        if existing_content != content:
-            with open(destination_file_path, 'w') as destination_file:
-                destination_file.write(content)
+    sys.path.insert(0, project_dir)
+    return check_settings(importlib.import_module(settings_module))
 
 
 def main():
@@ -305,10 +258,13 @@ def main():
     The CLI supports the 'startproject' command to create a new Django project using the signmeup template.
 
     Command-line arguments:
-    - startproject: Create a new Django project.
+    - startproject: Create one or more new Django projects.
+    - checksettings: Report settings of an existing project that slow it down in production.
 
     Usage:
-        signmeup startproject <project_name>
+        signmeup startproject <project_name> [<project_name> ...] [--profile production] [--jobs N]
+        signmeup startproject --spec projects.yaml [--jobs N]
+        signmeup checksettings [<project_dir>] [--settings module]
 
     Args:
         None
@@ -320,17 +276,54 @@ def main():
     subparsers = parser.add_subparsers(dest='command')
     subparser_startproject = subparsers.add_parser('startproject', help='Create a new Django project.')
 
-    subparser_startproject.add_argument('project_name', metavar='project_name', type=str, nargs='?', help='The name of the new Django project.')
+    subparser_startproject.add_argument('project_names', metavar='project_name', type=str, nargs='*', help='The name of the new Django project.')
+    subparser_startproject.add_argument('--spec', help='A JSON or YAML file listing the projects to create and their settings.')
+    subparser_startproject.add_argument('--profile', choices=['development', 'production'], default='development', help='The settings profile to generate.')
+    subparser_startproject.add_argument('--jobs', type=int, default=1, help='Number of projects to generate concurrently.')
+
+    subparser_checksettings = subparsers.add_parser('checksettings', help='Report settings that slow down an existing project in production.')
+    subparser_checksettings.add_argument('project_dir', nargs='?', default='.', help='The directory containing manage.py.')
+    subparser_checksettings.add_argument('--settings', help='The dotted settings module, e.g. mysite.settings.')
 
     args = parser.parse_args()
 
     if args.command == 'startproject':
-        if args.project_name:
-            create_project(args.project_name)
-        else:
+        if not args.project_names and not args.spec:
             print('Error: Please provide a project name.')
             print('Usage: signmeup startproject project_name')
             sys.exit(1)
+
+        from signmeup.scaffold import ScaffoldError, load_spec
+
+        try:
+            projects = [{'name': name, 'profile': args.profile, 'settings': {}} for name in args.project_names]
+            if args.spec:
+                projects += [dict(project, profile=project['profile'] or args.profile) for project in load_spec(args.spec)]
+            timings = create_projects(projects, args.jobs)
+        except ScaffoldError as e:
+            print(f'Error: {e}')
+            sys.exit(1)
+
+        if len(timings) > 1:
+            width = max(len(name) for name, _ in timings)
+            for name, elapsed in timings:
+                print(f'{name:<{width}}  {elapsed * 1000:8.1f} ms')
+            print(f'{len(timings)} projects created')
+    elif args.command == 'checksettings':
+        from django.core.exceptions import ImproperlyConfigured
+
+        try:
+            findings = check_project_settings(args.project_dir, args.settings)
+        except (ValueError, ImportError, ImproperlyConfigured) as e:
+            print(f'Error: {e}')
+            sys.exit(1)
+
+        for code, message in findings:
+            print(f'{code}: {message}')
+        if findings:
+            print(f'{len(findings)} slow setting(s) found.')
+            sys.exit(1)
+        print('No slow settings found.')
     else:
         print('Invalid command. Please use "signmeup startproject <project_name>".')
         sys.exit(1)
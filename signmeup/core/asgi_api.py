@@ -0,0 +1,17 @@
+"""
+ASGI config for API-only deployments of sign_me_up.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+configured with core.settings_api. The admin stays on core.asgi.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings_api')
+
+application = get_asgi_application()
@@ -59,6 +59,9 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'accounts.middleware.RequestIdMiddleware',
+    # Removes itself at startup unless ACCOUNTS_PROFILING is set.
+    'accounts.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,6 +70,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
+    'accounts.middleware.ReplicaPinningMiddleware',
     'accounts.middleware.TokenExpirationMiddleware',
 
     
@@ -114,6 +118,24 @@ DATABASES = {
     }
 }
 
+# Read replicas: reads are routed to them by accounts.routers.ReplicaRouter, writes go to 'default'.
+# Tests run against the primary through the MIRROR setting.
+ACCOUNTS_READ_REPLICAS = []
+if os.getenv('REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('REPLICA_HOST'),
+        'PORT': os.getenv('REPLICA_PORT', os.getenv('PORT', '')),
+        'TEST': {'MIRROR': 'default'},
+    }
+    ACCOUNTS_READ_REPLICAS.append('replica')
+
+# Sharding of the accounts tables by user id (see accounts/sharding.py): list the shard aliases here.
+# The user directory stays on 'default', which may also be one of the shards.
+ACCOUNTS_SHARDS = []
+
+DATABASE_ROUTERS = ['accounts.routers.ShardRouter', 'accounts.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -158,3 +180,49 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 AUTH_USER_MODEL = 'accounts.CustomUser'
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'accounts.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Serialize the fixed-shape login/profile payloads with precompiled field extractors
+ACCOUNTS_FAST_SERIALIZATION = True
+
+# Write the buffered last_seen timestamps when a worker process exits
+ACCOUNTS_ACTIVITY_FLUSH_ON_EXIT = True
+
+# Profile sampled requests and requests sent with an admin's profiling token (see accounts/profiling.py)
+ACCOUNTS_PROFILING = os.getenv('ACCOUNTS_PROFILING') == 'True'
+
+
+# Logging
+# https://docs.djangoproject.com/en/4.2/topics/logging/
+
+# The accounts app logs JSON lines through a background queue (ACCOUNTS_LOG_QUEUE_SIZE records,
+# 0 to write in the request thread); invalid tokens and failed logins are sampled under load.
+ACCOUNTS_LOG_QUEUE_SIZE = 10000
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sampling': {'()': 'accounts.logs.SamplingFilter', 'burst': 10, 'interval': 1.0, 'rate': 100},
+    },
+    'formatters': {
+        'json': {'()': 'accounts.logs.JSONFormatter'},
+    },
+    'handlers': {
+        'accounts': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+    },
+    'loggers': {
+        'accounts': {'handlers': ['accounts'], 'level': os.getenv('ACCOUNTS_LOG_LEVEL', 'INFO'), 'propagate': False},
+        'accounts.auth': {'filters': ['sampling']},
+    },
+}
@@ -0,0 +1,58 @@
+"""
+Django settings for API-only deployments of sign_me_up.
+
+Serves `accounts.urls` with token authentication only: no sessions, messages, CSRF,
+clickjacking or template context processors run on API requests. The admin is not
+mounted here; serve it from the full settings through core.wsgi / core.asgi.
+
+Run with DJANGO_SETTINGS_MODULE=core.settings_api, or through core.wsgi_api / core.asgi_api.
+"""
+
+from core.settings import *  # noqa: F401,F403
+
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+
+    # Other apps
+    'rest_framework',
+    'rest_framework.authtoken',
+    'accounts',
+]
+
+MIDDLEWARE = [
+    'accounts.middleware.RequestIdMiddleware',
+    # Removes itself at startup unless ACCOUNTS_PROFILING is set.
+    'accounts.middleware.ProfilingMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'accounts.middleware.ReplicaPinningMiddleware',
+    'accounts.middleware.TokenExpirationMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'core.urls_api'
+
+WSGI_APPLICATION = 'core.wsgi_api.application'
+
+# Only DRF's own templates are rendered (e.g. error pages), without per-request context processors.
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+    },
+]
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'accounts.renderers.FastJSONRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'accounts.authentication.DeviceTokenAuthentication',
+    ],
+}
@@ -0,0 +1,48 @@
+"""
+Django settings for running the test suite quickly.
+
+SQLite (in memory during tests), a fast password hasher, in-memory mail and quiet logging, with a
+test runner reporting the slowest tests. Run with:
+
+    python manage.py test --settings=core.settings_test --parallel
+"""
+import os
+
+from core.settings import *  # noqa: F401,F403
+from core.settings import BASE_DIR, LOGGING
+
+
+SECRET_KEY = os.getenv('SECRET_KEY') or 'insecure-key-for-tests-only'
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    # A replica alias mirroring the primary, for the routing tests: they list it in
+    # ACCOUNTS_READ_REPLICAS, the other tests do not use it.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+ACCOUNTS_READ_REPLICAS = []
+ACCOUNTS_SHARDS = []
+
+# Hashing with PBKDF2 takes most of the time of every test creating a user or logging in.
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+# The activity of test users must not be written to the configured database at exit.
+ACCOUNTS_ACTIVITY_FLUSH_ON_EXIT = False
+
+# Records are still captured by assertLogs; nothing is printed or queued otherwise.
+ACCOUNTS_LOG_QUEUE_SIZE = 0
+LOGGING = {
+    **LOGGING,
+    'loggers': {**LOGGING['loggers'], 'accounts': {**LOGGING['loggers']['accounts'], 'level': 'WARNING'}},
+}
+
+TEST_RUNNER = 'accounts.testing.TimedTestRunner'
@@ -0,0 +1,12 @@
+"""
+URL configuration for API-only deployments of sign_me_up (core.settings_api).
+
+Mounts the accounts API at the same path as core.urls, so clients do not change.
+The admin is served by the full deployment (core.urls).
+"""
+from django.urls import path, include
+
+
+urlpatterns = [
+    path('accounts/', include('accounts.urls')),
+]
@@ -0,0 +1,17 @@
+"""
+WSGI config for API-only deployments of sign_me_up.
+
+It exposes the WSGI callable as a module-level variable named ``application``,
+configured with core.settings_api. The admin stays on core.wsgi.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings_api')
+
+application = get_wsgi_application()
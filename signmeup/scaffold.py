@@ -0,0 +1,559 @@
+"""
+Scaffolding engine used by the signmeup command-line interface.
+
+The app template files are read and hashed once per process (`TemplateManifest`). Syncing them
+into a project records their hashes next to the destination files, so re-running the CLI skips
+files that are already up to date without reading them again. Edits to the generated settings.py
+and urls.py are computed from the parsed module and applied as a single patch; each edit is
+skipped when it is already present, so every step can safely be re-run.
+"""
+import ast
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+
+TEMPLATE_PACKAGE = 'signmeup.accounts'
+
+# App-level files copied from the signmeup package into the generated 'accounts' app.
+APP_FILES = [
+    'urls.py',
+    'serializers.py',
+    'renderers.py',
+    'middleware.py',
+    'admin.py',
+    'models.py',
+    'tests.py',
+    'views.py',
+    'links.py',
+    'logs.py',
+    'apps.py',
+    'activity.py',
+    'authentication.py',
+    'routers.py',
+    'sharding.py',
+    'data_migrations.py',
+    'idempotency.py',
+    'bloom.py',
+    'token_cache.py',
+    'availability.py',
+    'testing.py',
+    'profiling.py',
+    'management/__init__.py',
+    'management/commands/__init__.py',
+    'management/commands/bench_indexes.py',
+    'management/commands/generate_users.py',
+    'management/commands/bench_serializers.py',
+    'management/commands/bench_stack.py',
+    'management/commands/bench_shards.py',
+    'management/commands/bench_row_width.py',
+    'management/commands/prune_empty_profiles.py',
+    'management/commands/bench_asgi.py',
+    'management/commands/bench_invalid_tokens.py',
+]
+
+# Name of the file recording the hashes of the synced files in the destination directory.
+MANIFEST_FILE_NAME = '.signmeup-manifest.json'
+
+MARKER = 'Added by signmeup'
+
+
+class ScaffoldError(Exception):
+    """
+    Raised when a generated file does not have the structure the scaffolding expects.
+    """
+
+
+class TemplateManifest:
+    """
+    The app template files, read and hashed once.
+
+    Attributes:
+        files (dict): Maps each relative file name to a (content, sha256 hex digest) tuple.
+    """
+
+    def __init__(self, package=TEMPLATE_PACKAGE, file_names=APP_FILES):
+        from importlib.resources import files
+
+        root = files(package)
+        self.files = {}
+        for file_name in file_names:
+            content = root.joinpath(file_name).read_bytes()
+            self.files[file_name] = (content, hashlib.sha256(content).hexdigest())
+
+    def sync(self, destination_dir):
+        """
+        Copies the template files into a directory, skipping files that are already up to date.
+
+        A file is skipped without being read when the recorded hash matches the template and its
+        size and modification time are unchanged since it was recorded. Otherwise it is hashed and
+        only rewritten when its content differs.
+
+        Args:
+            destination_dir (str): The directory of the app to update.
+
+        Returns:
+            list: The relative names of the files that were written.
+        """
+        manifest_path = os.path.join(destination_dir, MANIFEST_FILE_NAME)
+        try:
+            with open(manifest_path, 'r') as manifest_file:
+                recorded = json.load(manifest_file)
+        except (FileNotFoundError, ValueError):
+            recorded = {}
+
+        entries = {}
+        written = []
+        for file_name, (content, digest) in self.files.items():
+            destination_path = os.path.join(destination_dir, *file_name.split('/'))
+            try:
+                stat = os.stat(destination_path)
+            except FileNotFoundError:
+                stat = None
+
+            entry = recorded.get(file_name)
+            unchanged = (
+                stat is not None and entry is not None and entry['sha256'] == digest
+                and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+            )
+            if not unchanged and (stat is None or file_digest(destination_path) != digest):
+                os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+                with open(destination_path, 'wb') as destination_file:
+                    destination_file.write(content)
+                stat = os.stat(destination_path)
+                written.append(file_name)
+
+            entries[file_name] = {'sha256': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+        if entries != recorded:
+            with open(manifest_path, 'w') as manifest_file:
+                json.dump(entries, manifest_file, indent=2, sort_keys=True)
+        return written
+
+
+@lru_cache(maxsize=None)
+def load_manifest():
+    """
+    Returns the template manifest, loading it on first use.
+    """
+    return TemplateManifest()
+
+
+def file_digest(path):
+    """
+    Returns the sha256 hex digest of a file.
+    """
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class SourcePatch:
+    """
+    Collects line insertions against a source file and applies them in one pass.
+    """
+
+    def __init__(self, source):
+        self.lines = source.splitlines(keepends=True)
+        self.insertions = {}
+
+    def insert_before(self, lineno, text):
+        """
+        Queues text to be inserted before a 1-based line number.
+        """
+        self.insertions.setdefault(lineno - 1, []).append(text)
+
+    def apply(self):
+        """
+        Returns the patched source.
+        """
+        if not self.insertions:
+            return ''.join(self.lines)
+        output = []
+        for index, line in enumerate(self.lines + ['']):
+            output.extend(self.insertions.get(index, ()))
+            output.append(line)
+        return ''.join(output)
+
+
+def find_assignments(tree):
+    """
+    Returns the top-level `NAME = value` statements of a module, keyed by name.
+    """
+    assignments = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            assignments.setdefault(node.targets[0].id, node)
+    return assignments
+
+
+def list_values(node):
+    """
+    Returns the string constants of a list literal.
+    """
+    if not isinstance(node, ast.List):
+        raise ScaffoldError(f'Expected a list literal on line {node.lineno}.')
+    return {element.value for element in node.elts if isinstance(element, ast.Constant)}
+
+
+def closing_bracket_line(source_lines, node):
+    """
+    Returns the line number of the closing bracket of a multi-line list literal.
+    """
+    closing_line = source_lines[node.end_lineno - 1]
+    if closing_line.strip() != ']':
+        raise ScaffoldError(f'Expected the list ending on line {node.end_lineno} to close on its own line.')
+    return node.end_lineno
+
+
+def patch_list(patch, tree_node, values, comment, after=None):
+    """
+    Queues the values missing from a multi-line list literal, one per line.
+
+    The values go right after the element `after` when the list contains it, otherwise before the
+    closing bracket.
+    """
+    missing = [value for value in values if value not in list_values(tree_node.value)]
+    if not missing:
+        return
+    anchor = next(
+        (element for element in tree_node.value.elts if isinstance(element, ast.Constant) and element.value == after),
+        None,
+    )
+    if after is not None and anchor is not None:
+        lineno = anchor.end_lineno + 1
+    else:
+        lineno = closing_bracket_line(patch.lines, tree_node)
+    patch.insert_before(lineno, ''.join(f"    '{value}',  # {comment}\n" for value in missing))
+
+
+SETTINGS_IMPORT_BLOCK = f"""
+# {MARKER}
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Email settings: {MARKER}
+EMAIL_HOST = os.getenv('EMAIL_HOST')
+EMAIL_PORT = os.getenv('EMAIL_PORT')
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS')
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND')
+
+# Custom user model: {MARKER}
+AUTH_USER_MODEL = 'accounts.CustomUser'
+
+"""
+
+# Settings documented as .env-driven alternatives, inserted as comments above the generated values.
+ENV_SETTINGS = {
+    'SECRET_KEY': "os.getenv('SECRET_KEY')",
+    'DEBUG': "os.getenv('DEBUG')",
+    'DATABASES': """{
+#     'default': {
+#         'ENGINE': 'django.db.backends.postgresql',
+#         'NAME': os.getenv('NAME'),
+#         'USER': os.getenv('USER'),
+#         'PASSWORD': os.getenv('PASSWORD'),
+#         'HOST': os.getenv('HOST'),
+#         'PORT': os.getenv('PORT'),
+#     }
+# }""",
+}
+
+INSTALLED_APPS = ['rest_framework', 'rest_framework.authtoken', 'accounts']
+
+MIDDLEWARE = ['accounts.middleware.RequestIdMiddleware', 'accounts.middleware.TokenExpirationMiddleware']
+
+
+def patch_settings(source, profile='development'):
+    """
+    Applies the signmeup configuration to the source of a generated settings.py.
+
+    Args:
+        source (str): The current content of settings.py.
+        profile (str): 'development', or 'production' to place the accounts middleware right after
+            SecurityMiddleware, so rejected tokens skip the rest of the middleware stack.
+
+    Returns:
+        str: The patched content, identical to `source` if everything is already applied.
+    """
+    tree = ast.parse(source)
+    assignments = find_assignments(tree)
+    patch = SourcePatch(source)
+
+    if 'AUTH_USER_MODEL' not in assignments:
+        first_import = next((node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))), None)
+        if first_import is None:
+            raise ScaffoldError('settings.py has no import statement to anchor the signmeup settings.')
+        patch.insert_before(first_import.end_lineno + 1, SETTINGS_IMPORT_BLOCK)
+
+    for setting_name, setting_value in ENV_SETTINGS.items():
+        comment = f'# {MARKER}: Define the {setting_name.lower()} in the .env file at the same location as this settings.py file\n'
+        node = assignments.get(setting_name)
+        if node is not None and comment not in source:
+            patch.insert_before(node.lineno, f'\n{comment}# {setting_name} = {setting_value}\n')
+
+    middleware_anchor = 'django.middleware.security.SecurityMiddleware' if profile == 'production' else None
+    for setting_name, values, comment, after in (
+        ('INSTALLED_APPS', INSTALLED_APPS, f'App {MARKER.lower()}', None),
+        ('MIDDLEWARE', MIDDLEWARE, f'Middleware {MARKER.lower()}', middleware_anchor),
+    ):
+        if setting_name not in assignments:
+            raise ScaffoldError(f'settings.py does not define {setting_name}.')
+        patch_list(patch, assignments[setting_name], values, comment, after)
+
+    return patch.apply()
+
+
+PROFILES = ('development', 'production')
+
+PRODUCTION_SETTINGS_START = f'# Production profile: {MARKER}\n'
+PRODUCTION_SETTINGS_END = '# End of production profile\n'
+
+PRODUCTION_SETTINGS = """# The key generated by startproject is committed with the project: read the real one from the environment
+SECRET_KEY = os.environ['SECRET_KEY']
+DEBUG = os.getenv('DEBUG', 'False') == 'True'
+ALLOWED_HOSTS = [host for host in os.getenv('ALLOWED_HOSTS', '').split(',') if host]
+
+# Reuse database connections across requests instead of reconnecting on every request
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = int(os.getenv('CONN_MAX_AGE', '600'))
+    database['CONN_HEALTH_CHECKS'] = True
+
+# A cache shared by all worker processes: throttling, idempotency keys, the token filter and request
+# profiles rely on it. Set REDIS_URL before serving (RedisCache needs `pip install signmeup[production]`).
+# Without it, each process gets its own memory cache, which only suits management commands and local
+# runs; `signmeup checksettings` reports it (S003).
+if os.getenv('REDIS_URL'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.getenv('REDIS_URL')}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# JSON API only: no browsable API, session or basic authentication; multipart is kept for avatar uploads
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['accounts.renderers.FastJSONRenderer'],
+    'DEFAULT_PARSER_CLASSES': ['rest_framework.parsers.JSONParser', 'rest_framework.parsers.MultiPartParser'],
+    'DEFAULT_AUTHENTICATION_CLASSES': ['accounts.authentication.DeviceTokenAuthentication'],
+    'DEFAULT_THROTTLE_CLASSES': ['rest_framework.throttling.AnonRateThrottle', 'rest_framework.throttling.UserRateThrottle'],
+    'DEFAULT_THROTTLE_RATES': {'anon': os.getenv('THROTTLE_ANON', '60/minute'), 'user': os.getenv('THROTTLE_USER', '600/minute'), 'availability': os.getenv('THROTTLE_AVAILABILITY', '120/minute')},
+}
+ACCOUNTS_FAST_SERIALIZATION = True
+
+# Write the buffered last_seen timestamps when a worker process exits; test runs should turn this off
+ACCOUNTS_ACTIVITY_FLUSH_ON_EXIT = os.getenv('ACCOUNTS_ACTIVITY_FLUSH_ON_EXIT', 'True') == 'True'
+
+# Only the hashers in use, so stored hashes are identified without trying legacy algorithms.
+# Django's default PBKDF2 iteration count is kept: lowering it trades away brute-force resistance.
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+# JSON lines written by a background thread; invalid tokens and failed logins are sampled under load
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sampling': {'()': 'accounts.logs.SamplingFilter', 'burst': 10, 'interval': 1.0, 'rate': 100},
+    },
+    'formatters': {'json': {'()': 'accounts.logs.JSONFormatter'}},
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+        'accounts': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+    },
+    'root': {'handlers': ['console'], 'level': 'WARNING'},
+    'loggers': {
+        'accounts': {'handlers': ['accounts'], 'level': os.getenv('ACCOUNTS_LOG_LEVEL', 'INFO'), 'propagate': False},
+        'accounts.auth': {'filters': ['sampling']},
+    },
+}
+"""
+
+PROJECT_SETTINGS_START = f'# Project settings: {MARKER}\n'
+PROJECT_SETTINGS_END = '# End of project settings\n'
+
+
+def replace_block(source, start_marker, end_marker, body):
+    """
+    Replaces the block between two marker lines, or appends it at the end of the source.
+
+    Args:
+        source (str): The source to patch.
+        start_marker (str): The line opening the block.
+        end_marker (str): The line closing the block.
+        body (str): The new block content; an empty body removes the block.
+
+    Returns:
+        str: The patched source.
+    """
+    start = source.find(start_marker)
+    if start != -1:
+        end = source.find(end_marker, start)
+        if end == -1:
+            raise ScaffoldError(f'settings.py has an unterminated block starting with {start_marker.strip()!r}.')
+        source = source[:start].rstrip('\n') + '\n' + source[end + len(end_marker):]
+
+    if not body:
+        return source
+    return source.rstrip('\n') + '\n\n\n' + start_marker + body + end_marker
+
+
+def patch_profile(source, profile):
+    """
+    Adds the settings of a deployment profile at the end of a settings.py source.
+
+    Args:
+        source (str): The current content of settings.py.
+        profile (str): One of PROFILES; 'development' removes a previously generated production block.
+
+    Returns:
+        str: The patched content.
+    """
+    if profile not in PROFILES:
+        raise ScaffoldError(f'Unknown profile {profile!r}; expected one of {", ".join(PROFILES)}.')
+    body = PRODUCTION_SETTINGS if profile == 'production' else ''
+    return replace_block(source, PRODUCTION_SETTINGS_START, PRODUCTION_SETTINGS_END, body)
+
+
+def patch_project_settings(source, project_settings):
+    """
+    Sets per-project values at the end of a settings.py source, overriding earlier definitions.
+
+    The values are written between marker comments, and that block is replaced on every run.
+
+    Args:
+        source (str): The current content of settings.py.
+        project_settings (dict): Setting names mapped to literal values (str, number, bool, None, list, dict).
+
+    Returns:
+        str: The patched content.
+    """
+    body = ''.join(f'{name} = {value!r}\n' for name, value in (project_settings or {}).items())
+    return replace_block(source, PROJECT_SETTINGS_START, PROJECT_SETTINGS_END, body)
+
+
+def load_spec(path):
+    """
+    Loads a batch specification of projects from a JSON or YAML file.
+
+    The file holds either a list of projects or a mapping with a 'projects' list. Each project is
+    a name, or a mapping with a 'name', an optional 'profile' and optional 'settings' to set in
+    its settings.py:
+
+        projects:
+          - name: tenant_a
+            profile: production
+            settings:
+              ALLOWED_HOSTS: ['a.example.com']
+          - tenant_b
+
+    Args:
+        path (str): The path of the .json, .yaml or .yml file.
+
+    Returns:
+        list: The projects, as dicts with 'name', 'profile' (None when not given) and 'settings' keys.
+    """
+    with open(path, 'r') as spec_file:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ScaffoldError('PyYAML is required to read YAML spec files: pip install pyyaml')
+            spec = yaml.safe_load(spec_file)
+        else:
+            spec = json.load(spec_file)
+
+    if isinstance(spec, dict):
+        spec = spec.get('projects')
+    if not isinstance(spec, list) or not spec:
+        raise ScaffoldError(f'{path} must contain a non-empty list of projects.')
+
+    projects = []
+    for entry in spec:
+        if isinstance(entry, str):
+            entry = {'name': entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get('name'), str) or not entry['name'].isidentifier():
+            raise ScaffoldError(f'Invalid project entry in {path}: {entry!r}')
+        project_settings = entry.get('settings') or {}
+        if not isinstance(project_settings, dict) or not all(isinstance(name, str) and name.isupper() for name in project_settings):
+            raise ScaffoldError(f'Settings of project {entry["name"]!r} must map upper-case setting names to values.')
+        profile = entry.get('profile')
+        if profile is not None and profile not in PROFILES:
+            raise ScaffoldError(f'Unknown profile {profile!r} for project {entry["name"]!r}.')
+        projects.append({'name': entry['name'], 'profile': profile, 'settings': project_settings})
+
+    names = [project['name'] for project in projects]
+    if len(set(names)) != len(names):
+        raise ScaffoldError(f'{path} lists the same project more than once.')
+    return projects
+
+
+def patch_urls(source, apps):
+    """
+    Adds URL patterns including each app's urls module to the source of a generated urls.py.
+
+    Args:
+        source (str): The current content of urls.py.
+        apps (list): The names of the apps whose urls modules should be included.
+
+    Returns:
+        str: The patched content, identical to `source` if everything is already applied.
+    """
+    tree = ast.parse(source)
+    assignments = find_assignments(tree)
+    patch = SourcePatch(source)
+
+    urlpatterns = assignments.get('urlpatterns')
+    if urlpatterns is None or not isinstance(urlpatterns.value, ast.List):
+        raise ScaffoldError('urls.py does not define urlpatterns as a list literal.')
+
+    included = {
+        node.args[0].value
+        for node in ast.walk(urlpatterns.value)
+        if isinstance(node, ast.Call) and getattr(node.func, 'id', None) == 'include'
+        and node.args and isinstance(node.args[0], ast.Constant)
+    }
+    missing = [app for app in apps if f'{app}.urls' not in included]
+    if not missing:
+        return source
+
+    imports_include = any(
+        isinstance(node, ast.ImportFrom) and node.module == 'django.urls' and any(alias.name == 'include' for alias in node.names)
+        for node in tree.body
+    )
+    if not imports_include:
+        urls_import = next(
+            (node for node in tree.body if isinstance(node, ast.ImportFrom) and node.module == 'django.urls'),
+            None,
+        )
+        anchor = urls_import.end_lineno + 1 if urls_import else urlpatterns.lineno
+        patch.insert_before(anchor, f'from django.urls import include  # {MARKER}\n')
+
+    if not patch.lines[urlpatterns.lineno - 1].rstrip().endswith('['):
+        raise ScaffoldError(f'Expected urlpatterns on line {urlpatterns.lineno} to open its list at the end of the line.')
+    patch.insert_before(
+        urlpatterns.lineno + 1,
+        ''.join(f"    path('{app}/', include('{app}.urls')),\n" for app in missing),
+    )
+    return patch.apply()
+
+
+def patch_file(path, patcher, *args):
+    """
+    Patches a file in place, writing it only if the content changes.
+
+    Returns:
+        bool: Whether the file was changed.
+    """
+    with open(path, 'r') as f:
+        content = f.read()
+    patched = patcher(content, *args)
+    if patched == content:
+        return False
+    with open(path, 'w') as f:
+        f.write(patched)
+    return True
@@ -0,0 +1,153 @@
+"""
+Tests for the deployment profiles and the settings checks of `signmeup checksettings`.
+"""
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from django.core.management import call_command
+
+from signmeup import cli
+from signmeup.checks import check_settings
+from signmeup.scaffold import PRODUCTION_SETTINGS, ScaffoldError, patch_profile
+
+
+def fast_settings(**overrides):
+    """
+    Returns a settings object none of the checks report on, with the given attributes replaced.
+    """
+    values = {
+        'DEBUG': False,
+        'DATABASES': {'default': {'ENGINE': 'django.db.backends.postgresql', 'CONN_MAX_AGE': 60}},
+        'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}},
+        'REST_FRAMEWORK': {
+            'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+            'DEFAULT_PARSER_CLASSES': ['rest_framework.parsers.JSONParser'],
+            'DEFAULT_AUTHENTICATION_CLASSES': ['accounts.authentication.DeviceTokenAuthentication'],
+            'DEFAULT_THROTTLE_CLASSES': ['rest_framework.throttling.AnonRateThrottle'],
+        },
+        'MIDDLEWARE': [
+            'django.middleware.security.SecurityMiddleware',
+            'accounts.middleware.TokenExpirationMiddleware',
+            'django.contrib.sessions.middleware.SessionMiddleware',
+        ],
+        'PASSWORD_HASHERS': ['django.contrib.auth.hashers.PBKDF2PasswordHasher'],
+        'ACCOUNTS_FAST_SERIALIZATION': True,
+    }
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def rest_framework(**overrides):
+    return {**fast_settings().REST_FRAMEWORK, **overrides}
+
+
+class CheckSettingsTestCase(unittest.TestCase):
+    """
+    Test case for check_settings, with one slow setting per finding code.
+    """
+
+    def test_fast_settings(self):
+        """
+        Test that a fast configuration has no findings.
+        """
+        self.assertEqual(check_settings(fast_settings()), [])
+
+    def test_findings(self):
+        """
+        Test that each slow setting is reported under its code, and only under it.
+        """
+        slow_settings = {
+            'S001': {'DEBUG': True},
+            'S002': {'DATABASES': {'default': {'ENGINE': 'django.db.backends.postgresql'}}},
+            'S003': {'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}},
+            'S004': {'REST_FRAMEWORK': rest_framework(DEFAULT_RENDERER_CLASSES=['rest_framework.renderers.JSONRenderer', 'rest_framework.renderers.BrowsableAPIRenderer'])},
+            'S005': {'REST_FRAMEWORK': rest_framework(DEFAULT_PARSER_CLASSES=['rest_framework.parsers.JSONParser', 'rest_framework.parsers.FormParser'])},
+            'S006': {'REST_FRAMEWORK': rest_framework(DEFAULT_AUTHENTICATION_CLASSES=['rest_framework.authentication.BasicAuthentication'])},
+            'S007': {'REST_FRAMEWORK': rest_framework(DEFAULT_THROTTLE_CLASSES=[])},
+            'S008': {'MIDDLEWARE': ['django.contrib.sessions.middleware.SessionMiddleware', 'accounts.middleware.TokenExpirationMiddleware']},
+            'S009': {'PASSWORD_HASHERS': ['django.contrib.auth.hashers.BCryptPasswordHasher', 'django.contrib.auth.hashers.PBKDF2PasswordHasher']},
+            'S010': {'ACCOUNTS_FAST_SERIALIZATION': False},
+        }
+        for code, overrides in slow_settings.items():
+            with self.subTest(code=code):
+                self.assertEqual([finding[0] for finding in check_settings(fast_settings(**overrides))], [code])
+
+    def test_drf_defaults(self):
+        """
+        Test that a project without REST_FRAMEWORK is checked against DRF's default classes.
+        """
+        codes = [code for code, _ in check_settings(fast_settings(REST_FRAMEWORK=None))]
+        self.assertEqual(codes, ['S004', 'S005', 'S006', 'S006', 'S007'])
+
+    def test_dummy_cache(self):
+        """
+        Test that DummyCache is reported as S003.
+        """
+        codes = [code for code, _ in check_settings(fast_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}))]
+        self.assertEqual(codes, ['S003'])
+
+
+class PatchProfileTestCase(unittest.TestCase):
+    """
+    Test case for patch_profile.
+    """
+
+    def test_switch_profiles(self):
+        """
+        Test that the production block is added once and removed again by the development profile.
+        """
+        source = "DEBUG = True\n"
+        production = patch_profile(source, 'production')
+        self.assertEqual(patch_profile(production, 'production'), production)
+        self.assertEqual(production.count(PRODUCTION_SETTINGS), 1)
+        compile(production, 'settings.py', 'exec')
+        self.assertEqual(patch_profile(production, 'development'), patch_profile(source, 'development'))
+        self.assertNotIn(PRODUCTION_SETTINGS, patch_profile(production, 'development'))
+
+    def test_unknown_profile(self):
+        """
+        Test that an unknown profile raises ScaffoldError.
+        """
+        with self.assertRaises(ScaffoldError):
+            patch_profile("DEBUG = True\n", 'staging')
+
+
+class CheckProjectSettingsTestCase(unittest.TestCase):
+    """
+    Test case for check_project_settings on a project generated by startproject.
+    """
+
+    def setUp(self):
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.project_dir = os.path.join(temporary_directory.name, 'checked_project')
+        os.mkdir(self.project_dir)
+        call_command('startproject', 'checked_project', self.project_dir)
+
+    def tearDown(self):
+        if self.project_dir in sys.path:
+            sys.path.remove(self.project_dir)
+        for name in [name for name in sys.modules if name.startswith('checked_project')]:
+            del sys.modules[name]
+
+    def test_settings_module_from_manage_py(self):
+        """
+        Test that the settings module is read from manage.py and the default startproject settings are reported.
+        """
+        codes = {code for code, _ in cli.check_project_settings(self.project_dir)}
+        self.assertTrue({'S001', 'S002', 'S003', 'S010'} <= codes)
+
+    def test_missing_manage_py(self):
+        """
+        Test that a directory without manage.py asks for --settings.
+        """
+        os.remove(os.path.join(self.project_dir, 'manage.py'))
+        with self.assertRaises(ValueError):
+            cli.check_project_settings(self.project_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+"""
+Tests for the scaffolding engine (signmeup.scaffold) and the project generation of the CLI.
+
+Run from the repository root:
+
+    python -m unittest discover tests
+"""
+import ast
+import os
+import tempfile
+import unittest
+
+from django.core.management import call_command
+
+from signmeup import cli
+from signmeup.scaffold import (
+    APP_FILES, MANIFEST_FILE_NAME, ScaffoldError, TemplateManifest, find_assignments, list_values, patch_settings, patch_urls,
+)
+
+
+class TemporaryDirectoryTestCase(unittest.TestCase):
+    """
+    Runs each test in a temporary working directory.
+    """
+
+    def setUp(self):
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        self.directory = temporary_directory.name
+        os.chdir(self.directory)
+
+    def read(self, *path):
+        with open(os.path.join(self.directory, *path)) as f:
+            return f.read()
+
+    def snapshot(self, root):
+        """
+        Returns the content and modification time of every file below a directory.
+        """
+        files = {}
+        for directory, _, file_names in os.walk(root):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                with open(path, 'rb') as f:
+                    files[path] = (f.read(), os.stat(path).st_mtime_ns)
+        return files
+
+
+class PatchSettingsTestCase(TemporaryDirectoryTestCase):
+    """
+    Test case for patch_settings and patch_urls on the files generated by Django's startproject.
+    """
+
+    def setUp(self):
+        super().setUp()
+        call_command('startproject', 'demo')
+        self.settings_source = self.read('demo', 'demo', 'settings.py')
+        self.urls_source = self.read('demo', 'demo', 'urls.py')
+
+    def list_setting(self, source, name):
+        node = find_assignments(ast.parse(source))[name]
+        return [element.value for element in node.value.elts]
+
+    def test_patch_settings_is_idempotent(self):
+        """
+        Test that patching a startproject settings.py adds the apps, middleware and user model once.
+        """
+        patched = patch_settings(self.settings_source)
+        self.assertEqual(patch_settings(patched), patched)
+
+        installed_apps = self.list_setting(patched, 'INSTALLED_APPS')
+        self.assertEqual(installed_apps[-3:], ['rest_framework', 'rest_framework.authtoken', 'accounts'])
+        middleware = self.list_setting(patched, 'MIDDLEWARE')
+        self.assertEqual(middleware.count('accounts.middleware.TokenExpirationMiddleware'), 1)
+        self.assertEqual(patched.count("AUTH_USER_MODEL = 'accounts.CustomUser'"), 1)
+        compile(patched, 'settings.py', 'exec')
+
+    def test_production_middleware_follows_security_middleware(self):
+        """
+        Test that the production profile places the accounts middleware right after SecurityMiddleware.
+        """
+        middleware = self.list_setting(patch_settings(self.settings_source, 'production'), 'MIDDLEWARE')
+        security = middleware.index('django.middleware.security.SecurityMiddleware')
+        self.assertEqual(middleware[security + 1:security + 3], ['accounts.middleware.RequestIdMiddleware', 'accounts.middleware.TokenExpirationMiddleware'])
+
+    def test_patch_urls_is_idempotent(self):
+        """
+        Test that patching a startproject urls.py includes the app's urls once and imports include.
+        """
+        patched = patch_urls(self.urls_source, ['accounts'])
+        self.assertEqual(patch_urls(patched, ['accounts']), patched)
+        self.assertEqual(patched.count("include('accounts.urls')"), 1)
+        self.assertIn('include', {alias.name for node in ast.parse(patched).body if isinstance(node, ast.ImportFrom) for alias in node.names})
+
+    def test_malformed_sources_are_rejected(self):
+        """
+        Test that sources without the expected structure raise ScaffoldError instead of being patched blindly.
+        """
+        without_middleware = self.settings_source.replace('MIDDLEWARE = [', 'OTHER_MIDDLEWARE = [')
+        single_line_apps = self.settings_source.replace('INSTALLED_APPS = [', "INSTALLED_APPS = ['x']\nOLD_APPS = [")
+        for source in (without_middleware, single_line_apps):
+            with self.assertRaises(ScaffoldError):
+                patch_settings(source)
+        with self.assertRaises(ScaffoldError):
+            patch_settings("INSTALLED_APPS = get_apps()\nMIDDLEWARE = []\n")
+        with self.assertRaises(ScaffoldError):
+            patch_urls('urlpatterns = get_patterns()\n', ['accounts'])
+        with self.assertRaises(ScaffoldError):
+            patch_urls("from django.urls import path\nurlpatterns = [path('', view)]\n", ['accounts'])
+
+    def test_list_values(self):
+        """
+        Test that list_values only accepts list literals.
+        """
+        self.assertEqual(list_values(ast.parse("X = ['a', 'b']").body[0].value), {'a', 'b'})
+        with self.assertRaises(ScaffoldError):
+            list_values(ast.parse('X = ("a",)').body[0].value)
+
+
+class TemplateManifestTestCase(TemporaryDirectoryTestCase):
+    """
+    Test case for TemplateManifest.sync.
+    """
+
+    def test_sync_writes_only_changed_files(self):
+        """
+        Test that a first sync writes every file, a second one none, and a modified file is restored alone.
+        """
+        manifest = TemplateManifest()
+        self.assertEqual(sorted(manifest.sync(self.directory)), sorted(APP_FILES))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, MANIFEST_FILE_NAME)))
+        self.assertEqual(manifest.sync(self.directory), [])
+
+        with open(os.path.join(self.directory, 'views.py'), 'a') as f:
+            f.write('# local edit\n')
+        self.assertEqual(manifest.sync(self.directory), ['views.py'])
+        self.assertEqual(self.read('views.py').encode(), manifest.files['views.py'][0])
+
+
+class CreateProjectsTestCase(TemporaryDirectoryTestCase):
+    """
+    Test case for the project generation of the CLI.
+    """
+
+    def test_rerun_changes_nothing(self):
+        """
+        Test that generating an existing project again leaves every file untouched.
+        """
+        cli.create_projects([{'name': 'demo', 'profile': 'development', 'settings': {}}])
+        before = self.snapshot('demo')
+        cli.create_projects([{'name': 'demo', 'profile': 'development', 'settings': {}}])
+        self.assertEqual(self.snapshot('demo'), before)
+        self.assertIn("'accounts',", self.read('demo', 'demo', 'settings.py'))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'demo', 'accounts', 'token_cache.py')))
+
+    def test_parallel_jobs(self):
+        """
+        Test that --jobs creates every project, in the order given.
+        """
+        projects = [{'name': name, 'profile': 'development', 'settings': {}} for name in ('first', 'second')]
+        timings = cli.create_projects(projects, jobs=2)
+        self.assertEqual([name for name, _ in timings], ['first', 'second'])
+        for name in ('first', 'second'):
+            self.assertTrue(os.path.exists(os.path.join(self.directory, name, 'accounts', 'models.py')))
+
+
+if __name__ == '__main__':
+    unittest.main()
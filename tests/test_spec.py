@@ -0,0 +1,88 @@
+"""
+Tests for batch specification files (signmeup.scaffold.load_spec) and per-project settings.
+"""
+import ast
+import json
+import os
+import tempfile
+import unittest
+
+from signmeup.scaffold import ScaffoldError, load_spec, patch_project_settings
+
+
+class LoadSpecTestCase(unittest.TestCase):
+    """
+    Test case for load_spec on JSON spec files.
+    """
+
+    def setUp(self):
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.directory = temporary_directory.name
+
+    def write_spec(self, spec):
+        path = os.path.join(self.directory, 'projects.json')
+        with open(path, 'w') as f:
+            json.dump(spec, f)
+        return path
+
+    def test_load_mapping(self):
+        """
+        Test that a 'projects' mapping is loaded with names, profiles and settings.
+        """
+        path = self.write_spec({'projects': [
+            {'name': 'tenant_a', 'profile': 'production', 'settings': {'ALLOWED_HOSTS': ['a.example.com']}},
+            'tenant_b',
+        ]})
+        self.assertEqual(load_spec(path), [
+            {'name': 'tenant_a', 'profile': 'production', 'settings': {'ALLOWED_HOSTS': ['a.example.com']}},
+            {'name': 'tenant_b', 'profile': None, 'settings': {}},
+        ])
+
+    def test_load_list(self):
+        """
+        Test that a plain list of project names is accepted.
+        """
+        self.assertEqual([project['name'] for project in load_spec(self.write_spec(['first', 'second']))], ['first', 'second'])
+
+    def test_invalid_specs(self):
+        """
+        Test that empty specs, invalid names, lower-case settings, unknown profiles and duplicates raise ScaffoldError.
+        """
+        invalid_specs = [
+            [],
+            {'projects': []},
+            ['not-an-identifier'],
+            [{'profile': 'production'}],
+            [{'name': 'tenant', 'settings': {'debug': True}}],
+            [{'name': 'tenant', 'profile': 'staging'}],
+            ['tenant', {'name': 'tenant'}],
+        ]
+        for spec in invalid_specs:
+            with self.subTest(spec=spec), self.assertRaises(ScaffoldError):
+                load_spec(self.write_spec(spec))
+
+
+class PatchProjectSettingsTestCase(unittest.TestCase):
+    """
+    Test case for patch_project_settings.
+    """
+
+    def test_block_is_replaced(self):
+        """
+        Test that the per-project block is written once and replaced by the values of a later run.
+        """
+        source = "DEBUG = True\n"
+        patched = patch_project_settings(source, {'DEBUG': False, 'ALLOWED_HOSTS': ['a.example.com']})
+        self.assertEqual(patch_project_settings(patched, {'DEBUG': False, 'ALLOWED_HOSTS': ['a.example.com']}), patched)
+
+        repatched = patch_project_settings(patched, {'ALLOWED_HOSTS': ['b.example.com']})
+        namespace = {}
+        exec(compile(repatched, 'settings.py', 'exec'), namespace)
+        self.assertIs(namespace['DEBUG'], True)
+        self.assertEqual(namespace['ALLOWED_HOSTS'], ['b.example.com'])
+        self.assertEqual(len([node for node in ast.parse(repatched).body if isinstance(node, ast.Assign)]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()